@@ -1,10 +1,10 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
-from flask_cors import CORS
-from .config import Config
+from .config import Config, DEV_CORS_ORIGINS
+from .replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 jwt = JWTManager()
 
 
@@ -16,22 +16,69 @@ def create_app(test_config=None):
     else:
         app.config.from_object(Config)
 
-    # Enable CORS
-    CORS(
-        app,
-        origins=["http://localhost:5173", "http://127.0.0.1:5173"],
-        supports_credentials=True,
-    )
+    # Take the client address from X-Forwarded-For, as set by that many proxies
+    proxies = app.config.get("TRUSTED_PROXIES", 0)
+    if proxies:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
+    # Enable CORS; not needed when the frontend is served from the same origin
+    origins = app.config.get("CORS_ORIGINS", DEV_CORS_ORIGINS)
+    if origins:
+        from flask_cors import CORS
+        CORS(app, origins=origins, supports_credentials=True)
+
+    from app import replicas
+    from app.metrics import InstrumentedQueuePool, instrument_engine
+
+    replicas.configure(app)
+
+    # Time pool checkouts; in-memory SQLite still gets its StaticPool
+    engine_options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    engine_options.setdefault("poolclass", InstrumentedQueuePool)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
 
     db.init_app(app)
     jwt.init_app(app)
 
+    with app.app_context():
+        engines = db.engines
+        app.extensions["pool_metrics"] = {
+            key or "default": instrument_engine(engine)
+            for key, engine in engines.items()
+        }
+
+    from app import instrumentation
+    instrumentation.init_app(app, engines.values())
+
+    from app import admission, broadcast, cache, hotkeys, idempotency, ledger, passwords, prefork, revocation, search_index, serializers
+    serializers.init_app(app)
+    replicas.init_app(app)
+    broadcast.init_app(app)
+    admission.init_app(app)
+    idempotency.init_app(app)
+    cache.init_app(app)
+    passwords.init_app(app)
+    revocation.init_app(app)
+    search_index.init_app(app)
+    hotkeys.init_app(app)
+    ledger.init_app(app)
+    prefork.init_app(app)
+
     from app.routes.auth import auth_bp
     from app.routes.sweets import sweet_bp
     from app.routes.inventory import inventory_bp
+    from app.routes.reports import reports_bp
+    from app.routes.monitoring import monitoring_bp, metrics_bp
 
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
     app.register_blueprint(sweet_bp, url_prefix="/api/sweets")
     app.register_blueprint(inventory_bp, url_prefix="/api/inventory")
+    app.register_blueprint(reports_bp, url_prefix="/api/inventory/reports")
+    app.register_blueprint(monitoring_bp, url_prefix="/api/monitoring")
+    app.register_blueprint(metrics_bp)
+
+    from app import commands
+    commands.init_app(app)
 
     return app
@@ -0,0 +1,186 @@
+"""Rate limiting and load shedding in front of login and purchases.
+
+A fleet of retrying clients can otherwise queue more requests than the
+connection pool can serve and take every endpoint down with them. Views
+wrapped in ``admit(name)`` pass two checks before they touch the database:
+
+* A token bucket per client. Each client (its JWT identity, or its remote
+  address on anonymous routes such as login) holds up to ``burst`` tokens,
+  refilled at ``rate`` per second. A request that finds the bucket empty
+  gets ``429`` with a ``Retry-After`` saying when the next token is due.
+  Behind a reverse proxy, set ``TRUSTED_PROXIES`` to the number of proxies
+  so the remote address comes from ``X-Forwarded-For``; otherwise every
+  login shares the proxy's bucket. Buckets live in a ``BucketStore``. ``MemoryBucketStore`` keeps the most
+  recently seen clients in process. Any object with the same ``take``
+  method, for example a Redis script, can be supplied as
+  ``RATE_LIMIT_STORE`` so that all workers share one budget per client.
+* A cap on how many requests of that name run at once. A request waits at
+  most ``ADMISSION_QUEUE_TIMEOUT`` seconds for a slot and otherwise gets
+  ``503`` with ``Retry-After: ADMISSION_RETRY_AFTER``. Under overload the
+  excess is turned away at once instead of queueing for the pool, so
+  admitted requests keep their normal latency.
+
+``RATE_LIMITS`` maps a name to ``(rate, burst)`` and ``CONCURRENCY_LIMITS``
+maps it to a slot count; a name missing from either is not limited by it.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+
+
+class BucketStore:
+    """Where token buckets are kept."""
+
+    def take(self, key, rate, burst, cost=1):
+        """Take ``cost`` tokens from ``key``'s bucket.
+
+        Returns 0 when they were available, otherwise the seconds until they
+        will be; nothing is taken in that case.
+        """
+        raise NotImplementedError
+
+
+class MemoryBucketStore(BucketStore):
+    """Thread-safe in-process buckets, keeping the ``maxsize`` most recent clients.
+
+    A client evicted for being idle comes back with a full bucket, which it
+    would have refilled to by then anyway.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class LoadShedder:
+    """At most ``limit`` concurrent requests; the rest are turned away."""
+
+    def __init__(self, limit, timeout=0.0):
+        self.limit = limit
+        self.timeout = timeout
+        self.shed = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.timeout:
+            admitted = self._slots.acquire(timeout=self.timeout)
+        else:
+            admitted = self._slots.acquire(blocking=False)
+        if not admitted:
+            with self._lock:
+                self.shed += 1
+        return admitted
+
+    def release(self):
+        self._slots.release()
+
+
+class AdmissionControl:
+    def __init__(self, store, rates=None, concurrency=None, queue_timeout=0.1, retry_after=1):
+        self.store = store
+        self.rates = dict(rates or {})
+        self.shedders = {
+            name: LoadShedder(limit, queue_timeout) for name, limit in (concurrency or {}).items()
+        }
+        self.retry_after = retry_after
+        self.limited = {name: 0 for name in self.rates}
+        self._lock = threading.Lock()
+
+    def check_rate(self, name, client):
+        """Seconds ``client`` must wait before calling ``name`` again, 0 if it may go now."""
+        if name not in self.rates:
+            return 0.0
+        rate, burst = self.rates[name]
+        wait = self.store.take(f"{name}:{client}", rate, burst)
+        if wait:
+            with self._lock:
+                self.limited[name] += 1
+        return wait
+
+    def stats(self):
+        return {
+            "rate_limited": dict(self.limited),
+            "shed": {name: shedder.shed for name, shedder in self.shedders.items()},
+        }
+
+
+def client_key():
+    """The JWT identity when the view requires one, otherwise the remote address."""
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        identity = None
+    return f"user:{identity}" if identity is not None else f"ip:{request.remote_addr}"
+
+
+def admit(name):
+    """Apply the rate and concurrency limits configured for ``name`` to a view.
+
+    Put it below ``jwt_required`` so clients are keyed by identity.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            control = current_app.extensions.get("admission")
+            if control is None:
+                return view(*args, **kwargs)
+
+            wait = control.check_rate(name, client_key())
+            if wait:
+                return jsonify(msg="Too many requests"), 429, {"Retry-After": str(math.ceil(wait))}
+
+            shedder = control.shedders.get(name)
+            if shedder is None:
+                return view(*args, **kwargs)
+            if not shedder.acquire():
+                return jsonify(msg="Server busy, try again shortly"), 503, \
+                    {"Retry-After": str(control.retry_after)}
+            try:
+                return view(*args, **kwargs)
+            finally:
+                shedder.release()
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    rates = app.config.get("RATE_LIMITS") or {}
+    concurrency = app.config.get("CONCURRENCY_LIMITS") or {}
+    if not app.config.get("ADMISSION_CONTROL_ENABLED", True) or not (rates or concurrency):
+        return
+    for name, (rate, burst) in rates.items():
+        if not rate > 0 or burst < 1:
+            raise ValueError(f"Rate limit {name!r} needs a rate above 0 and a burst of at least 1")
+    # A shared store instance can be supplied through the config
+    store = app.config.get("RATE_LIMIT_STORE") or MemoryBucketStore(
+        app.config.get("RATE_LIMIT_MAX_CLIENTS", 100000)
+    )
+    app.extensions["admission"] = AdmissionControl(
+        store,
+        rates,
+        concurrency,
+        queue_timeout=app.config.get("ADMISSION_QUEUE_TIMEOUT", 0.1),
+        retry_after=app.config.get("ADMISSION_RETRY_AFTER", 1),
+    )
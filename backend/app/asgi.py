@@ -0,0 +1,384 @@
+"""Optional ASGI serving mode.
+
+Under WSGI every in-flight request pins a worker thread, including the
+time spent waiting on a slow client or on the database. In ASGI mode the
+catalog reads, ``GET /api/sweets`` and ``GET /api/sweets/search``, run
+natively on the event loop against an async SQLAlchemy engine. One
+process can then keep thousands of catalog connections open while only
+``pool_size`` of them talk to the database at any moment. The native
+handlers reuse the Flask app's request parsing, JWT checks, catalog cache,
+ETags and before/after-request hooks, so responses match the WSGI routes
+byte for byte.
+
+With read replicas configured (see app/replicas.py) each replica gets its
+own async engine, and the native catalog reads are routed to them the same
+way the WSGI routes are.
+
+``GET /api/inventory/stream`` is native too, so open stock streams (see
+app/broadcast.py) wait on the event loop rather than each holding a
+thread, and a stream ends within one heartbeat of its client going away.
+
+Every other route is passed to the Flask app on a thread pool of
+``ASGI_WSGI_THREADS`` threads, with the same behaviour as under WSGI.
+
+The async engine needs ``greenlet`` and an async driver for the configured
+database (``aiosqlite``, ``aiomysql`` or ``asyncpg``); see
+``requirements-asgi.txt``. ``ASYNC_DATABASE_URL`` overrides the URL derived
+from ``SQLALCHEMY_DATABASE_URI``. Serve with e.g. ``uvicorn asgi:app``.
+"""
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import instrumentation, metrics
+from app.replicas import read_bind, read_is_sticky, replica_cache_ttl, route_reads
+from app.broadcast import EVENT_STREAM_MIMETYPE, KEEPALIVE, get_broadcaster, verify_stream_request
+from app.cache import get_catalog_cache
+from app.models import Sweet
+from app.routes.sweets import NDJSON_MIMETYPE, catalog_key, content_etag, etagged_json, wants_stream
+from app.serializers import encode_page, encode_rows
+from app.services.sweet_services import parse_fields, search_filters, split_page, sweets_query
+
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "mysql": "aiomysql", "postgresql": "asyncpg"}
+POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout", "pool_recycle",
+                "pool_pre_ping", "pool_use_lifo")
+
+
+def async_database_url(url):
+    """The async-driver equivalent of a sync SQLAlchemy URL."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        raise ValueError("ASGI mode needs a file or server database, not in-memory SQLite")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def create_async_engine_for(app, bind_key=None):
+    if bind_key is not None:
+        url = async_database_url(app.config["SQLALCHEMY_BINDS"][bind_key])
+    else:
+        url = app.config.get("ASYNC_DATABASE_URL") or async_database_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    options = {
+        key: value
+        for key, value in app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}).items()
+        if key in POOL_OPTIONS
+    }
+    return create_async_engine(url, **options)
+
+
+def _environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope."""
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "SERVER_NAME": scope["server"][0] if scope.get("server") else "localhost",
+        "SERVER_PORT": str(scope["server"][1]) if scope.get("server") else "80",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def _asgi_headers(headers):
+    return [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]
+
+
+class AsyncBody:
+    """A native handler's streamed response: async ``chunks`` sent as ``mimetype``."""
+
+    def __init__(self, chunks, mimetype, headers=None):
+        self.chunks = chunks
+        self.mimetype = mimetype
+        self.headers = headers
+
+
+class AsyncCatalogApp:
+    """ASGI application wrapping a Flask app created by ``create_app``."""
+
+    def __init__(self, flask_app, engine=None):
+        self.flask_app = flask_app
+        self.engine = engine or create_async_engine_for(flask_app)
+        router = flask_app.extensions.get("replicas")
+        self.replica_engines = {
+            key: create_async_engine_for(flask_app, key) for key in (router.bind_keys if router else ())
+        }
+        self.executor = ThreadPoolExecutor(
+            max_workers=flask_app.config.get("ASGI_WSGI_THREADS", 32),
+            thread_name_prefix="wsgi",
+        )
+        self.routes = {
+            "/api/sweets": self.get_sweets,
+            "/api/sweets/search": self.search_sweets,
+            "/api/inventory/stream": self.stock_stream,
+        }
+        # EventSource cannot send headers, so the stream also takes a stream token as ?jwt=
+        self.verifiers = {"/api/inventory/stream": verify_stream_request}
+        # Surface the async pool next to the sync one in /metrics and /api/monitoring/pool
+        flask_app.extensions["pool_metrics"]["async"] = metrics.instrument_engine(self.engine.sync_engine)
+        instrumentation.count_statements(self.engine.sync_engine)
+        for key, replica in self.replica_engines.items():
+            flask_app.extensions["pool_metrics"][f"async_{key}"] = metrics.instrument_engine(replica.sync_engine)
+            instrumentation.count_statements(replica.sync_engine)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope: {scope['type']}")
+        handler = self.routes.get(scope["path"])
+        if handler is not None and scope["method"] in ("GET", "HEAD"):
+            return await self._native(scope, receive, send, handler)
+        return await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                for replica in self.replica_engines.values():
+                    await replica.dispose()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _native(self, scope, receive, send, handler):
+        app = self.flask_app
+        with app.request_context(_environ(scope, io.BytesIO())):
+            stream = None
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    self.verifiers.get(scope["path"], verify_jwt_in_request)()
+                    rv = await handler()
+                if isinstance(rv, AsyncBody):
+                    stream, rv = rv.chunks, app.response_class(mimetype=rv.mimetype, headers=rv.headers)
+                response = app.make_response(rv)
+            except Exception as e:
+                try:
+                    response = app.make_response(app.handle_user_exception(e))
+                except Exception as unhandled:
+                    response = app.make_response(app.handle_exception(unhandled))
+            response = app.process_response(response)
+
+            if stream is None:
+                body = b"" if scope["method"] == "HEAD" else response.get_data()
+                await send({"type": "http.response.start", "status": response.status_code,
+                            "headers": _asgi_headers(response.headers.items())})
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            response.headers.pop("Content-Length", None)
+            await send({"type": "http.response.start", "status": response.status_code,
+                        "headers": _asgi_headers(response.headers.items())})
+            disconnected = asyncio.ensure_future(self._disconnected(receive))
+            try:
+                if scope["method"] != "HEAD":
+                    async for chunk in stream:
+                        if disconnected.done():
+                            return
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+            finally:
+                disconnected.cancel()
+                await stream.aclose()
+
+    async def _disconnected(self, receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def _wsgi(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+
+        def run():
+            result = self.flask_app(_environ(scope, io.BytesIO(bytes(body))), start_response)
+            try:
+                return b"".join(result)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+
+        data = await asyncio.get_running_loop().run_in_executor(self.executor, run)
+        await send({
+            "type": "http.response.start",
+            "status": started["status"],
+            "headers": _asgi_headers(started["headers"]),
+        })
+        await send({"type": "http.response.body", "body": data})
+
+    # Native routes; each mirrors its counterpart in app/routes/sweets.py
+
+    async def get_sweets(self):
+        route_reads()
+        try:
+            fields = parse_fields(request.args.get("fields"))
+        except ValueError as e:
+            return jsonify(msg=str(e)), 400
+
+        cursor = request.args.get("cursor")
+        limit = request.args.get("limit")
+        if wants_stream():
+            try:
+                cursor = int(cursor) if cursor is not None else None
+            except ValueError:
+                return jsonify(msg="cursor must be an integer"), 400
+            return AsyncBody(self._stream(sweets_query(fields, cursor=cursor), fields), NDJSON_MIMETYPE)
+
+        if cursor is None and limit is None:
+            return await self._cached_json(self._encoded(sweets_query(fields, versioned=True), fields))
+
+        max_limit = current_app.config.get("SWEETS_MAX_PAGE_SIZE", 1000)
+        try:
+            cursor = int(cursor) if cursor is not None else None
+            limit = int(limit) if limit is not None else current_app.config.get("SWEETS_PAGE_SIZE", 50)
+        except ValueError:
+            return jsonify(msg="cursor and limit must be integers"), 400
+        if not 1 <= limit <= max_limit:
+            return jsonify(msg=f"limit must be between 1 and {max_limit}"), 400
+
+        async def page():
+            rows = await self._fetch(sweets_query(fields, cursor=cursor, limit=limit + 1, versioned=True))
+            return encode_page(*split_page(rows, limit), fields=fields)
+
+        return await self._cached_json(page)
+
+    async def search_sweets(self):
+        route_reads()
+        name = request.args.get("search") or request.args.get("name")
+        try:
+            fields = parse_fields(request.args.get("fields"))
+            # The trigram index may reload itself from the database here
+            filters = await asyncio.to_thread(
+                search_filters, name, request.args.get("category"),
+                request.args.get("price_min"), request.args.get("price_max"),
+            )
+        except ValueError as e:
+            return jsonify(msg=str(e)), 400
+
+        if wants_stream():
+            return AsyncBody(self._stream(sweets_query(fields, filters), fields), NDJSON_MIMETYPE)
+        return await self._cached_json(self._encoded(sweets_query(fields, filters, versioned=True), fields))
+
+    async def stock_stream(self):
+        broadcaster = get_broadcaster()
+        seq, opening = broadcaster.open(request.headers.get("Last-Event-ID"))
+        return AsyncBody(
+            self._events(
+                broadcaster, seq, opening,
+                current_app.config.get("STREAM_HEARTBEAT_SECONDS", 15),
+                time.monotonic() + current_app.config.get("STREAM_MAX_SECONDS", 300),
+            ),
+            EVENT_STREAM_MIMETYPE,
+            {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def _events(self, broadcaster, seq, opening, heartbeat, deadline):
+        yield opening.encode()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            head = await broadcaster.wait_async(seq, min(heartbeat, remaining))
+            if head == seq:
+                yield KEEPALIVE.encode()
+                continue
+            seq, message = await broadcaster.message_async(seq, self._changed_sweets)
+            yield message.encode()
+
+    async def _changed_sweets(self, ids):
+        # Pushed rows must be current, so they always come from the primary
+        async with self.engine.connect() as conn:
+            return (await conn.execute(sweets_query(filters=[Sweet.id.in_(ids)], versioned=True))).all()
+
+    async def _fetch(self, query):
+        bind = read_bind()
+        if bind is not None:
+            try:
+                async with self.replica_engines[bind].connect() as conn:
+                    return (await conn.execute(query)).all()
+            except OperationalError:
+                current_app.logger.warning("Replica %s failed; reading from the primary", bind)
+                g.read_bind = None
+        async with self.engine.connect() as conn:
+            return (await conn.execute(query)).all()
+
+    def _encoded(self, query, fields):
+        async def build():
+            return encode_rows(await self._fetch(query), fields)
+        return build
+
+    async def _stream(self, query, fields):
+        dumps = current_app.json.dumps
+        batch_size = current_app.config.get("SWEETS_STREAM_BATCH_SIZE", 500)
+        # Like the WSGI route, stream from the primary: a replica failing mid-stream can't be retried
+        async with self.engine.connect() as conn:
+            result = await conn.stream(query.execution_options(yield_per=batch_size))
+            async for rows in result.partitions():
+                yield "".join(dumps(dict(zip(fields, row))) + "\n" for row in rows).encode()
+
+    async def _cached_json(self, build):
+        """Async twin of ``cached_json`` in app/routes/sweets.py."""
+        catalog = current_app.extensions["catalog_cache"]
+        key = catalog_key()
+        cache = get_catalog_cache()
+        if read_bind() is not None:
+            if cache is None:
+                body = await build()
+            else:
+                body = await cache.get_or_set_async(key, build, ttl=replica_cache_ttl())
+            return etagged_json(body, content_etag(body))
+
+        etag = catalog.etag(key)
+        if request.if_none_match.contains(etag):
+            return etagged_json(None, etag)
+        if cache is None or read_is_sticky():
+            body = await build()
+        else:
+            body = await cache.get_or_set_async(key, build)
+        return etagged_json(body, etag)
+
+
+def create_asgi_app(flask_app=None):
+    if flask_app is None:
+        from app import create_app
+        flask_app = create_app()
+    return AsyncCatalogApp(flask_app)
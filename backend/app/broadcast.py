@@ -0,0 +1,230 @@
+"""Server-sent stock and price updates.
+
+Dashboards used to re-fetch ``/api/sweets`` after every action. Instead
+they can hold ``GET /api/inventory/stream`` open. Every write path
+publishes the ids of the sweets it changed to the app's
+``StockBroadcaster``; publishing appends to a ring buffer of the last
+``STREAM_BUFFER_SIZE`` changes and wakes the listeners, and never touches
+the database. A listener that wakes up is sent one ``sweets`` event with
+the current rows of everything that changed since its last event, plus the
+ids of deleted sweets. Listeners that wake together share the same
+message, so a burst of writes costs one primary-key query however many
+dashboards are connected.
+
+Event ids are ``<epoch>-<sequence>``. A client that reconnects with a
+``Last-Event-ID`` this process issued, still inside the buffer, gets
+exactly the changes it missed. Any other client gets a ``reset`` event and
+should reload the catalog. A fresh connection starts with a ``ready``
+event, and loading the catalog after that event leaves no gap. Writes
+that touch an unknown set of rows, such as bulk imports and filtered bulk
+updates, publish a reset too.
+
+Like the in-process catalog cache, each worker only sees its own writes,
+so with several workers a dashboard still refetches after its own actions
+and from time to time.
+
+Under a synchronous WSGI server each open stream holds a worker thread for
+up to ``STREAM_MAX_SECONDS``. Size the thread pool for the expected number
+of dashboards, or serve the app as ASGI (``asgi.py``), where streams wait
+on the event loop instead.
+
+``EventSource`` cannot send headers, so a browser opens the stream with
+``?jwt=`` set to a stream token from ``POST /api/inventory/stream-token``
+rather than its access token, since query strings end up in access logs.
+A stream token lasts ``STREAM_TOKEN_SECONDS`` (default 30) and is refused
+by every other endpoint; an access token is only accepted in the header.
+"""
+import asyncio
+import secrets
+import threading
+from collections import deque
+from datetime import timedelta
+
+from flask import current_app, jsonify, request
+from flask_jwt_extended import (
+    create_access_token, get_jwt, get_jwt_request_location, verify_jwt_in_request,
+)
+from flask_jwt_extended.exceptions import NoAuthorizationError
+
+from app import jwt
+from app.serializers import SWEET_FIELDS, encode_rows
+
+EVENT_STREAM_MIMETYPE = "text/event-stream"
+KEEPALIVE = ": keepalive\n\n"
+RETRY_MS = 3000
+STREAM_ENDPOINT = "inventory.stock_stream"
+STREAM_CLAIM = "stream"
+
+
+def format_event(event, data, event_id=None):
+    """One server-sent event; ``data`` must be a single line."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+
+class StockBroadcaster:
+    def __init__(self, buffer_size=1000):
+        self.epoch = secrets.token_hex(4)
+        self._changes = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._async_waiters = set()
+        self._messages = {}
+        self._render_lock = threading.Lock()
+        self._async_render_lock = None
+
+    def publish(self, ids=(), deleted=(), reset=False):
+        with self._cond:
+            self._seq += 1
+            self._changes.append((self._seq, frozenset(ids), frozenset(deleted), reset))
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The listener's event loop has already closed
+                pass
+
+    def after_fork(self):
+        # Event ids from the parent must not be resumable against this history
+        self.epoch = secrets.token_hex(4)
+        self._cond = threading.Condition()
+        self._async_waiters = set()
+        self._render_lock = threading.Lock()
+        self._async_render_lock = None
+
+    def event_id(self, seq):
+        return f"{self.epoch}-{seq}"
+
+    def open(self, last_event_id=None):
+        """Where a new listener starts, and the first chunk to send it."""
+        with self._cond:
+            head = self._seq
+        opening = f"retry: {RETRY_MS}\n\n"
+        if last_event_id:
+            epoch, _, seq = last_event_id.partition("-")
+            if epoch == self.epoch and seq.isdigit() and int(seq) <= head:
+                return int(seq), opening
+            return head, opening + format_event("reset", "{}", self.event_id(head))
+        return head, opening + format_event("ready", "{}", self.event_id(head))
+
+    def wait(self, seq, timeout):
+        """Block until something is published after ``seq``; returns the newest sequence."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+            return self._seq
+
+    async def wait_async(self, seq, timeout):
+        """Like ``wait`` without blocking the event loop."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            if self._seq > seq:
+                return self._seq
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+        return self._seq
+
+    def pending(self, seq):
+        """Changes after ``seq`` as ``(head, ids, deleted)``.
+
+        ``ids`` and ``deleted`` are ``None`` when the listener must reset:
+        some of the changes have left the buffer, or one of them was a reset.
+        """
+        with self._cond:
+            head = self._seq
+            if head > seq and (not self._changes or self._changes[0][0] > seq + 1):
+                return head, None, None
+            ids, deleted = set(), set()
+            for change_seq, change_ids, change_deleted, reset in reversed(self._changes):
+                if change_seq <= seq:
+                    break
+                if reset:
+                    return head, None, None
+                ids |= change_ids
+                deleted |= change_deleted
+        return head, ids - deleted, deleted
+
+    def message(self, seq, fetch):
+        """The next message for a listener at ``seq`` and the sequence it moves to.
+
+        ``fetch(ids)`` returns the current ``(*SWEET_FIELDS, version)`` rows of ``ids``.
+        """
+        with self._render_lock:
+            head, ids, deleted = self.pending(seq)
+            message = self._messages.get((seq, head))
+            if message is None:
+                message = self._render(seq, head, ids, deleted, fetch(ids) if ids else [])
+        return head, message
+
+    async def message_async(self, seq, fetch):
+        """Like ``message`` for a coroutine ``fetch``."""
+        if self._async_render_lock is None:
+            self._async_render_lock = asyncio.Lock()
+        async with self._async_render_lock:
+            head, ids, deleted = self.pending(seq)
+            message = self._messages.get((seq, head))
+            if message is None:
+                message = self._render(seq, head, ids, deleted, await fetch(ids) if ids else [])
+        return head, message
+
+    def _render(self, seq, head, ids, deleted, rows):
+        if ids is None:
+            message = format_event("reset", "{}", self.event_id(head))
+        else:
+            # Sweets deleted after the change was published are gone from ``rows``
+            deleted = sorted(deleted | (ids - {row[0] for row in rows}))
+            data = '{"sweets":' + encode_rows(rows, SWEET_FIELDS) + ',"deleted":' + \
+                current_app.json.dumps(deleted) + "}"
+            message = format_event("sweets", data, self.event_id(head))
+        if len(self._messages) >= 64:
+            self._messages = {}
+        self._messages[(seq, head)] = message
+        return message
+
+
+def init_app(app):
+    app.extensions["stock_broadcaster"] = StockBroadcaster(app.config.get("STREAM_BUFFER_SIZE", 1000))
+
+
+def get_broadcaster():
+    return current_app.extensions["stock_broadcaster"]
+
+
+def publish_changes(ids=(), deleted=(), reset=False):
+    """Call after committing a write that changes stock, prices or which sweets exist."""
+    broadcaster = current_app.extensions.get("stock_broadcaster")
+    if broadcaster is not None:
+        broadcaster.publish(ids, deleted, reset)
+
+
+def create_stream_token(identity):
+    """A short-lived token that can only open the stock stream."""
+    return create_access_token(
+        identity=identity,
+        additional_claims={STREAM_CLAIM: True},
+        expires_delta=timedelta(seconds=current_app.config.get("STREAM_TOKEN_SECONDS", 30)),
+    )
+
+
+def verify_stream_request():
+    """``verify_jwt_in_request`` for the stream: the query string only takes stream tokens."""
+    verify_jwt_in_request(locations=["headers", "query_string"])
+    if get_jwt_request_location() == "query_string" and not get_jwt().get(STREAM_CLAIM):
+        raise NoAuthorizationError("Pass a stream token, not an access token, as ?jwt=")
+
+
+@jwt.token_verification_loader
+def _check_stream_token_scope(jwt_header, jwt_payload):
+    return not jwt_payload.get(STREAM_CLAIM) or request.endpoint == STREAM_ENDPOINT
+
+
+@jwt.token_verification_failed_loader
+def _stream_token_used_elsewhere(jwt_header, jwt_payload):
+    return jsonify(msg="Stream tokens only open the stock stream"), 401
@@ -0,0 +1,215 @@
+"""Read-through cache for catalog responses.
+
+Catalog reads vastly outnumber catalog writes, so serialized listing and
+search responses are cached under a key that embeds a catalog version. Every
+write bumps the version, which orphans all older entries at once instead of
+hunting down the keys a write could have affected.
+
+The storage is pluggable: ``LRUCache`` keeps everything in-process, and any
+object with the same ``get``/``set``/``delete``/``incr``/``clear`` methods
+(for example a thin wrapper around a Redis client) can be passed instead so
+all workers share entries and the version counter. With the in-process
+backend each worker only sees its own writes. Its entries and ETags are
+then also stamped with the current TTL window, so neither a cached body nor
+a ``304`` can outlast the TTL after another worker's write.
+"""
+import secrets
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from flask import current_app
+
+VERSION_KEY = "catalog:version"
+
+
+class CacheBackend:
+    """The subset of a Redis-style key/value API the catalog cache needs."""
+
+    # Distinguishes counters that restart from zero; persistent shared
+    # stores keep their counters and can leave it empty.
+    epoch = ""
+    # True when every worker sees the same version counter, so the version
+    # alone says whether a cached response is current.
+    shared = False
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key):
+        """Atomically add one to a counter and return the new value."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe in-process LRU with per-entry TTL.
+
+    Counters created with ``incr`` live outside the LRU so a burst of
+    entries can never evict them.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.epoch = secrets.token_hex(4)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._counters.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def after_fork(self):
+        # A forked copy counts versions on its own from here on
+        self.epoch = secrets.token_hex(4)
+        self._lock = threading.Lock()
+
+
+class CatalogCache:
+    def __init__(self, backend, ttl=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def version(self):
+        return self.backend.get(VERSION_KEY) or 0
+
+    def invalidate(self):
+        return self.backend.incr(VERSION_KEY)
+
+    def etag(self, key):
+        """Strong ETag for ``key`` at the current catalog version.
+
+        Computed from the version counter (and, for a per-process backend,
+        the TTL window), so answering a matching ``If-None-Match`` never
+        needs the database.
+        """
+        checksum = zlib.crc32(key.encode()) & 0xFFFFFFFF
+        return f"{self.backend.epoch}-{self._stamp()}-{checksum:08x}"
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value for ``key``, calling ``loader`` on a miss.
+
+        ``ttl`` overrides the cache's TTL for a value loaded now.
+        """
+        versioned_key, value = self._lookup(key)
+        if value is None:
+            value = loader()
+            self.backend.set(versioned_key, value, self.ttl if ttl is None else ttl)
+        return value
+
+    async def get_or_set_async(self, key, loader, ttl=None):
+        """Like ``get_or_set`` for a coroutine ``loader``."""
+        versioned_key, value = self._lookup(key)
+        if value is None:
+            value = await loader()
+            self.backend.set(versioned_key, value, self.ttl if ttl is None else ttl)
+        return value
+
+    def _stamp(self):
+        version = self.version()
+        if not self.ttl or getattr(self.backend, "shared", False):
+            return str(version)
+        # Other workers' writes don't reach this counter; expire with the TTL instead
+        return f"{version}.{int(time.time() // self.ttl):x}"
+
+    def _lookup(self, key):
+        versioned_key = f"catalog:{self._stamp()}:{key}"
+        value = self.backend.get(versioned_key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return versioned_key, value
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        after_fork = getattr(self.backend, "after_fork", None)
+        if after_fork is not None:
+            after_fork()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "version": self.version(),
+        }
+
+
+def init_app(app):
+    # A shared backend instance can be supplied through the config
+    backend = app.config.get("CATALOG_CACHE_BACKEND")
+    if backend is None:
+        backend = LRUCache(
+            maxsize=app.config.get("CATALOG_CACHE_SIZE", 1024),
+            ttl=app.config.get("CATALOG_CACHE_TTL", 30),
+        )
+    app.extensions["catalog_cache"] = CatalogCache(
+        backend, ttl=app.config.get("CATALOG_CACHE_TTL", 30)
+    )
+
+
+def get_catalog_cache():
+    """The catalog cache for the current app, or ``None`` when disabled."""
+    if not current_app.config.get("CATALOG_CACHE_ENABLED", True):
+        return None
+    return current_app.extensions.get("catalog_cache")
+
+
+def invalidate_catalog():
+    """Call after committing any write that changes what the catalog shows."""
+    cache = current_app.extensions.get("catalog_cache")
+    if cache is not None:
+        cache.invalidate()
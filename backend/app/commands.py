@@ -0,0 +1,74 @@
+import sys
+
+import click
+
+from app.services.bulk_services import DECODE_ERRORS, IMPORT_FORMATS, import_sweets, read_csv, read_ndjson
+
+
+@click.command("import-sweets")
+@click.argument("source", type=click.File("r", encoding="utf-8", errors=DECODE_ERRORS))
+@click.option("--format", "fmt", type=click.Choice(IMPORT_FORMATS),
+              help="Input format; guessed from the file extension when omitted.")
+@click.option("--batch-size", default=None, type=click.IntRange(min=1),
+              help="Rows per INSERT batch and commit.")
+def import_sweets_command(source, fmt, batch_size):
+    """Load sweets from a CSV or NDJSON file ("-" reads stdin)."""
+    from flask import current_app
+
+    if fmt is None:
+        fmt = "csv" if source.name.endswith(".csv") else "ndjson"
+    reader = read_csv if fmt == "csv" else read_ndjson
+    batch_size = batch_size or current_app.config.get("BULK_BATCH_SIZE", 1000)
+
+    report = import_sweets(reader(source), batch_size=batch_size)
+    for error in report["errors"]:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(
+        f"Inserted {report['inserted']} sweets ({report['failed']} rejected) "
+        f"in {report['seconds']}s, {report['rows_per_sec']} rows/sec"
+    )
+    if report["failed"] and not report["inserted"]:
+        sys.exit(1)
+
+
+@click.command("release-reservations")
+def release_reservations_command():
+    """Return all hot-key quota to stock. Only run while no worker is serving."""
+    from sqlalchemy import update
+    from app import db
+    from app.cache import invalidate_catalog
+    from app.models import Sweet
+
+    result = db.session.execute(
+        update(Sweet).where(Sweet.reserved != 0).values(reserved=0)
+    )
+    db.session.commit()
+    invalidate_catalog()
+    click.echo(f"Released reservations on {result.rowcount} sweets")
+
+
+@click.command("compact-ledger")
+@click.option("--days", default=None, type=click.IntRange(min=0),
+              help="Keep this many days of individual movements.")
+def compact_ledger_command(days):
+    """Roll old inventory movements up into daily totals."""
+    from app.ledger import get_ledger
+
+    ledger = get_ledger()
+    ledger.flush()
+    click.echo(f"Compacted {ledger.compact(days)} movements")
+
+
+@click.command("purge-idempotency-keys")
+def purge_idempotency_keys_command():
+    """Delete persisted Idempotency-Key responses older than IDEMPOTENCY_TTL."""
+    from app.idempotency import get_idempotency_store
+
+    click.echo(f"Purged {get_idempotency_store().purge()} idempotency keys")
+
+
+def init_app(app):
+    app.cli.add_command(import_sweets_command)
+    app.cli.add_command(release_reservations_command)
+    app.cli.add_command(compact_ledger_command)
+    app.cli.add_command(purge_idempotency_keys_command)
@@ -1,6 +1,98 @@
 import os
 
+DEV_CORS_ORIGINS = ["http://localhost:5173", "http://127.0.0.1:5173"]
+
+
+def _engine_options():
+    """SQLAlchemy engine/pool settings from DB_POOL_* environment variables"""
+    options = {
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+        # Recycle before MySQL's wait_timeout can drop idle connections
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    }
+    for env, key, cast in (
+        ("DB_POOL_SIZE", "pool_size", int),
+        ("DB_MAX_OVERFLOW", "max_overflow", int),
+        ("DB_POOL_TIMEOUT", "pool_timeout", float),
+        ("DB_POOL_USE_LIFO", "pool_use_lifo", lambda v: v.lower() == "true"),
+    ):
+        if os.getenv(env):
+            options[key] = cast(os.getenv(env))
+    return options
+
+
+def _pool_capacity():
+    """Connections the pool can hand out at once (SQLAlchemy defaults to 5 + 10 overflow)"""
+    return int(os.getenv("DB_POOL_SIZE", "5")) + int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "mysql://root:@localhost/sweetshop")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options()
+    # Comma-separated read replicas for catalog and search reads; see app/replicas.py
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+    REPLICA_CACHE_TTL = int(os.getenv("REPLICA_CACHE_TTL", "5"))
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "super-secret")
+    # Comma-separated; set it empty when the frontend is served from the API's origin
+    CORS_ORIGINS = [origin for origin in os.getenv("CORS_ORIGINS", ",".join(DEV_CORS_ORIGINS)).split(",") if origin]
+    CHECKOUT_MAX_LINES = int(os.getenv("CHECKOUT_MAX_LINES", "100"))
+    RESTOCK_MAX_LINES = int(os.getenv("RESTOCK_MAX_LINES", "1000"))
+    SWEETS_PAGE_SIZE = int(os.getenv("SWEETS_PAGE_SIZE", "50"))
+    SWEETS_MAX_PAGE_SIZE = int(os.getenv("SWEETS_MAX_PAGE_SIZE", "1000"))
+    SWEETS_STREAM_BATCH_SIZE = int(os.getenv("SWEETS_STREAM_BATCH_SIZE", "500"))
+    SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").lower() == "true"
+    SEARCH_INDEX_REFRESH_SECONDS = int(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "60"))
+    SEARCH_INDEX_MAX_IDS = int(os.getenv("SEARCH_INDEX_MAX_IDS", "1000"))
+    CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "true").lower() == "true"
+    CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "30"))
+    CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "1024"))
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+    # Opt-in process pool for hashing; 0 hashes inline in the request thread
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0"))
+    JWT_REVOCATION_MAXSIZE = int(os.getenv("JWT_REVOCATION_MAXSIZE", "100000"))
+    JWT_REVOCATION_PERSIST = os.getenv("JWT_REVOCATION_PERSIST", "false").lower() == "true"
+    JWT_REVOCATION_SYNC_SECONDS = int(os.getenv("JWT_REVOCATION_SYNC_SECONDS", "30"))
+    JWT_REVOCATION_SYNC_OVERLAP = int(os.getenv("JWT_REVOCATION_SYNC_OVERLAP", "60"))
+    BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+    HOT_SWEET_IDS = [int(i) for i in os.getenv("HOT_SWEET_IDS", "").split(",") if i.strip()]
+    HOT_KEY_QUOTA = int(os.getenv("HOT_KEY_QUOTA", "100"))
+    HOT_KEY_SHARDS = int(os.getenv("HOT_KEY_SHARDS", "8"))
+    HOT_KEY_FLUSH_INTERVAL = float(os.getenv("HOT_KEY_FLUSH_INTERVAL", "1.0"))
+    LEDGER_BATCH_SIZE = int(os.getenv("LEDGER_BATCH_SIZE", "500"))
+    LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "0.5"))
+    LEDGER_MAX_BUFFER = int(os.getenv("LEDGER_MAX_BUFFER", "100000"))
+    LEDGER_RETENTION_DAYS = int(os.getenv("LEDGER_RETENTION_DAYS", "30"))
+    LEDGER_COMPACT_INTERVAL = int(os.getenv("LEDGER_COMPACT_INTERVAL", "86400"))
+    LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+    JSON_USE_ORJSON = os.getenv("JSON_USE_ORJSON", "true").lower() == "true"
+    SWEET_FRAGMENT_CACHE_SIZE = int(os.getenv("SWEET_FRAGMENT_CACHE_SIZE", "100000"))
+    STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", "1000"))
+    STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+    STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "300"))
+    STREAM_TOKEN_SECONDS = int(os.getenv("STREAM_TOKEN_SECONDS", "30"))
+
+    # Bearer token a Prometheus scraper can use for /metrics and /api/monitoring; admins always can
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted
+    TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
+    ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+    # (tokens per second, burst) per client
+    RATE_LIMITS = {
+        "login": (float(os.getenv("LOGIN_RATE", "0.2")), int(os.getenv("LOGIN_BURST", "10"))),
+        "purchase": (float(os.getenv("PURCHASE_RATE", "5")), int(os.getenv("PURCHASE_BURST", "20"))),
+    }
+    CONCURRENCY_LIMITS = {
+        "login": int(os.getenv("LOGIN_MAX_CONCURRENT", "16")),
+        "purchase": int(os.getenv("PURCHASE_MAX_CONCURRENT", str(_pool_capacity()))),
+    }
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "0.1"))
+    ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+    IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+    IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+    IDEMPOTENCY_PERSIST = os.getenv("IDEMPOTENCY_PERSIST", "false").lower() == "true"
+    # Age at which an unfinished persisted claim is presumed dead; well above the slowest request
+    IDEMPOTENCY_CLAIM_TIMEOUT = float(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT", "300"))
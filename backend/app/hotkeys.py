@@ -0,0 +1,266 @@
+"""Write-behind purchasing for a few very hot sweets.
+
+During a promotion one sweet can take thousands of purchases a second, and
+every direct purchase contends on the same row with its own commit. For
+sweets listed in ``HOT_SWEET_IDS`` each worker instead reserves a block of
+``HOT_KEY_QUOTA`` units up front with one conditional UPDATE on
+``Sweet.reserved``. It then sells from that block in memory. Sales are
+counted in per-thread shards so buyers rarely share a lock, and every
+``HOT_KEY_FLUSH_INTERVAL`` seconds the totals are written back in one
+transaction: ``quantity`` and ``reserved`` both drop by the units sold.
+Sales are priced as of the last reservation, so a price change reaches
+hot sales with the next quota block.
+
+A worker can only sell units it has reserved, and reserving only succeeds
+while ``quantity - reserved`` covers the block, so stock is never oversold
+across workers. The catalog shows ``quantity`` lagging by at most one
+flush interval. ``release`` flushes and returns any unsold quota; it runs at
+interpreter exit, and ``flask release-reservations`` clears reservations
+left behind by a worker that died.
+
+Edits to ``quantity`` never go below ``reserved``: a PUT is refused and a
+bulk update is clamped. If a hot sweet is deleted while a worker still
+holds quota, the next flush finds no row, logs the units sold since the
+last flush (they stay in the stock ledger) and drops the quota, so later
+purchases fail with ``SweetNotFound``.
+"""
+import atexit
+import threading
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from app import db
+from app.broadcast import publish_changes
+from app.cache import invalidate_catalog
+from app.models import Sweet
+from app.services.inventory_services import SweetNotFound, OutOfStock
+
+
+class _Shard:
+    __slots__ = ("lock", "remaining", "sold")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining = 0
+        self.sold = 0
+
+
+class HotKeyAllocator:
+    def __init__(self, app, sweet_ids, quota=100, shards=8, flush_interval=1.0):
+        self.app = app
+        self.quota = quota
+        self.flush_interval = flush_interval
+        self._reset(sweet_ids, shards)
+
+    def _reset(self, sweet_ids, shards):
+        self._shards = {sweet_id: [_Shard() for _ in range(shards)] for sweet_id in sweet_ids}
+        self._allocate_locks = {sweet_id: threading.Lock() for sweet_id in sweet_ids}
+        # (price, category) read with the last reservation of each sweet
+        self._catalog = {}
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def after_fork(self):
+        """Start a forked child with no quota.
+
+        Units the parent reserved stay the parent's to sell or release;
+        a child keeping a copy would sell them twice.
+        """
+        shards = len(next(iter(self._shards.values())))
+        self._reset(list(self._shards), shards)
+
+    def is_hot(self, sweet_id):
+        return sweet_id in self._shards
+
+    def purchase(self, sweet_id, quantity=1):
+        """Sell ``quantity`` units from this process's quota.
+
+        Returns the ``(price, category)`` to record the sale at. Raises
+        ``OutOfStock`` once no more quota can be reserved and
+        ``SweetNotFound`` for an unknown sweet, like the direct path.
+        """
+        self._ensure_flusher()
+        shards = self._shards[sweet_id]
+        home = threading.get_ident() % len(shards)
+        order = shards[home:] + shards[:home]
+
+        for shard in order:
+            if self._take(shard, quantity):
+                return self._catalog[sweet_id]
+
+        # Only one thread per sweet goes to the database for more quota
+        with self._allocate_locks[sweet_id]:
+            # Pool leftovers scattered across shards before asking for more
+            home_shard = order[0]
+            for shard in order[1:]:
+                with shard.lock:
+                    leftover, shard.remaining = shard.remaining, 0
+                with home_shard.lock:
+                    home_shard.remaining += leftover
+            if self._take(home_shard, quantity):
+                return self._catalog[sweet_id]
+
+            granted = self._reserve(sweet_id, quantity)
+            with home_shard.lock:
+                home_shard.remaining += granted - quantity
+                home_shard.sold += quantity
+            return self._catalog[sweet_id]
+
+    def _take(self, shard, quantity):
+        with shard.lock:
+            if shard.remaining < quantity:
+                return False
+            shard.remaining -= quantity
+            shard.sold += quantity
+            return True
+
+    def _reserve(self, sweet_id, quantity):
+        for amount in dict.fromkeys((max(self.quota, quantity), quantity)):
+            result = db.session.execute(
+                update(Sweet)
+                .where(Sweet.id == sweet_id, Sweet.quantity - Sweet.reserved >= amount)
+                .values(reserved=Sweet.reserved + amount)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                self._catalog[sweet_id] = tuple(db.session.execute(
+                    select(Sweet.price, Sweet.category).where(Sweet.id == sweet_id)
+                ).one())
+                db.session.commit()
+                return amount
+            db.session.rollback()
+
+        if db.session.get(Sweet, sweet_id) is None:
+            raise SweetNotFound(sweet_id)
+        raise OutOfStock(sweet_id)
+
+    def flush(self):
+        """Write units sold since the last flush back to the database.
+
+        Returns the number of units written.
+        """
+        with self._flush_lock:
+            sold = {}
+            for sweet_id, shards in self._shards.items():
+                total = 0
+                for shard in shards:
+                    with shard.lock:
+                        total += shard.sold
+                        shard.sold = 0
+                if total:
+                    sold[sweet_id] = total
+            if not sold:
+                return 0
+
+            try:
+                missing = self._apply(sold, release={})
+            except Exception:
+                # Put the counts back so the next flush retries them
+                for sweet_id, total in sold.items():
+                    shard = self._shards[sweet_id][0]
+                    with shard.lock:
+                        shard.sold += total
+                raise
+            for sweet_id in missing:
+                self.app.logger.error(
+                    "Hot sweet %s was deleted; %s units sold since the last flush "
+                    "were not written back", sweet_id, sold[sweet_id],
+                )
+                self._forget_quota(sweet_id)
+            return sum(units for sweet_id, units in sold.items() if sweet_id not in missing)
+
+    def _forget_quota(self, sweet_id):
+        with self._allocate_locks[sweet_id]:
+            for shard in self._shards[sweet_id]:
+                with shard.lock:
+                    shard.remaining = 0
+
+    def release(self):
+        """Flush, then hand unsold quota back to the shared stock."""
+        self.flush()
+        with self._flush_lock:
+            unsold = {}
+            for sweet_id, shards in self._shards.items():
+                with self._allocate_locks[sweet_id]:
+                    total = 0
+                    for shard in shards:
+                        with shard.lock:
+                            total += shard.remaining
+                            shard.remaining = 0
+                    if total:
+                        unsold[sweet_id] = total
+            if unsold:
+                self._apply({}, release=unsold)
+
+    def _apply(self, sold, release):
+        """Write sales and releases in one transaction; returns ids with no row left."""
+        missing = []
+        for sweet_id in set(sold) | set(release):
+            units = sold.get(sweet_id, 0)
+            result = db.session.execute(
+                update(Sweet)
+                .where(Sweet.id == sweet_id)
+                .values(
+                    quantity=Sweet.quantity - units,
+                    reserved=Sweet.reserved - units - release.get(sweet_id, 0),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 0:
+                missing.append(sweet_id)
+        db.session.commit()
+        changed = [sweet_id for sweet_id in sold if sweet_id not in missing]
+        if changed:
+            invalidate_catalog()
+            publish_changes(changed)
+        return missing
+
+    def _ensure_flusher(self):
+        if self._thread is not None or not self.flush_interval:
+            return
+        with self._flush_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="hot-key-flusher", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception("Hot-key flush failed")
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 2)
+        with self.app.app_context():
+            try:
+                self.release()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception("Releasing hot-key quota failed")
+
+
+def init_app(app):
+    sweet_ids = app.config.get("HOT_SWEET_IDS") or ()
+    if not sweet_ids:
+        return
+    app.extensions["hot_keys"] = HotKeyAllocator(
+        app,
+        sweet_ids,
+        quota=app.config.get("HOT_KEY_QUOTA", 100),
+        shards=app.config.get("HOT_KEY_SHARDS", 8),
+        flush_interval=app.config.get("HOT_KEY_FLUSH_INTERVAL", 1.0),
+    )
+
+
+def get_hot_keys():
+    return current_app.extensions.get("hot_keys")
@@ -0,0 +1,259 @@
+"""``Idempotency-Key`` support for purchase and checkout.
+
+Clients that retry a purchase after a timeout cannot tell whether the
+first attempt went through. When a request carries an ``Idempotency-Key``
+header, its response is stored under that key, scoped to the caller and
+the endpoint. A retry with the same key gets the stored response back
+without running the view again, so it never touches ``Sweet``. A duplicate
+that arrives while the first request is still running waits up to
+``IDEMPOTENCY_WAIT_SECONDS`` for that request to finish and then gets its
+response; past that it gets ``409``. Reusing a key with a different body
+gets ``422``.
+
+Responses are kept for ``IDEMPOTENCY_TTL`` seconds in an in-process LRU of
+``IDEMPOTENCY_CACHE_SIZE`` entries. Server errors and admission rejections
+are not stored, so those retries run again. With ``IDEMPOTENCY_PERSIST``
+each key is first claimed by inserting an ``IdempotencyKey`` row, and the
+row later receives the response. Workers then see each other's keys, and
+``flask purge-idempotency-keys`` deletes expired rows. A claim whose
+worker died before finishing is taken over once it is
+``IDEMPOTENCY_CLAIM_TIMEOUT`` seconds old. Keep that well above the
+slowest request, because a live request's claim would be taken over too.
+Each claim carries a random owner token, and only the holder of the token
+can store the response or give the claim up. A request that finishes
+after its claim was taken over keeps its outcome out of the store and
+logs it.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.admission import client_key
+from app.cache import LRUCache
+from app.models import IdempotencyKey
+
+StoredResponse = namedtuple("StoredResponse", "fingerprint status body mimetype")
+
+
+class KeyInUse(Exception):
+    pass
+
+
+class IdempotencyStore:
+    def __init__(self, maxsize=10000, ttl=86400, wait=10.0, persist=False, claim_timeout=300):
+        self.ttl = ttl
+        self.wait = wait
+        self.persist = persist
+        self.claim_timeout = claim_timeout
+        self.replays = 0
+        self._responses = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = {}
+        # Owner tokens of the persisted claims this process holds
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key, fingerprint):
+        """Claim ``key``, or wait for the request that holds it.
+
+        Returns the ``StoredResponse`` of a finished request with this key,
+        or ``None`` when the caller now holds the key and must call
+        ``finish`` or ``abandon``. Raises ``KeyInUse`` if the holder does not
+        finish within ``wait`` seconds.
+        """
+        deadline = time.monotonic() + self.wait
+        while True:
+            stored = self._lookup(key)
+            if stored is not None:
+                with self._lock:
+                    self.replays += 1
+                return stored
+
+            with self._lock:
+                event = self._inflight.get(key)
+                owner = event is None
+                if owner:
+                    event = self._inflight[key] = threading.Event()
+            if owner:
+                if not self.persist:
+                    return None
+                token = self._claim(key, fingerprint)
+                if token is not None:
+                    with self._lock:
+                        self._owners[key] = token
+                    return None
+                # Another worker holds it; poll the table
+                self._release(key)
+                event = None
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise KeyInUse(key)
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(0.05, remaining))
+
+    def finish(self, key, stored):
+        """Store the response for ``key``; returns False if the claim was lost meanwhile."""
+        try:
+            if self.persist:
+                result = db.session.execute(
+                    update(IdempotencyKey)
+                    .where(*self._held(key))
+                    .values(status=stored.status, body=stored.body, mimetype=stored.mimetype)
+                )
+                db.session.commit()
+                if result.rowcount != 1:
+                    current_app.logger.warning(
+                        "Idempotency claim was taken over before the request finished; "
+                        "its %s response was not stored", stored.status,
+                    )
+                    return False
+            self._responses.set(key, stored)
+            return True
+        finally:
+            self._release(key)
+
+    def abandon(self, key):
+        """Give ``key`` up without a response, so the next attempt runs the request."""
+        try:
+            if self.persist:
+                db.session.rollback()
+                db.session.execute(delete(IdempotencyKey).where(*self._held(key)))
+                db.session.commit()
+        finally:
+            self._release(key)
+
+    def _held(self, key):
+        """WHERE clauses matching ``key``'s row only while this process's claim holds it."""
+        with self._lock:
+            token = self._owners.get(key)
+        return (IdempotencyKey.key == _row_key(key), IdempotencyKey.owner == token,
+                IdempotencyKey.status.is_(None))
+
+    def purge(self):
+        """Delete persisted keys older than the TTL; returns how many."""
+        result = db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.created_at < _utcnow() - timedelta(seconds=self.ttl))
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def _lookup(self, key):
+        stored = self._responses.get(key)
+        if stored is None and self.persist:
+            row = db.session.get(IdempotencyKey, _row_key(key))
+            if row is not None and row.status is not None and not self._expired(row):
+                stored = StoredResponse(row.fingerprint, row.status, row.body, row.mimetype)
+                self._responses.set(key, stored)
+            # Don't hold a transaction open while waiting on another worker
+            db.session.rollback()
+        return stored
+
+    def _claim(self, key, fingerprint):
+        """Insert the claim row; returns its owner token, or ``None`` if another holds it."""
+        token = secrets.token_hex(16)
+        for _ in range(2):
+            try:
+                db.session.add(IdempotencyKey(key=_row_key(key), fingerprint=fingerprint,
+                                              owner=token, created_at=_utcnow()))
+                db.session.commit()
+                return token
+            except IntegrityError:
+                db.session.rollback()
+            # Clear the row if it expired or its worker died mid-request, then retry once
+            now = _utcnow()
+            db.session.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.key == _row_key(key),
+                    (IdempotencyKey.created_at < now - timedelta(seconds=self.ttl))
+                    | (IdempotencyKey.status.is_(None)
+                       & (IdempotencyKey.created_at < now - timedelta(seconds=self.claim_timeout))),
+                )
+            )
+            db.session.commit()
+        return None
+
+    def _expired(self, row):
+        return row.created_at < _utcnow() - timedelta(seconds=self.ttl)
+
+    def _release(self, key):
+        with self._lock:
+            self._owners.pop(key, None)
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+def _row_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def idempotent(view):
+    """Replay the stored response for a repeated ``Idempotency-Key``.
+
+    Put it below ``jwt_required`` and above ``admit`` so keys are scoped to
+    the user and replays skip the rate limiter.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        idempotency_key = request.headers.get("Idempotency-Key")
+        store = current_app.extensions.get("idempotency")
+        if idempotency_key is None or store is None:
+            return view(*args, **kwargs)
+        if not 0 < len(idempotency_key) <= 255:
+            return jsonify(msg="Idempotency-Key must be 1 to 255 characters"), 400
+
+        key = f"{client_key()} {request.method} {request.path} {idempotency_key}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        try:
+            stored = store.begin(key, fingerprint)
+        except KeyInUse:
+            return jsonify(msg="A request with this Idempotency-Key is still in progress"), 409
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return jsonify(msg="Idempotency-Key was already used with a different request"), 422
+            response = current_app.response_class(stored.body, status=stored.status, mimetype=stored.mimetype)
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            store.abandon(key)
+            raise
+        # Errors and rejections are worth retrying for real
+        if response.status_code >= 500 or response.status_code == 429:
+            store.abandon(key)
+        else:
+            store.finish(key, StoredResponse(fingerprint, response.status_code,
+                                             response.get_data(as_text=True), response.mimetype))
+        return response
+    return wrapper
+
+
+def init_app(app):
+    app.extensions["idempotency"] = IdempotencyStore(
+        maxsize=app.config.get("IDEMPOTENCY_CACHE_SIZE", 10000),
+        ttl=app.config.get("IDEMPOTENCY_TTL", 86400),
+        wait=app.config.get("IDEMPOTENCY_WAIT_SECONDS", 10),
+        persist=app.config.get("IDEMPOTENCY_PERSIST", False),
+        claim_timeout=app.config.get("IDEMPOTENCY_CLAIM_TIMEOUT", 300),
+    )
+
+
+def get_idempotency_store():
+    return current_app.extensions["idempotency"]
@@ -0,0 +1,103 @@
+"""Per-request cost accounting.
+
+For every request this records wall-clock latency, the number of SQL
+statements executed and the time spent in them (via SQLAlchemy cursor
+events), keyed by endpoint. The figures go back to the client in a
+``Server-Timing`` header and accumulate for ``/metrics``. Requests that
+issue more than ``QUERY_COUNT_WARNING`` statements are logged, which is how
+N+1 query patterns usually show up first.
+"""
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from app.metrics import Histogram
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency_seconds = Histogram()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.responses = {}
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, method, status, elapsed, statements, db_seconds):
+        key = (endpoint, method)
+        with self._lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = EndpointStats()
+            stats.statements += statements
+            stats.db_seconds += db_seconds
+            stats.responses[status] = stats.responses.get(status, 0) + 1
+        stats.latency_seconds.observe(elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.endpoints)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if not started or not has_request_context():
+        return
+    elapsed = time.perf_counter() - started.pop()
+    g.sql_statements = g.get("sql_statements", 0) + 1
+    g.sql_seconds = g.get("sql_seconds", 0.0) + elapsed
+
+
+def count_statements(engine):
+    """Charge ``engine``'s statements to the request that runs them."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def init_app(app, engines):
+    metrics = RequestMetrics()
+    app.extensions["request_metrics"] = metrics
+    for engine in engines:
+        count_statements(engine)
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        statements = g.get("sql_statements", 0)
+        db_seconds = g.get("sql_seconds", 0.0)
+        endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+
+        metrics.record(endpoint, request.method, response.status_code,
+                       elapsed, statements, db_seconds)
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={db_seconds * 1000:.2f};desc="{statements} queries", '
+            f"total;dur={elapsed * 1000:.2f}",
+        )
+
+        threshold = app.config.get("QUERY_COUNT_WARNING", 20)
+        if threshold and statements > threshold:
+            app.logger.warning(
+                "%s %s ran %d SQL statements", request.method, endpoint, statements
+            )
+        return response
@@ -0,0 +1,270 @@
+"""Append-only inventory ledger written off the request path.
+
+Every purchase and restock is recorded as an ``InventoryMovement`` (sweet,
+user, kind, signed delta, unit price, time). Recording only appends to an in-memory
+buffer; a background writer inserts the buffer in one executemany batch
+whenever ``LEDGER_BATCH_SIZE`` rows are waiting or ``LEDGER_FLUSH_INTERVAL``
+seconds have passed, whichever comes first. With an interval of 0, as in
+tests, each movement is written as soon as it is recorded.
+
+The buffer lives in process memory, so a hard crash loses at most one
+interval of movements; a clean shutdown flushes it. If the database is
+unavailable, new rows stay buffered up to ``LEDGER_MAX_BUFFER``; past that
+the oldest are dropped, counted in ``dropped`` and logged. A batch that
+failed to write is held aside and retried first, so it never pushes newer
+rows out of the buffer.
+
+Each batch also updates the running sales totals behind the reports in the
+same transaction (see ``app/services/analytics_services.py``), so reports
+lag purchases by at most one flush.
+
+Movements older than ``LEDGER_RETENTION_DAYS`` are rolled up into
+``InventoryDailyTotal`` rows by ``compact``. The writer does this every
+``LEDGER_COMPACT_INTERVAL`` seconds, and ``flask compact-ledger`` runs it on
+demand. A worker's first compaction comes at a random point within the
+interval rather than at start-up, so restarting or scaling out workers
+does not set off a compaction in each of them at once.
+"""
+import atexit
+import random
+import threading
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import InventoryDailyTotal, InventoryMovement
+from app.services.analytics_services import apply_movements
+
+PURCHASE = InventoryMovement.PURCHASE
+RESTOCK = InventoryMovement.RESTOCK
+
+
+class MovementLedger:
+    def __init__(self, app, batch_size=500, flush_interval=0.5, max_buffer=100000,
+                 retention_days=30, compact_interval=86400):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.compact_interval = compact_interval
+        self.dropped = 0
+        self._buffer = deque(maxlen=max_buffer)
+        # A batch whose write failed, retried before anything newer
+        self._retry = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._full = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._compacted_at = self._first_compaction()
+
+    def record(self, sweet_id, delta, kind, username=None, unit_price=None, category=None):
+        """Buffer one movement.
+
+        ``unit_price`` and ``category`` should be read when the stock
+        changed; the writer only looks them up for rows that lack them.
+        """
+        row = {
+            "sweet_id": sweet_id,
+            "username": username,
+            "kind": kind,
+            "delta": delta,
+            "unit_price": unit_price,
+            "category": category,
+            "created_at": _utcnow(),
+        }
+        with self._lock:
+            full = len(self._buffer) == self._buffer.maxlen
+            if full:
+                self.dropped += 1
+            self._buffer.append(row)
+            pending = len(self._buffer)
+        if full:
+            self.app.logger.warning(
+                "Ledger buffer full; dropped the oldest inventory movement (%s so far)", self.dropped
+            )
+
+        if not self.flush_interval:
+            try:
+                self.flush()
+            except Exception:
+                # The stock change is already committed; keep the row buffered
+                self.app.logger.exception("Writing inventory movements failed")
+            return
+        self._ensure_writer()
+        if pending >= self.batch_size:
+            self._full.set()
+
+    def pending(self):
+        return len(self._retry) + len(self._buffer)
+
+    def flush(self):
+        """Insert everything buffered so far; returns the number of rows written."""
+        with self._flush_lock:
+            written = 0
+            while True:
+                rows, self._retry = self._retry, []
+                if not rows:
+                    with self._lock:
+                        rows = [self._buffer.popleft()
+                                for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not rows:
+                    return written
+                try:
+                    apply_movements(rows)
+                    db.session.execute(
+                        insert(InventoryMovement),
+                        # The category feeds the totals only; the ledger row has no column for it
+                        [{k: v for k, v in row.items() if k != "category"} for row in rows],
+                    )
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # Keep the batch out of the bounded buffer so it cannot evict newer rows
+                    self._retry = rows
+                    raise
+                written += len(rows)
+
+    def compact(self, days=None):
+        """Roll movements older than ``days`` into daily totals.
+
+        ``days`` defaults to ``retention_days``. The cutoff is midnight UTC,
+        so whole days are compacted at once.
+        Returns the number of movements removed.
+        """
+        if days is None:
+            days = self.retention_days
+        today = _utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        before = today - timedelta(days=days)
+
+        day = func.date(InventoryMovement.created_at)
+        old = InventoryMovement.created_at < before
+        last_id = db.session.scalar(select(func.max(InventoryMovement.id)).where(old))
+        if last_id is None:
+            return 0
+        window = (old, InventoryMovement.id <= last_id)
+
+        totals = db.session.execute(
+            select(day, InventoryMovement.sweet_id, InventoryMovement.kind,
+                   func.sum(InventoryMovement.delta), func.count())
+            .where(*window)
+            .group_by(day, InventoryMovement.sweet_id, InventoryMovement.kind)
+        ).all()
+        expected = sum(row[4] for row in totals)
+
+        try:
+            removed = db.session.execute(
+                delete(InventoryMovement).where(*window)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if removed != expected:
+                # Another worker compacted the same rows first
+                db.session.rollback()
+                return 0
+            for value, sweet_id, kind, delta, count in totals:
+                key = (_to_date(value), sweet_id, kind)
+                total = db.session.get(InventoryDailyTotal, key)
+                if total is None:
+                    total = InventoryDailyTotal(day=key[0], sweet_id=sweet_id, kind=kind,
+                                                delta=0, movements=0)
+                    db.session.add(total)
+                total.delta += delta
+                total.movements += count
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return 0
+        return removed
+
+    def after_fork(self):
+        """Start a forked child empty and without a writer; the parent writes what it buffered."""
+        self._buffer = deque(maxlen=self._buffer.maxlen)
+        self._retry = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._full = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._compacted_at = self._first_compaction()
+
+    def _first_compaction(self):
+        # Pretend the last compaction was a random fraction of an interval ago
+        return _utcnow() - timedelta(seconds=random.uniform(0, self.compact_interval or 0))
+
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._flush_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="ledger-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._full.wait(self.flush_interval)
+            self._full.clear()
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    self.app.logger.exception("Writing inventory movements failed")
+                self._maybe_compact()
+
+    def _maybe_compact(self):
+        if not self.compact_interval:
+            return
+        now = _utcnow()
+        if (now - self._compacted_at).total_seconds() < self.compact_interval:
+            return
+        self._compacted_at = now
+        try:
+            self.compact()
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception("Compacting inventory movements failed")
+
+    def stop(self):
+        self._stopped.set()
+        self._full.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.flush_interval * 2, 1))
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception("Writing inventory movements failed")
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _to_date(value):
+    # SQLite's date() returns text; other backends return a date
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def init_app(app):
+    app.extensions["ledger"] = MovementLedger(
+        app,
+        batch_size=app.config.get("LEDGER_BATCH_SIZE", 500),
+        flush_interval=app.config.get("LEDGER_FLUSH_INTERVAL", 0 if app.testing else 0.5),
+        max_buffer=app.config.get("LEDGER_MAX_BUFFER", 100000),
+        retention_days=app.config.get("LEDGER_RETENTION_DAYS", 30),
+        compact_interval=app.config.get("LEDGER_COMPACT_INTERVAL", 86400),
+    )
+
+
+def get_ledger():
+    return current_app.extensions["ledger"]
+
+
+def record_movement(sweet_id, delta, kind, username=None, unit_price=None, category=None):
+    get_ledger().record(sweet_id, delta, kind, username, unit_price, category)
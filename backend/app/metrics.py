@@ -0,0 +1,195 @@
+"""Lightweight in-process metrics: counters, gauges and histograms.
+
+Only what the app needs to size its connection pool and spot slow
+endpoints, with no client library dependency.
+"""
+import bisect
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# Seconds; tuned for connection checkouts and web requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Cumulative bucket counts keyed by upper bound, plus sum and count."""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = {}
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            cumulative[bound] = running
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        snap = self.snapshot()
+        if not snap["count"]:
+            return 0.0
+        target = q * snap["count"]
+        for bound, running in snap["buckets"].items():
+            if running >= target:
+                return bound
+        return float("inf")
+
+
+class PoolMetrics:
+    """Connection pool activity for one engine."""
+
+    def __init__(self):
+        self.checkout_seconds = Histogram()
+        self.wait_seconds = Histogram()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.pool = None
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        pool = self.pool
+        stats = {
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "checkout_seconds": self.checkout_seconds.snapshot(),
+            "wait_seconds": self.wait_seconds.snapshot(),
+        }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+                idle=pool.checkedin(),
+            )
+        return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times every checkout.
+
+    A checkout that starts while every pooled connection is busy has to
+    wait for a checkin or open an overflow connection; its duration also
+    goes into the wait-time histogram.
+    """
+
+    metrics = None
+
+    def connect(self):
+        metrics = self.metrics
+        if metrics is None:
+            return super().connect()
+
+        exhausted = self.checkedout() >= self.size()
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except Exception:
+            with metrics._lock:
+                metrics.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.checkout_seconds.observe(elapsed)
+            if exhausted:
+                metrics.wait_seconds.observe(elapsed)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics is not None:
+            self.metrics.pool = pool
+        return pool
+
+
+def instrument_engine(engine):
+    """Attach a ``PoolMetrics`` to ``engine`` and return it."""
+    metrics = PoolMetrics()
+    metrics.pool = engine.pool
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.metrics = metrics
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        with metrics._lock:
+            metrics.connects += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with metrics._lock:
+            metrics.checkouts += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        with metrics._lock:
+            metrics.invalidations += 1
+
+    return metrics
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusWriter:
+    """Builds the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lines = []
+        self._declared = set()
+
+    def _declare(self, name, kind, help_text):
+        if name not in self._declared:
+            self._declared.add(name)
+            self._lines.append(f"# HELP {name} {help_text}")
+            self._lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, kind, help_text, value, labels=None):
+        self._declare(name, kind, help_text)
+        self._lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def histogram(self, name, help_text, snapshot, labels=None):
+        self._declare(name, "histogram", help_text)
+        labels = labels or {}
+        for bound, count in snapshot["buckets"].items():
+            bucket_labels = dict(labels, le=_format_value(bound))
+            self._lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+        self._lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(snapshot['sum'])}")
+        self._lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+
+    def render(self):
+        return "\n".join(self._lines) + "\n"
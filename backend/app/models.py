@@ -1,21 +1,109 @@
 from . import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from sqlalchemy.orm import validates
+from .passwords import get_password_hasher
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))
     is_admin = db.Column(db.Boolean, default=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_password_hasher().hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return get_password_hasher().verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return get_password_hasher().needs_rehash(self.password_hash)
 
 class Sweet(db.Model):
+    __table_args__ = (
+        db.Index("ix_sweet_category_price", "category", "price"),
+        # Never reuse a deleted id; cached encodings are keyed on (id, version)
+        {"sqlite_autoincrement": True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
+    # Lower-cased copy of name so searches can use an index instead of ILIKE
+    name_lower = db.Column(db.String(120), nullable=False, index=True)
     category = db.Column(db.String(80), nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False, index=True)
+    # Units handed out to hot-key quotas (see app/hotkeys.py) but not yet sold
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Bumped by every write so cached encodings of a row can be keyed on it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    @validates("name")
+    def _normalize_name(self, key, name):
+        # None is left for the NOT NULL constraint to reject
+        self.name_lower = name.lower() if name is not None else None
+        return name
+
+@event.listens_for(Sweet, "before_update")
+def _bump_version_on_flush(mapper, connection, target):
+    target.version = Sweet.version + 1
+
+@event.listens_for(db.session, "do_orm_execute")
+def _bump_version_on_update(orm_execute_state):
+    # Covers set-based update(Sweet) statements, which skip the flush hook
+    statement = orm_execute_state.statement
+    if orm_execute_state.is_update and statement.entity_description.get("entity") is Sweet:
+        orm_execute_state.statement = statement.values(version=Sweet.version + 1)
+
+class RevokedToken(db.Model):
+    jti = db.Column(db.String(36), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class InventoryMovement(db.Model):
+    """Append-only record of one stock change; see app/ledger.py."""
+    PURCHASE = "purchase"
+    RESTOCK = "restock"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Plain columns rather than foreign keys so history survives deletes
+    sweet_id = db.Column(db.Integer, nullable=False, index=True)
+    username = db.Column(db.String(80))
+    kind = db.Column(db.String(16), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+    # Price when the movement was written, so revenue survives price changes
+    unit_price = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class InventoryDailyTotal(db.Model):
+    """Movements older than the retention window, rolled up per day."""
+    day = db.Column(db.Date, primary_key=True)
+    sweet_id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), primary_key=True)
+    delta = db.Column(db.Integer, nullable=False, default=0)
+    movements = db.Column(db.Integer, nullable=False, default=0)
+
+class SweetSalesTotal(db.Model):
+    """Running per-sweet totals, updated with each ledger batch."""
+    sweet_id = db.Column(db.Integer, primary_key=True)
+    units_sold = db.Column(db.Integer, nullable=False, default=0, index=True)
+    units_restocked = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class CategorySalesTotal(db.Model):
+    """Running per-category totals, updated with each ledger batch."""
+    category = db.Column(db.String(80), primary_key=True)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class IdempotencyKey(db.Model):
+    """A claimed Idempotency-Key and, once its request finished, the response; see app/idempotency.py."""
+    # sha256 of the user, endpoint and client-supplied key
+    key = db.Column(db.String(64), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # Random token of the claim; only its holder may store the response
+    owner = db.Column(db.String(32))
+    # NULL while the request is still running
+    status = db.Column(db.Integer)
+    body = db.Column(db.Text)
+    mimetype = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
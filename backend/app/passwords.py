@@ -0,0 +1,86 @@
+"""Password hashing with configurable cost, run off the request thread.
+
+Key-stretching hashes are deliberately CPU-heavy and hold the GIL while they
+run, so a burst of logins hashed inline stalls every other request in the
+worker. When ``PASSWORD_HASH_WORKERS`` is set the work is sent to a process
+pool instead; the request thread just waits on the result. At most
+``PASSWORD_HASH_MAX_PENDING`` hashes are queued at once so a login storm
+backs up at the door rather than piling unbounded work onto the pool.
+
+``PASSWORD_HASH_METHOD`` takes any werkzeug method string, e.g. ``scrypt``
+or ``pbkdf2:sha256:600000``. Hashes made with different parameters still
+verify, and ``needs_rehash`` tells the login path to upgrade them.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasher:
+    def __init__(self, method="scrypt", workers=0, max_pending=None):
+        self.method = method
+        self.workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.max_pending = max_pending or max(workers, 1) * 4
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._prefix = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when ``password_hash`` was made with other parameters."""
+        if self._prefix is None:
+            # werkzeug expands defaults ("scrypt" -> "scrypt:32768:8:1"),
+            # so compare against the prefix it actually writes.
+            self._prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        return password_hash.split("$", 1)[0] != self._prefix
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def after_fork(self):
+        # The parent's pool and its management threads don't exist here
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        with self._slots:
+            return self._get_pool().submit(fn, *args).result()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # Forking a threaded server is unsafe, so start clean workers
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+
+def init_app(app):
+    app.extensions["password_hasher"] = PasswordHasher(
+        method=app.config.get("PASSWORD_HASH_METHOD", "scrypt"),
+        workers=app.config.get("PASSWORD_HASH_WORKERS", 0),
+        max_pending=app.config.get("PASSWORD_HASH_MAX_PENDING"),
+    )
+
+
+def get_password_hasher():
+    return current_app.extensions["password_hasher"]
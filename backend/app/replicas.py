@@ -0,0 +1,153 @@
+"""Read-replica routing for catalog reads.
+
+Each URL in ``DATABASE_REPLICA_URLS`` becomes a ``replica_<n>`` bind. Views
+marked with ``replica_reads`` (catalog listing and search) are given one
+replica per request, picked round-robin, and ``RoutingSession`` sends
+their SELECTs there. Writes, flushes and every other view stay on the
+primary.
+
+A replica may lag the primary. To keep read-your-writes, a client that
+commits a write reads from the primary for the next
+``REPLICA_STICKY_SECONDS``; set that to a little over the usual
+replication lag. Sticky clients are tracked in a ``CacheBackend`` (an
+in-process ``LRUCache`` by default). Pass a shared one as
+``REPLICA_STICKY_BACKEND`` so that stickiness follows a user across
+workers. Catalog responses built from a replica are cached for
+``REPLICA_CACHE_TTL`` seconds rather than the full catalog TTL, which
+bounds how long a lagging replica can leave a stale body in the cache.
+Their ETag comes from the body itself rather than the catalog version, which
+a lagging replica's rows may predate. If a replica fails, the request is
+retried once on the primary. NDJSON streams are sent after the view has
+returned, too late for that retry, so they always read from the primary.
+"""
+import itertools
+from functools import wraps
+
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.admission import client_key
+from app.cache import LRUCache
+
+
+class ReplicaRouter:
+    def __init__(self, bind_keys, sticky_seconds=5, sticky_backend=None):
+        self.bind_keys = list(bind_keys)
+        self.sticky_seconds = sticky_seconds
+        self.sticky = sticky_backend or LRUCache(maxsize=100000, ttl=sticky_seconds)
+        # next() on itertools.count is atomic, so no lock is needed
+        self._turn = itertools.count()
+
+    def next_bind(self):
+        """The next replica bind key, round-robin."""
+        return self.bind_keys[next(self._turn) % len(self.bind_keys)]
+
+    def is_sticky(self, client):
+        return bool(self.sticky.get(f"sticky:{client}"))
+
+    def stick(self, client):
+        """Keep ``client`` on the primary for ``sticky_seconds`` after it wrote."""
+        self.sticky.set(f"sticky:{client}", 1, self.sticky_seconds)
+
+
+class RoutingSession(Session):
+    """Sends SELECTs to the replica chosen for the current request."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or getattr(clause, "is_dml", False):
+                # Anything read after a write in this request must see it
+                self.info["wrote"] = True
+                g.read_bind = None
+            elif g.get("read_bind") is not None:
+                return self._db.engines[g.read_bind]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _stick_after_write(session):
+    if session.info.pop("wrote", False) and has_request_context():
+        router = current_app.extensions.get("replicas")
+        if router is not None:
+            router.stick(client_key())
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_rolled_back_write(session):
+    session.info.pop("wrote", None)
+
+
+def route_reads():
+    """Choose where this request's reads go; returns the replica bind key or ``None``."""
+    router = current_app.extensions.get("replicas")
+    if router is None:
+        return None
+    g.read_sticky = router.is_sticky(client_key())
+    g.read_bind = None if g.read_sticky else router.next_bind()
+    return g.read_bind
+
+
+def replica_reads(view):
+    """Serve this view's reads from a replica unless the client wrote recently.
+
+    Put it below ``jwt_required`` so stickiness is tracked per user. A
+    replica error reruns the view against the primary.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if route_reads() is None:
+            return view(*args, **kwargs)
+        try:
+            return view(*args, **kwargs)
+        except OperationalError:
+            if g.read_bind is None:
+                raise
+            from app import db
+            current_app.logger.warning("Replica %s failed; reading from the primary", g.read_bind)
+            db.session.rollback()
+            g.read_bind = None
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def read_from_primary():
+    """Send the rest of this request's reads to the primary."""
+    if has_request_context():
+        g.read_bind = None
+
+
+def read_bind():
+    """The replica bind key serving this request's reads, or ``None`` for the primary."""
+    return g.get("read_bind") if has_request_context() else None
+
+
+def read_is_sticky():
+    """True when this request must see the client's own recent writes."""
+    return g.get("read_sticky", False) if has_request_context() else False
+
+
+def replica_cache_ttl():
+    """TTL for a catalog body read by this request, or ``None`` for the cache's default."""
+    if read_bind() is None:
+        return None
+    return current_app.config.get("REPLICA_CACHE_TTL", 5)
+
+
+def configure(app):
+    """Add a bind per replica URL; call before ``db.init_app``."""
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    for n, url in enumerate(app.config.get("DATABASE_REPLICA_URLS") or ()):
+        binds[f"replica_{n}"] = url
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+def init_app(app):
+    bind_keys = [key for key in app.config["SQLALCHEMY_BINDS"] if key.startswith("replica_")]
+    if not bind_keys:
+        return
+    sticky_seconds = app.config.get("REPLICA_STICKY_SECONDS", 5)
+    app.extensions["replicas"] = ReplicaRouter(
+        bind_keys, sticky_seconds, app.config.get("REPLICA_STICKY_BACKEND")
+    )
@@ -0,0 +1,174 @@
+"""JWT revocation without per-request database lookups.
+
+Revoked token ids (``jti``) live in a bounded in-memory map, so checking a
+token is one dict lookup. An entry only has to outlive its token, so it is
+dropped once the token's ``exp`` passes. A live entry is never evicted, since
+that would quietly make its token valid again. Once the map holds
+``JWT_REVOCATION_MAXSIZE`` live entries, further revocations are kept in the
+table only, and lookups that miss in memory go to the table until those
+tokens have expired. Without the table such a revocation is refused.
+
+With ``JWT_REVOCATION_PERSIST`` enabled revocations are also written to the
+``revoked_token`` table, and each worker pulls in rows added by other
+workers at most once every ``JWT_REVOCATION_SYNC_SECONDS``. That keeps the
+database off the request path while still letting a revocation made on one
+worker reach the others. Rows are stamped with the writing worker's clock
+and may commit after a later-stamped row was already synced, so each sync
+re-reads ``JWT_REVOCATION_SYNC_OVERLAP`` seconds behind the newest stamp it
+has seen; loading a row twice is harmless.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from app import db, jwt
+from app.models import RevokedToken
+
+
+class RevocationListFull(Exception):
+    pass
+
+
+class RevocationList:
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, expires_at):
+        """Block ``jti`` until ``expires_at`` (a unix timestamp).
+
+        Raises ``RevocationListFull`` rather than evict a live entry.
+        """
+        with self._lock:
+            if jti not in self._entries and len(self._entries) >= self.maxsize:
+                self._purge_expired(time.time())
+                if len(self._entries) >= self.maxsize:
+                    raise RevocationListFull(jti)
+            self._entries[jti] = expires_at
+
+    def is_revoked(self, jti, now=None):
+        expires_at = self._entries.get(jti)
+        if expires_at is None:
+            return False
+        if expires_at <= (now or time.time()):
+            # The token is rejected for being expired anyway
+            with self._lock:
+                self._entries.pop(jti, None)
+            return False
+        return True
+
+    def purge_expired(self, now=None):
+        with self._lock:
+            self._purge_expired(now or time.time())
+
+    def _purge_expired(self, now):
+        for jti in [j for j, exp in self._entries.items() if exp <= now]:
+            del self._entries[jti]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TokenRevoker:
+    """Per-app revocation state: the in-memory list plus optional table sync."""
+
+    def __init__(self, maxsize=100000, persist=False, sync_seconds=30, sync_overlap=60):
+        self.revoked = RevocationList(maxsize)
+        self.persist = persist
+        self.sync_seconds = sync_seconds
+        self.sync_overlap = timedelta(seconds=sync_overlap)
+        self._synced_at = None
+        self._synced_through = None
+        self._sync_lock = threading.Lock()
+        # Until then some revocations live only in the table
+        self._overflow_until = 0.0
+
+    def revoke(self, jti, expires_at):
+        if self.persist:
+            db.session.merge(RevokedToken(
+                jti=jti,
+                expires_at=_to_datetime(expires_at),
+                revoked_at=_utcnow(),
+            ))
+            db.session.commit()
+        self._remember(jti, expires_at)
+
+    def is_revoked(self, jti):
+        if self.persist:
+            self.maybe_sync()
+        if self.revoked.is_revoked(jti):
+            return True
+        if self.persist and time.time() < self._overflow_until:
+            row = db.session.get(RevokedToken, jti)
+            return row is not None and row.expires_at > _utcnow()
+        return False
+
+    def _remember(self, jti, expires_at):
+        try:
+            self.revoked.revoke(jti, expires_at)
+        except RevocationListFull:
+            if not self.persist:
+                raise
+            current_app.logger.warning("Revocation list is full; checking the table for unknown tokens")
+            self._overflow_until = max(self._overflow_until, expires_at)
+
+    def maybe_sync(self):
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < self.sync_seconds:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return  # another thread is already syncing
+        try:
+            self.sync()
+            self._synced_at = now
+        finally:
+            self._sync_lock.release()
+
+    def sync(self):
+        """Load revocations recorded in the table since the last sync."""
+        query = RevokedToken.query.filter(RevokedToken.expires_at > _utcnow())
+        if self._synced_through is not None:
+            # Clock skew and late commits can land rows behind the watermark
+            query = query.filter(RevokedToken.revoked_at >= self._synced_through - self.sync_overlap)
+        for row in query:
+            self._remember(row.jti, _to_timestamp(row.expires_at))
+            if self._synced_through is None or row.revoked_at > self._synced_through:
+                self._synced_through = row.revoked_at
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _to_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def _to_timestamp(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def init_app(app):
+    app.extensions["token_revoker"] = TokenRevoker(
+        maxsize=app.config.get("JWT_REVOCATION_MAXSIZE", 100000),
+        persist=app.config.get("JWT_REVOCATION_PERSIST", False),
+        sync_seconds=app.config.get("JWT_REVOCATION_SYNC_SECONDS", 30),
+        sync_overlap=app.config.get("JWT_REVOCATION_SYNC_OVERLAP", 60),
+    )
+
+
+def get_token_revoker():
+    return current_app.extensions["token_revoker"]
+
+
+def revoke_token(jwt_payload):
+    get_token_revoker().revoke(jwt_payload["jti"], jwt_payload["exp"])
+
+
+@jwt.token_in_blocklist_loader
+def _check_if_token_revoked(jwt_header, jwt_payload):
+    return get_token_revoker().is_revoked(jwt_payload["jti"])
@@ -1,10 +1,14 @@
 from flask import Blueprint, request, jsonify
 from app import db
 from app.models import User
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt
+from app.revocation import RevocationListFull, revoke_token
+from app.admission import admit
+from app.services.auth_services import authenticate_user
 
 auth_bp = Blueprint("auth", __name__)
 
+
 @auth_bp.route("/register", methods=["POST"])
 def register():
     try:
@@ -34,6 +38,7 @@ def register():
         return jsonify(msg="Registration failed"), 500
 
 @auth_bp.route("/login", methods=["POST"])
+@admit("login")
 def login():
     try:
         data = request.get_json()
@@ -45,10 +50,10 @@ def login():
         username = data['username'].strip()
         password = data['password']
         
-        # Find user and check password
-        user = User.query.filter_by(username=username).first()
-        
-        if user and user.check_password(password):
+        # Find user and check password, upgrading an outdated hash
+        user = authenticate_user(username, password)
+
+        if user:
             # Create access token with string identity and admin claim
             access_token = create_access_token(
                 identity=user.username, 
@@ -59,4 +64,17 @@ def login():
         return jsonify(msg="Invalid credentials"), 401
         
     except Exception as e:
-        return jsonify(msg="Login failed"), 500
\ No newline at end of file
+        return jsonify(msg="Login failed"), 500
+
+@auth_bp.route("/logout", methods=["POST"])
+@jwt_required()
+def logout():
+    try:
+        revoke_token(get_jwt())
+        return jsonify(msg="Logged out successfully"), 200
+    except RevocationListFull:
+        # Refuse rather than pretend the token was revoked
+        return jsonify(msg="Logout unavailable, try again later"), 503
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(msg="Logout failed"), 500
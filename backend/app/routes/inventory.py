@@ -1,40 +1,172 @@
-from flask import Blueprint, jsonify
+import time
+
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from app.models import Sweet
 from app import db
+from app.admission import admit
+from app.idempotency import idempotent
+from app.broadcast import EVENT_STREAM_MIMETYPE, KEEPALIVE, create_stream_token, get_broadcaster, verify_stream_request
+from app.services.inventory_services import (
+    purchase_sweet,
+    checkout,
+    restock_sweet,
+    restock_batch,
+    SweetNotFound,
+    OutOfStock,
+)
+from app.services.sweet_services import changed_sweets
 
 # Make sure the blueprint name is unique
 inventory_bp = Blueprint("inventory", __name__)
 
+
+def parse_quantity(data):
+    """The optional ``quantity`` of a JSON body; raises ``ValueError`` unless it is a positive integer"""
+    try:
+        quantity = int(data.get("quantity", 1))
+    except (TypeError, ValueError):
+        raise ValueError("Quantity must be a positive integer")
+    if quantity < 1:
+        raise ValueError("Quantity must be a positive integer")
+    return quantity
+
+
+def parse_lines(items, max_lines, noun):
+    """Turn ``[{"id": 1, "quantity": 3}, ...]`` into ``(id, quantity)`` pairs or raise ``ValueError``"""
+    if not isinstance(items, list) or not items:
+        raise ValueError("Items required")
+    if len(items) > max_lines:
+        raise ValueError(f"At most {max_lines} items per {noun}")
+
+    lines = []
+    for item in items:
+        try:
+            sweet_id = int(item["id"])
+        except (TypeError, KeyError, ValueError):
+            raise ValueError("Each item needs an id and a quantity")
+        lines.append((sweet_id, parse_quantity(item)))
+    return lines
+
+
 @inventory_bp.route("/<int:id>/purchase", methods=["POST"])
 @jwt_required()
+@idempotent
+@admit("purchase")
 def purchase(id):
     try:
-        sweet = Sweet.query.get_or_404(id)
-        if sweet.quantity == 0:
-            return jsonify(msg="Out of stock"), 400
-        sweet.quantity -= 1
-        db.session.commit()
+        quantity = parse_quantity(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
+    try:
+        purchase_sweet(id, quantity, username=get_jwt_identity())
         return jsonify(msg="Purchased successfully"), 200
+    except SweetNotFound:
+        return jsonify(msg="Sweet not found"), 404
+    except OutOfStock:
+        return jsonify(msg="Out of stock"), 400
     except Exception as e:
         db.session.rollback()
         return jsonify(msg="Purchase failed"), 500
 
+@inventory_bp.route("/checkout", methods=["POST"])
+@jwt_required()
+@idempotent
+@admit("purchase")
+def checkout_cart():
+    data = request.get_json(silent=True) or {}
+    try:
+        lines = parse_lines(data.get("items"), current_app.config.get("CHECKOUT_MAX_LINES", 100), "checkout")
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
+    try:
+        ok, results = checkout(lines, username=get_jwt_identity())
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(msg="Checkout failed"), 500
+
+    if not ok:
+        return jsonify(msg="Checkout failed, nothing was purchased", items=results), 409
+    return jsonify(msg="Checkout successful", items=results), 200
+
 @inventory_bp.route("/<int:id>/restock", methods=["POST"])
 @jwt_required()
 def restock(id):
+    if not get_jwt().get("is_admin", False):
+        return jsonify(msg="Admin only"), 403
+    try:
+        quantity = parse_quantity(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
     try:
-        # Get additional claims to check admin status
-        claims = get_jwt()
-        is_admin = claims.get('is_admin', False)
-            
-        if not is_admin:
-            return jsonify(msg="Admin only"), 403
-            
-        sweet = Sweet.query.get_or_404(id)
-        sweet.quantity += 1
-        db.session.commit()
-        return jsonify(msg="Restocked successfully"), 200
+        stock = restock_sweet(id, quantity, username=get_jwt_identity())
+        return jsonify(msg="Restocked successfully", quantity=stock), 200
+    except SweetNotFound:
+        return jsonify(msg="Sweet not found"), 404
     except Exception as e:
         db.session.rollback()
-        return jsonify(msg="Restock failed"), 500
\ No newline at end of file
+        return jsonify(msg="Restock failed"), 500
+
+@inventory_bp.route("/restock/batch", methods=["POST"])
+@jwt_required()
+def restock_delivery():
+    if not get_jwt().get("is_admin", False):
+        return jsonify(msg="Admin only"), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        lines = parse_lines(data.get("items"), current_app.config.get("RESTOCK_MAX_LINES", 1000), "restock")
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
+    try:
+        ok, results = restock_batch(lines, username=get_jwt_identity())
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(msg="Restock failed"), 500
+
+    if not ok:
+        return jsonify(msg="Restock failed, nothing was changed", items=results), 409
+    return jsonify(msg="Restocked successfully", items=results), 200
+
+@inventory_bp.route("/stream-token", methods=["POST"])
+@jwt_required()
+def stream_token():
+    """A short-lived token for ``EventSource``, which cannot send headers."""
+    return jsonify(stream_token=create_stream_token(get_jwt_identity())), 200
+
+@inventory_bp.route("/stream", methods=["GET"])
+def stock_stream():
+    """Push stock and price changes as server-sent events; see app/broadcast.py.
+
+    Takes an access token in the header, or a stream token as ``?jwt=``.
+    Each connection ends after ``STREAM_MAX_SECONDS`` and the browser
+    reconnects with ``Last-Event-ID``, so no worker is held forever. Until
+    then the connection holds a WSGI thread; under ASGI it does not.
+    """
+    verify_stream_request()
+    broadcaster = get_broadcaster()
+    seq, opening = broadcaster.open(request.headers.get("Last-Event-ID"))
+    heartbeat = current_app.config.get("STREAM_HEARTBEAT_SECONDS", 15)
+    deadline = time.monotonic() + current_app.config.get("STREAM_MAX_SECONDS", 300)
+
+    def generate():
+        nonlocal seq
+        yield opening
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            head = broadcaster.wait(seq, min(heartbeat, remaining))
+            if head == seq:
+                yield KEEPALIVE
+                continue
+            seq, message = broadcaster.message(seq, changed_sweets)
+            yield message
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EVENT_STREAM_MIMETYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
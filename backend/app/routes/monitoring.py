@@ -0,0 +1,80 @@
+import hmac
+
+from flask import Blueprint, jsonify, current_app, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from app.metrics import PrometheusWriter
+
+monitoring_bp = Blueprint("monitoring", __name__)
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@monitoring_bp.before_request
+@metrics_bp.before_request
+def require_monitoring_access():
+    """Admins, or a scraper presenting ``METRICS_TOKEN`` as its bearer token."""
+    token = current_app.config.get("METRICS_TOKEN")
+    if token and hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()
+    ):
+        return None
+    verify_jwt_in_request()
+    if not get_jwt().get("is_admin", False):
+        return jsonify(msg="Admin only"), 403
+
+
+@monitoring_bp.route("/pool", methods=["GET"])
+def pool_stats():
+    pools = current_app.extensions["pool_metrics"]
+    return jsonify({name: metrics.snapshot() for name, metrics in pools.items()})
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    out = PrometheusWriter()
+
+    for (endpoint, method), stats in sorted(current_app.extensions["request_metrics"].snapshot().items()):
+        labels = {"endpoint": endpoint, "method": method}
+        out.histogram("http_request_duration_seconds", "Request latency by endpoint.",
+                      stats.latency_seconds.snapshot(), labels)
+        out.sample("http_request_sql_statements_total", "counter",
+                   "SQL statements executed while serving the endpoint.", stats.statements, labels)
+        out.sample("http_request_db_seconds_total", "counter",
+                   "Time spent in SQL statements while serving the endpoint.", stats.db_seconds, labels)
+        for status, count in sorted(stats.responses.items()):
+            out.sample("http_responses_total", "counter", "Responses by endpoint and status.",
+                       count, dict(labels, status=status))
+
+    for name, pool in current_app.extensions["pool_metrics"].items():
+        snapshot = pool.snapshot()
+        labels = {"engine": name}
+        out.histogram("db_pool_checkout_seconds", "Time to check a connection out of the pool.",
+                      snapshot["checkout_seconds"], labels)
+        out.histogram("db_pool_wait_seconds", "Checkout time when no idle connection was available.",
+                      snapshot["wait_seconds"], labels)
+        for key, kind, help_text in (
+            ("checkouts", "counter", "Connections checked out of the pool."),
+            ("connects", "counter", "New DBAPI connections opened."),
+            ("invalidations", "counter", "Connections invalidated after errors."),
+            ("timeouts", "counter", "Checkouts that failed or timed out."),
+            ("checked_out", "gauge", "Connections currently in use."),
+            ("overflow", "gauge", "Overflow connections currently open."),
+            ("size", "gauge", "Configured pool size."),
+        ):
+            if key in snapshot:
+                out.sample(f"db_pool_{key}", kind, help_text, snapshot[key], labels)
+
+    cache = current_app.extensions["catalog_cache"]
+    out.sample("catalog_cache_hits_total", "counter", "Catalog cache hits.", cache.hits)
+    out.sample("catalog_cache_misses_total", "counter", "Catalog cache misses.", cache.misses)
+
+    admission = current_app.extensions.get("admission")
+    if admission is not None:
+        stats = admission.stats()
+        for name, count in sorted(stats["rate_limited"].items()):
+            out.sample("admission_rate_limited_total", "counter",
+                       "Requests answered 429 by the rate limiter.", count, {"name": name})
+        for name, count in sorted(stats["shed"].items()):
+            out.sample("admission_shed_total", "counter",
+                       "Requests answered 503 by the load shedder.", count, {"name": name})
+
+    return current_app.response_class(out.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,47 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt
+from app.services.analytics_services import top_sellers, category_revenue, low_stock
+
+reports_bp = Blueprint("reports", __name__)
+
+
+def _int_arg(name, default, minimum=0):
+    value = request.args.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return value
+
+
+@reports_bp.before_request
+@jwt_required()
+def require_admin():
+    if not get_jwt().get("is_admin", False):
+        return jsonify(msg="Admin only"), 403
+
+
+@reports_bp.route("/top-sellers", methods=["GET"])
+def get_top_sellers():
+    try:
+        limit = _int_arg("limit", 10, minimum=1)
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    return jsonify(top_sellers(min(limit, 1000)))
+
+
+@reports_bp.route("/category-revenue", methods=["GET"])
+def get_category_revenue():
+    return jsonify(category_revenue())
+
+
+@reports_bp.route("/low-stock", methods=["GET"])
+def get_low_stock():
+    try:
+        threshold = _int_arg("threshold", current_app.config.get("LOW_STOCK_THRESHOLD", 5))
+        limit = _int_arg("limit", 50, minimum=1)
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    return jsonify(low_stock(threshold, min(limit, 1000)))
@@ -1,10 +1,105 @@
-from flask import Blueprint, request, jsonify
+import hashlib
+import io
+
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from app import db
 from app.models import Sweet
+from app.broadcast import publish_changes
+from app.cache import get_catalog_cache, invalidate_catalog
+from app.replicas import read_bind, read_from_primary, read_is_sticky, replica_cache_ttl, replica_reads
+from app.services.bulk_services import (
+    DECODE_ERRORS,
+    bulk_delete,
+    bulk_update,
+    import_sweets,
+    read_csv,
+    read_ndjson,
+    selection_filters,
+    update_values,
+    validate_values,
+)
+from app.serializers import sweet_to_dict
+from app.services import sweet_services
+from app.services.inventory_services import SweetNotFound
+from app.services.sweet_services import (
+    QuantityBelowReserved,
+    list_sweets_json,
+    iter_sweets,
+    parse_fields,
+    search_filters,
+)
 
 sweet_bp = Blueprint("sweet", __name__)
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def wants_stream():
+    """True when the client asked for an NDJSON stream instead of a JSON array"""
+    if request.args.get("stream") == "1":
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def ndjson_response(rows):
+    """Stream one JSON object per line without building the whole body"""
+    dumps = current_app.json.dumps
+
+    def generate():
+        for row in rows:
+            yield dumps(row) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def catalog_key():
+    """Cache key for the current request: its path and sorted query args"""
+    return request.path + "?" + "&".join(
+        f"{k}={v}" for k, v in sorted(request.args.items(multi=True))
+    )
+
+
+def content_etag(body):
+    """Strong ETag computed from a response body"""
+    return hashlib.sha1(body if isinstance(body, bytes) else body.encode()).hexdigest()
+
+
+def etagged_json(body, etag):
+    """``body`` tagged with ``etag``, or a 304 when the client already holds it"""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def cached_json(build):
+    """Serve the JSON string returned by ``build()`` with an ETag, reusing cached bodies.
+
+    A request whose ``If-None-Match`` carries the current ETag gets a 304
+    before anything is read from the database. Clients that must read their
+    own recent write skip the cache, which may hold a body from a lagging
+    replica. Bodies read from a replica are tagged by their content
+    instead, since the replica may not have caught up with the version the
+    catalog ETag names.
+    """
+    catalog = current_app.extensions["catalog_cache"]
+    key = catalog_key()
+    cache = get_catalog_cache()
+    if read_bind() is not None:
+        body = build() if cache is None else cache.get_or_set(key, build, ttl=replica_cache_ttl())
+        return etagged_json(body, content_etag(body))
+
+    etag = catalog.etag(key)
+    if request.if_none_match.contains(etag):
+        return etagged_json(None, etag)
+    body = build() if cache is None or read_is_sticky() else cache.get_or_set(key, build)
+    return etagged_json(body, etag)
+
 
 @sweet_bp.route("", methods=["POST"])
 @jwt_required()
@@ -25,88 +120,164 @@ def add_sweet():
         )
         db.session.add(sweet)
         db.session.commit()
+        invalidate_catalog()
+        publish_changes([sweet.id])
         return jsonify(message="Sweet added successfully"), 201
     except Exception as e:
         db.session.rollback()
         return jsonify(msg="Failed to add sweet"), 500
 
 
+@sweet_bp.route("/bulk", methods=["POST"])
+@jwt_required()
+def bulk_import_sweets():
+    if not get_jwt().get("is_admin", False):
+        return jsonify(msg="Admin only"), 403
+
+    readers = {"text/csv": read_csv, NDJSON_MIMETYPE: read_ndjson}
+    reader = readers.get(request.mimetype)
+    if reader is None:
+        return jsonify(msg="Send text/csv or application/x-ndjson"), 415
+
+    try:
+        batch_size = int(request.args.get("batch_size", current_app.config.get("BULK_BATCH_SIZE", 1000)))
+    except ValueError:
+        return jsonify(msg="batch_size must be an integer"), 400
+    if batch_size < 1:
+        return jsonify(msg="batch_size must be positive"), 400
+
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8", errors=DECODE_ERRORS, newline="")
+    try:
+        report = import_sweets(reader(lines), batch_size=batch_size)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(msg="Bulk import failed"), 500
+    return jsonify(report), 201 if report["inserted"] else 400
+
+
+@sweet_bp.route("/bulk", methods=["PATCH"])
+@jwt_required()
+def bulk_update_sweets():
+    data = request.get_json(silent=True) or {}
+    try:
+        filters = selection_filters(data.get("ids"), data.get("filter"))
+        values = update_values(data.get("set"), data.get("multiply"))
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
+    try:
+        updated = bulk_update(filters, values)
+        return jsonify(message="Sweets updated", updated=updated), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(msg="Failed to update sweets"), 500
+
+
+@sweet_bp.route("/bulk", methods=["DELETE"])
+@jwt_required()
+def bulk_delete_sweets():
+    if not get_jwt().get("is_admin", False):
+        return jsonify(msg="Admin only"), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        filters = selection_filters(data.get("ids"), data.get("filter"))
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
+    try:
+        deleted = bulk_delete(filters)
+        return jsonify(message="Sweets deleted", deleted=deleted), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(msg="Failed to delete sweets"), 500
+
+
 @sweet_bp.route("", methods=["GET"])
 @jwt_required()
+@replica_reads
 def get_sweets():
-    sweets = Sweet.query.all()
-    return jsonify(
-        [
-            {
-                "id": s.id,
-                "name": s.name,
-                "category": s.category,
-                "price": s.price,
-                "quantity": s.quantity,
-            }
-            for s in sweets
-        ]
-    )
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
+    cursor = request.args.get("cursor")
+    limit = request.args.get("limit")
+    if wants_stream():
+        try:
+            cursor = int(cursor) if cursor is not None else None
+        except ValueError:
+            return jsonify(msg="cursor must be an integer"), 400
+        # Rows are read after the view returns, where a replica failure can't be retried
+        read_from_primary()
+        return ndjson_response(
+            iter_sweets(fields, cursor, batch_size=current_app.config.get("SWEETS_STREAM_BATCH_SIZE", 500))
+        )
+
+    if cursor is None and limit is None:
+        # Unpaginated listing, kept for existing clients
+        return cached_json(lambda: list_sweets_json(fields))
+
+    max_limit = current_app.config.get("SWEETS_MAX_PAGE_SIZE", 1000)
+    try:
+        cursor = int(cursor) if cursor is not None else None
+        limit = int(limit) if limit is not None else current_app.config.get("SWEETS_PAGE_SIZE", 50)
+    except ValueError:
+        return jsonify(msg="cursor and limit must be integers"), 400
+    if not 1 <= limit <= max_limit:
+        return jsonify(msg=f"limit must be between 1 and {max_limit}"), 400
+
+    return cached_json(lambda: list_sweets_json(fields, cursor, limit))
 
 
 @sweet_bp.route("/search", methods=["GET"])
 @jwt_required()
+@replica_reads
 def search_sweets():
     name = request.args.get("search") or request.args.get("name")
     category = request.args.get("category")
     price_min = request.args.get("price_min")
     price_max = request.args.get("price_max")
 
-    query = Sweet.query
-    if name:
-        query = query.filter(Sweet.name.ilike(f"%{name}%"))
-    if category:
-        query = query.filter(Sweet.category == category)
-    if price_min:
-        query = query.filter(Sweet.price >= float(price_min))
-    if price_max:
-        query = query.filter(Sweet.price <= float(price_max))
-
-    results = query.all()
-    return jsonify(
-        [
-            {
-                "id": s.id,
-                "name": s.name,
-                "category": s.category,
-                "price": s.price,
-                "quantity": s.quantity,
-            }
-            for s in results
-        ]
-    )
+    try:
+        fields = parse_fields(request.args.get("fields"))
+        filters = search_filters(name, category, price_min, price_max)
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
+    if wants_stream():
+        read_from_primary()
+        return ndjson_response(
+            iter_sweets(
+                fields,
+                filters=filters,
+                batch_size=current_app.config.get("SWEETS_STREAM_BATCH_SIZE", 500),
+            )
+        )
+
+    return cached_json(lambda: list_sweets_json(fields, filters=filters))
 
 
 @sweet_bp.route("/<int:id>", methods=["PUT"])
 @jwt_required()
 def update_sweet(id):
-    sweet = Sweet.query.get_or_404(id)
-    data = request.get_json()
-
     try:
-        for key, value in data.items():
-            if key in ["price"]:
-                value = float(value)
-            elif key in ["quantity"]:
-                value = int(value)
-            setattr(sweet, key, value)
+        values = validate_values(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+    if not values:
+        return jsonify(msg="Nothing to update"), 400
 
-        db.session.commit()
+    try:
+        sweet = sweet_services.update_sweet(id, values)
+        return jsonify(message="Sweet updated", sweet=sweet_to_dict(sweet))
+    except SweetNotFound:
+        return jsonify(msg="Sweet not found"), 404
+    except QuantityBelowReserved as e:
         return jsonify(
-            message="Sweet updated",
-            sweet={
-                "id": sweet.id,
-                "name": sweet.name,
-                "category": sweet.category,
-                "price": sweet.price,
-                "quantity": sweet.quantity,
-            },
-        )
+            msg=f"quantity cannot go below the {e.reserved} units reserved for sale"
+        ), 409
     except Exception as e:
         db.session.rollback()
         return jsonify(msg="Failed to update sweet"), 500
@@ -128,4 +299,16 @@ def delete_sweet(id):
     sweet = Sweet.query.get_or_404(id)
     db.session.delete(sweet)
     db.session.commit()
+    invalidate_catalog()
+    publish_changes(deleted=[id])
     return jsonify(message="Sweet deleted successfully"), 200
+
+
+@sweet_bp.route("/cache/stats", methods=["GET"])
+@jwt_required()
+def cache_stats():
+    if not get_jwt().get("is_admin", False):
+        return jsonify(msg="Admin only"), 403
+
+    cache = current_app.extensions["catalog_cache"]
+    return jsonify(cache.stats())
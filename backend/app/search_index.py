@@ -0,0 +1,247 @@
+"""In-process trigram index for substring search on sweet names.
+
+``LIKE '%kaju%'`` cannot use a B-tree index, so every name search would scan
+the whole table. The index here maps each three-letter slice of a
+lower-cased name to the ids containing it; intersecting the posting sets
+for a query gives its matches without touching the database. It is loaded
+lazily from ``Sweet.name_lower`` and kept current by session hooks that
+apply flushed inserts, updates and deletes once their transaction commits.
+Writes made by other processes are picked up by reloading every
+``SEARCH_INDEX_REFRESH_SECONDS``.
+
+Loading reads every name, which takes seconds on a large catalog, so it
+runs on a background thread. Until the first load lands, searches fall back
+to SQL. After that, searches keep using the current index while a fresh
+one is built, and the new one is swapped in when it is ready. Writes
+committed during a rebuild are replayed onto the new index before the swap.
+"""
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+
+from app import db
+from app.models import Sweet
+
+MIN_QUERY_LENGTH = 3
+
+_PENDING_KEY = "search_index_ops"
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._names = {}
+        self._loaded_at = None
+        # Writes seen while a rebuild runs, replayed onto its result
+        self._replay = None
+        # Bumped by invalidate so a rebuild that started earlier is discarded
+        self._generation = 0
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    @property
+    def refreshing(self):
+        return self._replay is not None
+
+    def refresh(self, loader):
+        """Build a new index from ``loader()`` rows and swap it in.
+
+        Runs without holding the lock, so searches carry on meanwhile.
+        Returns False if the index was invalidated during the build, in
+        which case the result is thrown away.
+        """
+        with self._lock:
+            generation = self._generation
+            if self._replay is None:
+                self._replay = []
+        try:
+            postings, names = {}, {}
+            for sweet_id, name in loader():
+                _insert(postings, names, sweet_id, name)
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            replay, self._replay = self._replay, None
+            if generation != self._generation:
+                return False
+            for sweet_id, name in replay:
+                _delete(postings, names, sweet_id)
+                if name is not None:
+                    _insert(postings, names, sweet_id, name)
+            self._postings = postings
+            self._names = names
+            self._loaded_at = time.monotonic()
+            return True
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = None
+            self._postings = {}
+            self._names = {}
+
+    def add(self, sweet_id, name):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((sweet_id, name))
+            if self.loaded:
+                _delete(self._postings, self._names, sweet_id)
+                _insert(self._postings, self._names, sweet_id, name)
+
+    def remove(self, sweet_id):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((sweet_id, None))
+            if self.loaded:
+                _delete(self._postings, self._names, sweet_id)
+
+    def _start_refresh(self, loader):
+        # Called with the lock held
+        self._replay = []
+        threading.Thread(
+            target=self._refresh_quietly, args=(loader,), name="search-index-refresh", daemon=True
+        ).start()
+
+    def _refresh_quietly(self, loader):
+        try:
+            self.refresh(loader)
+        except Exception:
+            # The loader logs; searches keep the old index or use SQL until the next attempt
+            pass
+
+    def search(self, query, loader):
+        """Return the ids whose name contains ``query`` (case-insensitive).
+
+        When the index is empty or older than ``refresh_seconds``,
+        ``loader`` is called on a background thread to fetch
+        ``(id, name_lower)`` rows for a rebuild. Returns ``None`` for queries
+        too short to have a trigram and while nothing is loaded yet; callers
+        fall back to SQL.
+        """
+        query = query.lower()
+        if len(query) < MIN_QUERY_LENGTH:
+            return None
+
+        with self._lock:
+            stale = (
+                self._loaded_at is None
+                or time.monotonic() - self._loaded_at > self.refresh_seconds
+            )
+            if stale and self._replay is None:
+                self._start_refresh(loader)
+            if self._loaded_at is None:
+                return None
+
+            postings = sorted(
+                (self._postings.get(gram, set()) for gram in trigrams(query)),
+                key=len,
+            )
+            candidates = set(postings[0])
+            for ids in postings[1:]:
+                candidates &= ids
+                if not candidates:
+                    break
+            # Trigrams can match out of order, so confirm the real substring
+            return {i for i in candidates if query in self._names[i]}
+
+
+def _insert(postings, names, sweet_id, name):
+    names[sweet_id] = name
+    for gram in trigrams(name):
+        postings.setdefault(gram, set()).add(sweet_id)
+
+
+def _delete(postings, names, sweet_id):
+    name = names.pop(sweet_id, None)
+    if name is None:
+        return
+    for gram in trigrams(name):
+        ids = postings.get(gram)
+        if ids is not None:
+            ids.discard(sweet_id)
+            if not ids:
+                del postings[gram]
+
+
+def init_app(app):
+    app.extensions["search_index"] = TrigramIndex(
+        refresh_seconds=app.config.get("SEARCH_INDEX_REFRESH_SECONDS", 60)
+    )
+
+
+def get_search_index():
+    """The index for the current app, or ``None`` when it is disabled."""
+    if not current_app.config.get("SEARCH_INDEX_ENABLED", True):
+        return None
+    return current_app.extensions.get("search_index")
+
+
+def load_names():
+    return db.session.execute(select(Sweet.id, Sweet.name_lower)).all()
+
+
+def matching_ids(query):
+    """Ids of sweets whose name contains ``query``, or ``None`` if the index can't answer."""
+    index = get_search_index()
+    if index is None:
+        return None
+    app = current_app._get_current_object()
+
+    def loader():
+        # Runs on the refresh thread
+        with app.app_context():
+            try:
+                return load_names()
+            except Exception:
+                app.logger.exception("Loading the search index failed")
+                raise
+
+    return index.search(query, loader)
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_changes(session, flush_context):
+    ops = session.info.setdefault(_PENDING_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, Sweet):
+            ops.append((obj.id, obj.name_lower))
+    for obj in session.dirty:
+        if isinstance(obj, Sweet) and session.is_modified(obj):
+            ops.append((obj.id, obj.name_lower))
+    for obj in session.deleted:
+        if isinstance(obj, Sweet):
+            ops.append((obj.id, None))
+
+
+@event.listens_for(db.session, "after_commit")
+def _apply_changes(session):
+    ops = session.info.pop(_PENDING_KEY, None)
+    if not ops or not has_app_context():
+        return
+    index = current_app.extensions.get("search_index")
+    if index is None:
+        return
+    for sweet_id, name in ops:
+        if name is None:
+            index.remove(sweet_id)
+        else:
+            index.add(sweet_id, name)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _discard_changes(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+
@@ -0,0 +1,141 @@
+"""JSON encoding for sweets.
+
+Listings select plain column tuples rather than ORM entities, and each row
+is encoded once per ``Sweet.version``: the JSON fragment for
+``(id, version, fields)`` is kept in a per-app cache, so encoding a page of
+unchanged rows is a string join. Every write bumps ``version`` (see
+app/models.py), so a cached fragment can never outlive the row it encodes.
+A deleted row's fragments are dropped when the delete commits, and sweet
+ids are never reused (``sqlite_autoincrement`` on SQLite), so a new row
+cannot pick up a fragment of an old one with the same id and version.
+At most ``SWEET_FRAGMENT_CACHE_SIZE`` fragments are kept; the cache is
+simply emptied when it fills, which keeps lookups free of LRU bookkeeping.
+
+``OrjsonProvider`` swaps Flask's JSON provider for orjson when it is
+installed and ``JSON_USE_ORJSON`` is left on.
+"""
+from flask import current_app, has_app_context
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+from app import db
+from app.models import Sweet
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+SWEET_FIELDS = ("id", "name", "category", "price", "quantity")
+_DELETED_KEY = "deleted_sweet_ids"
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson; output stays compact."""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+class FragmentCache:
+    """Fragments keyed by ``(id, version, fields)``, grouped by id so a row's can be dropped."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.clear()
+
+    def get(self, key):
+        row = self._fragments.get(key[0])
+        return row.get(key[1:]) if row is not None else None
+
+    def set(self, key, fragment):
+        if self._size >= self.maxsize:
+            self.clear()
+        row = self._fragments.setdefault(key[0], {})
+        if key[1:] not in row:
+            self._size += 1
+        row[key[1:]] = fragment
+
+    def discard(self, sweet_ids):
+        for sweet_id in sweet_ids:
+            self._size -= len(self._fragments.pop(sweet_id, ()))
+
+    def clear(self):
+        self._fragments = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+
+def sweet_to_dict(sweet, fields=SWEET_FIELDS):
+    """A ``Sweet`` entity as a dict of ``fields``."""
+    return {field: getattr(sweet, field) for field in fields}
+
+
+def encode_rows(rows, fields):
+    """Encode ``(*fields, version)`` rows as a JSON array string.
+
+    ``fields`` must start with ``id``.
+    """
+    cache = current_app.extensions["sweet_fragments"]
+    dumps = current_app.json.dumps
+    parts = []
+    for row in rows:
+        key = (row[0], row[-1], fields)
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = dumps(dict(zip(fields, row)))
+            cache.set(key, fragment)
+        parts.append(fragment)
+    return "[" + ",".join(parts) + "]"
+
+
+def encode_page(rows, next_cursor, fields):
+    """Encode a keyset page envelope around ``encode_rows``."""
+    return '{"items":' + encode_rows(rows, fields) + ',"next_cursor":' + \
+        current_app.json.dumps(next_cursor) + "}"
+
+
+def forget_sweets(sweet_ids=None):
+    """Drop the fragments of deleted sweets, or all of them when the ids are unknown."""
+    cache = current_app.extensions.get("sweet_fragments")
+    if cache is None:
+        return
+    if sweet_ids is None:
+        cache.clear()
+    else:
+        cache.discard(sweet_ids)
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_deleted(session, flush_context):
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Sweet)]
+    if deleted:
+        session.info.setdefault(_DELETED_KEY, []).extend(deleted)
+
+
+@event.listens_for(db.session, "after_commit")
+def _forget_deleted(session):
+    deleted = session.info.pop(_DELETED_KEY, None)
+    if deleted and has_app_context():
+        forget_sweets(deleted)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _keep_rolled_back(session, previous_transaction):
+    session.info.pop(_DELETED_KEY, None)
+
+
+def init_app(app):
+    if orjson is not None and app.config.get("JSON_USE_ORJSON", True):
+        app.json = OrjsonProvider(app)
+    app.extensions["sweet_fragments"] = FragmentCache(
+        app.config.get("SWEET_FRAGMENT_CACHE_SIZE", 100000)
+    )
@@ -0,0 +1,112 @@
+from sqlalchemy import insert, select, update
+
+from app import db
+from app.models import CategorySalesTotal, InventoryMovement, Sweet, SweetSalesTotal
+
+
+def apply_movements(rows):
+    """Fold a batch of ledger rows into the running sales totals.
+
+    Called by the ledger writer inside the transaction that inserts the
+    rows, so totals and ledger commit together. Rows carry the
+    ``unit_price`` and ``category`` read when the stock changed, so a later
+    price change or delete does not rewrite the sale. Rows recorded
+    without them are filled in from the catalog, with one query for the
+    whole batch.
+    """
+    unknown = {row["sweet_id"] for row in rows if row.get("unit_price") is None}
+    catalog = {}
+    if unknown:
+        catalog = {
+            sweet_id: (price, category)
+            for sweet_id, price, category in db.session.execute(
+                select(Sweet.id, Sweet.price, Sweet.category).where(Sweet.id.in_(unknown))
+            )
+        }
+
+    per_sweet = {}
+    per_category = {}
+    for row in rows:
+        if row.get("unit_price") is None:
+            row["unit_price"], row["category"] = catalog.get(row["sweet_id"], (None, None))
+        price, category = row["unit_price"], row.get("category")
+        totals = per_sweet.setdefault(row["sweet_id"], {"units_sold": 0, "units_restocked": 0, "revenue": 0.0})
+        if row["kind"] == InventoryMovement.PURCHASE:
+            units = -row["delta"]
+            revenue = units * (price or 0.0)
+            totals["units_sold"] += units
+            totals["revenue"] += revenue
+            if category is not None:
+                by_category = per_category.setdefault(category, {"units_sold": 0, "revenue": 0.0})
+                by_category["units_sold"] += units
+                by_category["revenue"] += revenue
+        elif row["kind"] == InventoryMovement.RESTOCK:
+            totals["units_restocked"] += row["delta"]
+
+    for sweet_id, amounts in per_sweet.items():
+        _increment(SweetSalesTotal, {"sweet_id": sweet_id}, amounts)
+    for category, amounts in per_category.items():
+        _increment(CategorySalesTotal, {"category": category}, amounts)
+
+
+def _increment(model, key, amounts):
+    """Add ``amounts`` to the row identified by ``key``, creating it if needed."""
+    result = db.session.execute(
+        update(model)
+        .where(*(getattr(model, column) == value for column, value in key.items()))
+        .values({column: getattr(model, column) + amount for column, amount in amounts.items()})
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        # A concurrent insert of the same key fails the batch, which the
+        # ledger retries; the retry then takes the UPDATE path
+        db.session.execute(insert(model).values(**key, **amounts))
+
+
+def top_sellers(limit=10):
+    rows = db.session.execute(
+        select(SweetSalesTotal, Sweet.name, Sweet.category)
+        .outerjoin(Sweet, Sweet.id == SweetSalesTotal.sweet_id)
+        .where(SweetSalesTotal.units_sold > 0)
+        .order_by(SweetSalesTotal.units_sold.desc(), SweetSalesTotal.sweet_id)
+        .limit(limit)
+    ).all()
+    return [
+        {
+            "id": total.sweet_id,
+            "name": name,
+            "category": category,
+            "units_sold": total.units_sold,
+            "revenue": round(total.revenue, 2),
+        }
+        for total, name, category in rows
+    ]
+
+
+def category_revenue():
+    totals = CategorySalesTotal.query.order_by(
+        CategorySalesTotal.revenue.desc(), CategorySalesTotal.category
+    )
+    return [
+        {"category": t.category, "units_sold": t.units_sold, "revenue": round(t.revenue, 2)}
+        for t in totals
+    ]
+
+
+def low_stock(threshold=5, limit=50):
+    """Sweets with at most ``threshold`` units left to sell, emptiest first.
+
+    Units reserved for hot-key quotas (see app/hotkeys.py) are already
+    promised to buyers, so they do not count as stock left.
+    """
+    available = Sweet.quantity - Sweet.reserved
+    sweets = (
+        Sweet.query.filter(available <= threshold)
+        .order_by(available, Sweet.id)
+        .limit(limit)
+    )
+    return [
+        {"id": s.id, "name": s.name, "category": s.category, "quantity": s.quantity,
+         "available": s.quantity - s.reserved}
+        for s in sweets
+    ]
@@ -1,6 +1,5 @@
 from app.models import User
 from app import db
-from werkzeug.security import generate_password_hash
 
 def create_user(username, password):
     if User.query.filter_by(username=username).first():
@@ -14,5 +13,17 @@ def create_user(username, password):
 def authenticate_user(username, password):
     user = User.query.filter_by(username=username).first()
     if user and user.check_password(password):
+        upgrade_password_hash(user, password)
         return user
-    return None
\ No newline at end of file
+    return None
+
+def upgrade_password_hash(user, password):
+    """Re-hash with the current parameters while we have the plain password"""
+    if not user.password_needs_rehash():
+        return
+    try:
+        user.set_password(password)
+        db.session.commit()
+    except Exception:
+        # The old hash still works, so a failed upgrade must not fail the login
+        db.session.rollback()
\ No newline at end of file
@@ -0,0 +1,263 @@
+import csv
+import json
+import math
+import time
+
+from sqlalchemy import case, insert, update, delete
+from app.models import Sweet
+from app import db
+from app.broadcast import publish_changes
+from app.cache import invalidate_catalog
+from app.search_index import get_search_index
+from app.serializers import forget_sweets
+from app.services.sweet_services import search_filters
+
+IMPORT_FORMATS = ("csv", "ndjson")
+SETTABLE_FIELDS = ("name", "category", "price", "quantity")
+# Largest value an Integer column holds on every supported backend
+MAX_QUANTITY = 2**31 - 1
+MULTIPLIABLE_FIELDS = ("price",)
+FILTER_KEYS = ("name", "category", "price_min", "price_max")
+# Readers decode with this so a stray non-UTF-8 byte fails its own row, not the whole import
+DECODE_ERRORS = "surrogateescape"
+
+
+def read_csv(lines):
+    """Yield ``(line_number, record)`` pairs from CSV text with a header row."""
+    reader = csv.DictReader(lines)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_ndjson(lines):
+    """Yield ``(line_number, record)`` pairs from one JSON object per line.
+
+    Lines that are not valid JSON objects are yielded as ``ValueError``
+    instances so they can be reported like any other invalid row.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield line_number, ValueError("Expected a JSON object")
+            continue
+        yield line_number, record
+
+
+def validate_text(field, value):
+    """``value`` as stored in the ``field`` column, or raise ``ValueError``."""
+    value = str(value).strip()
+    max_length = getattr(Sweet, field).type.length
+    if len(value) > max_length:
+        raise ValueError(f"{field} must be at most {max_length} characters")
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError:
+        raise ValueError(f"{field} is not valid UTF-8")
+    return value
+
+
+def validate_field(field, value):
+    """``value`` as stored in one of ``SETTABLE_FIELDS``, or raise ``ValueError``."""
+    if field in ("name", "category"):
+        value = validate_text(field, value)
+        if not value:
+            raise ValueError(f"{field} must not be empty")
+        return value
+    try:
+        value = float(value) if field == "price" else int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{field} must be a number" if field == "price" else f"{field} must be an integer")
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f"{field} must not be negative")
+    if field == "quantity" and value > MAX_QUANTITY:
+        raise ValueError("quantity is too large")
+    return value
+
+
+def validate_sweet(record):
+    """Turn a raw record into an insertable row, or raise ``ValueError``.
+
+    Checks everything the table would reject, so a bad row is reported on
+    its own instead of failing the whole batch it lands in.
+    """
+    for field in SETTABLE_FIELDS:
+        if record.get(field) in (None, ""):
+            raise ValueError(f"Missing field: {field}")
+    row = {field: validate_field(field, record[field]) for field in SETTABLE_FIELDS}
+    row["name_lower"] = row["name"].lower()
+    return row
+
+
+def validate_values(set_values):
+    """Validate a partial edit of a sweet; returns the column values to write.
+
+    Only ``SETTABLE_FIELDS`` may be given, so ``reserved``, ``version`` and
+    ``name_lower`` are never written directly; ``name_lower`` follows
+    ``name``. Raises ``ValueError`` on anything else.
+    """
+    if not isinstance(set_values, dict):
+        raise ValueError("set must be an object")
+    values = {}
+    for field, value in set_values.items():
+        if field not in SETTABLE_FIELDS:
+            raise ValueError(f"Cannot set field: {field}")
+        values[field] = validate_field(field, value)
+    if "name" in values:
+        values["name_lower"] = values["name"].lower()
+    return values
+
+
+def import_sweets(records, batch_size=1000, max_errors=1000):
+    """Insert validated records in executemany batches, one commit per batch.
+
+    ``records`` is an iterable of ``(line_number, record)`` pairs as produced
+    by ``read_csv``/``read_ndjson``, consumed lazily so input of any size is
+    streamed. Invalid rows are skipped and reported; at most ``max_errors``
+    are kept in the report.
+    """
+    started = time.perf_counter()
+    inserted = 0
+    failed = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal inserted
+        db.session.execute(insert(Sweet), batch)
+        db.session.commit()
+        inserted += len(batch)
+        batch.clear()
+
+    try:
+        for line_number, record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                batch.append(validate_sweet(record))
+            except ValueError as e:
+                failed += 1
+                if len(errors) < max_errors:
+                    errors.append({"line": line_number, "error": str(e)})
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        if inserted:
+            _after_bulk_write(rebuild_index=True)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "inserted": inserted,
+        "failed": failed,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(inserted / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def selection_filters(ids=None, filter=None):
+    """WHERE clauses picking the rows a bulk change applies to.
+
+    Either an id list or a search-style filter (``name``, ``category``,
+    ``price_min``, ``price_max``) is required, so a request can never
+    touch the whole table by accident. Raises ``ValueError`` otherwise.
+
+    Name filters always use SQL ``LIKE``: the search index can lag behind
+    the table, and a destructive write must match exactly the rows that
+    are there now.
+    """
+    if ids:
+        if not isinstance(ids, list):
+            raise ValueError("ids must be a list")
+        try:
+            return [Sweet.id.in_([int(i) for i in ids])]
+        except (TypeError, ValueError):
+            raise ValueError("ids must be integers")
+    if filter:
+        if not isinstance(filter, dict):
+            raise ValueError("filter must be an object")
+        unknown = [k for k in filter if k not in FILTER_KEYS]
+        if unknown:
+            raise ValueError(f"Unknown filter: {unknown[0]}")
+        try:
+            filters = search_filters(**filter, use_index=False)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid filter value")
+        if filters:
+            return filters
+    raise ValueError("Provide ids or a filter")
+
+
+def update_values(set_values=None, multiply=None):
+    """Build the SET clause for a bulk update, or raise ``ValueError``."""
+    for name, given in (("set", set_values), ("multiply", multiply)):
+        if given is not None and not isinstance(given, dict):
+            raise ValueError(f"{name} must be an object")
+    values = validate_values(set_values or {})
+    if "quantity" in values:
+        # Units reserved by hot-key quotas (app/hotkeys.py) are already sold or promised
+        values["quantity"] = case(
+            (Sweet.reserved > values["quantity"], Sweet.reserved), else_=values["quantity"]
+        )
+
+    for field, factor in (multiply or {}).items():
+        if field not in MULTIPLIABLE_FIELDS:
+            raise ValueError(f"Cannot multiply field: {field}")
+        if field in values:
+            raise ValueError(f"{field} is both set and multiplied")
+        try:
+            factor = float(factor)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid factor for {field}")
+        if not math.isfinite(factor) or factor <= 0:
+            raise ValueError(f"Factor for {field} must be a positive number")
+        values[field] = getattr(Sweet, field) * factor
+
+    if not values:
+        raise ValueError("Nothing to update")
+    return values
+
+
+def bulk_update(filters, values):
+    """Apply ``values`` to every matching sweet in one UPDATE; returns the row count."""
+    result = db.session.execute(
+        update(Sweet)
+        .where(*filters)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    _after_bulk_write(rebuild_index="name" in values)
+    return result.rowcount
+
+
+def bulk_delete(filters):
+    """Delete every matching sweet in one DELETE; returns the row count."""
+    result = db.session.execute(
+        delete(Sweet).where(*filters).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    _after_bulk_write(rebuild_index=True, deleted=True)
+    return result.rowcount
+
+
+def _after_bulk_write(rebuild_index, deleted=False):
+    invalidate_catalog()
+    if deleted:
+        # Set-based deletes bypass the ORM hook that drops deleted rows' fragments
+        forget_sweets()
+    # The affected ids are unknown, so stream listeners reload the catalog
+    publish_changes(reset=True)
+    index = get_search_index()
+    if rebuild_index and index is not None:
+        # Set-based writes bypass the ORM hooks that keep the index current
+        index.invalidate()
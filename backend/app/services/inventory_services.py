@@ -0,0 +1,178 @@
+from flask import current_app
+from sqlalchemy import update, select, case
+from app.models import Sweet
+from app import db
+from app.broadcast import publish_changes
+from app.cache import invalidate_catalog
+from app.ledger import PURCHASE, RESTOCK, record_movement
+
+
+class SweetNotFound(Exception):
+    pass
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def purchase_sweet(sweet_id, quantity=1, username=None):
+    """Atomically take ``quantity`` units of a sweet out of stock.
+
+    The stock check and the decrement happen in one conditional UPDATE, so
+    concurrent buyers can never drive the quantity below zero and no row
+    lock is held between reading and writing. Units reserved for hot-key
+    quotas are not available here; purchases of hot sweets are served from
+    this process's quota instead. Every sale is recorded in the ledger
+    against ``username``, at the price it was made at.
+    """
+    hot_keys = current_app.extensions.get("hot_keys")
+    if hot_keys is not None and hot_keys.is_hot(sweet_id):
+        price, category = hot_keys.purchase(sweet_id, quantity)
+        record_movement(sweet_id, -quantity, PURCHASE, username, price, category)
+        return
+
+    result = db.session.execute(
+        update(Sweet)
+        .where(Sweet.id == sweet_id, Sweet.quantity - Sweet.reserved >= quantity)
+        .values(quantity=Sweet.quantity - quantity)
+    )
+    if result.rowcount == 1:
+        price, category = _catalog_entries([sweet_id])[sweet_id]
+        db.session.commit()
+        invalidate_catalog()
+        publish_changes([sweet_id])
+        record_movement(sweet_id, -quantity, PURCHASE, username, price, category)
+        return
+
+    db.session.rollback()
+    if db.session.get(Sweet, sweet_id) is None:
+        raise SweetNotFound(sweet_id)
+    raise OutOfStock(sweet_id)
+
+
+def _catalog_entries(sweet_ids):
+    """``{id: (price, category)}``, read in the sale's own transaction."""
+    return {
+        sweet_id: (price, category)
+        for sweet_id, price, category in db.session.execute(
+            select(Sweet.id, Sweet.price, Sweet.category).where(Sweet.id.in_(list(sweet_ids)))
+        )
+    }
+
+
+def checkout(lines, username=None):
+    """Buy several sweets in one all-or-nothing transaction.
+
+    ``lines`` is a list of ``(sweet_id, quantity)`` pairs. Every line is
+    reserved by a single set-based UPDATE; if any sweet is missing or short
+    on stock nothing is written. Returns ``(ok, results)`` where ``results``
+    holds one status per input line.
+    """
+    wanted = {}
+    for sweet_id, quantity in lines:
+        wanted[sweet_id] = wanted.get(sweet_id, 0) + quantity
+
+    amount = case(wanted, value=Sweet.id)
+    result = db.session.execute(
+        update(Sweet)
+        .where(Sweet.id.in_(wanted), Sweet.quantity - Sweet.reserved >= amount)
+        .values(quantity=Sweet.quantity - amount)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == len(wanted):
+        catalog = _catalog_entries(wanted)
+        db.session.commit()
+        invalidate_catalog()
+        publish_changes(wanted)
+        for sweet_id, quantity in wanted.items():
+            record_movement(sweet_id, -quantity, PURCHASE, username, *catalog[sweet_id])
+        statuses = {sweet_id: "purchased" for sweet_id in wanted}
+        return True, _line_results(lines, statuses)
+
+    db.session.rollback()
+    in_stock = dict(
+        db.session.execute(
+            select(Sweet.id, Sweet.quantity - Sweet.reserved).where(Sweet.id.in_(wanted))
+        ).all()
+    )
+    statuses = {}
+    for sweet_id, quantity in wanted.items():
+        if sweet_id not in in_stock:
+            statuses[sweet_id] = "not_found"
+        elif in_stock[sweet_id] < quantity:
+            statuses[sweet_id] = "out_of_stock"
+        else:
+            statuses[sweet_id] = "available"
+    return False, _line_results(lines, statuses)
+
+
+def restock_sweet(sweet_id, quantity=1, username=None):
+    """Add ``quantity`` units to a sweet's stock; returns the new level.
+
+    A relative UPDATE, so restocks never overwrite units sold by
+    concurrent purchases.
+    """
+    result = db.session.execute(
+        update(Sweet)
+        .where(Sweet.id == sweet_id)
+        .values(quantity=Sweet.quantity + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        raise SweetNotFound(sweet_id)
+    stock = db.session.scalar(select(Sweet.quantity).where(Sweet.id == sweet_id))
+    db.session.commit()
+    invalidate_catalog()
+    publish_changes([sweet_id])
+    record_movement(sweet_id, quantity, RESTOCK, username)
+    return stock
+
+
+def restock_batch(lines, username=None):
+    """Apply a delivery manifest in one all-or-nothing transaction.
+
+    ``lines`` is a list of ``(sweet_id, quantity)`` pairs, applied with a
+    single set-based UPDATE and one commit. If any sweet is missing nothing
+    is written. Returns ``(ok, results)``; on success each result carries
+    the sweet's new stock level.
+    """
+    wanted = {}
+    for sweet_id, quantity in lines:
+        wanted[sweet_id] = wanted.get(sweet_id, 0) + quantity
+
+    result = db.session.execute(
+        update(Sweet)
+        .where(Sweet.id.in_(wanted))
+        .values(quantity=Sweet.quantity + case(wanted, value=Sweet.id))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(wanted):
+        db.session.rollback()
+        found = set(db.session.scalars(select(Sweet.id).where(Sweet.id.in_(wanted))))
+        statuses = {
+            sweet_id: "available" if sweet_id in found else "not_found"
+            for sweet_id in wanted
+        }
+        return False, _line_results(lines, statuses)
+
+    stock = dict(
+        db.session.execute(select(Sweet.id, Sweet.quantity).where(Sweet.id.in_(wanted))).all()
+    )
+    db.session.commit()
+    invalidate_catalog()
+    publish_changes(wanted)
+    for sweet_id, quantity in wanted.items():
+        record_movement(sweet_id, quantity, RESTOCK, username)
+
+    results = _line_results(lines, {sweet_id: "restocked" for sweet_id in wanted})
+    for line in results:
+        line["stock"] = stock[line["id"]]
+    return True, results
+
+
+def _line_results(lines, statuses):
+    return [
+        {"id": sweet_id, "quantity": quantity, "status": statuses[sweet_id]}
+        for sweet_id, quantity in lines
+    ]
@@ -1,11 +1,20 @@
+from flask import current_app
+from sqlalchemy import select, update
 from app.models import Sweet
 from app import db
+from app.search_index import get_search_index, matching_ids
+from app.broadcast import publish_changes
+from app.cache import invalidate_catalog
+from app.serializers import SWEET_FIELDS, encode_page, encode_rows
+from app.services.inventory_services import SweetNotFound
 
 
 def create_sweet(data):
     sweet = Sweet(**data)
     db.session.add(sweet)
     db.session.commit()
+    invalidate_catalog()
+    publish_changes([sweet.id])
     return sweet
 
 
@@ -13,27 +22,167 @@ def get_all_sweets():
     return Sweet.query.all()
 
 
-def search_sweets(name=None, category=None, price_min=None, price_max=None):
-    query = Sweet.query
+def parse_fields(fields):
+    """Turn a ``fields=name,price`` parameter into a column tuple.
+
+    ``id`` is always included since it is the pagination key. Raises
+    ``ValueError`` for unknown field names.
+    """
+    if not fields:
+        return SWEET_FIELDS
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in SWEET_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field: {unknown[0]}")
+    return tuple(f for f in SWEET_FIELDS if f == "id" or f in requested)
+
+
+def sweets_query(fields=SWEET_FIELDS, filters=(), cursor=None, limit=None, versioned=False):
+    """Select only ``fields`` of the matching sweets, ordered by id.
+
+    With ``versioned`` each row also ends with ``Sweet.version``, as
+    ``encode_rows`` expects.
+    """
+    columns = [getattr(Sweet, f) for f in fields]
+    if versioned:
+        columns.append(Sweet.version)
+    query = select(*columns).where(*filters).order_by(Sweet.id)
+    if cursor is not None:
+        query = query.where(Sweet.id > cursor)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def list_sweets(fields=SWEET_FIELDS, cursor=None, limit=None, filters=()):
+    """Return sweets ordered by id as dicts holding only ``fields``.
+
+    With a ``limit`` this is a keyset page: rows with ``id > cursor`` are
+    read straight off the primary key index, so every page costs the same
+    regardless of how deep into the catalog it is. Returns
+    ``(rows, next_cursor)``; ``next_cursor`` is ``None`` on the last page.
+    """
+    query = sweets_query(fields, filters, cursor, limit + 1 if limit is not None else None)
+    rows, next_cursor = split_page(db.session.execute(query).all(), limit)
+    return [dict(zip(fields, row)) for row in rows], next_cursor
+
+
+def list_sweets_json(fields=SWEET_FIELDS, cursor=None, limit=None, filters=()):
+    """``list_sweets`` encoded straight to a JSON string.
+
+    Without a ``limit`` the body is a plain array, otherwise a
+    ``{"items": [...], "next_cursor": ...}`` page.
+    """
+    query = sweets_query(fields, filters, cursor, limit + 1 if limit is not None else None,
+                         versioned=True)
+    rows = db.session.execute(query).all()
+    if limit is None:
+        return encode_rows(rows, fields)
+    return encode_page(*split_page(rows, limit), fields=fields)
+
+
+def split_page(rows, limit):
+    """Trim rows fetched with ``limit + 1`` to a page and its next cursor.
+
+    Rows are tuples starting with the id.
+    """
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1][0]
+    return rows, None
+
+
+def changed_sweets(ids):
+    """Current ``(*SWEET_FIELDS, version)`` rows of ``ids``.
+
+    Runs on its own short-lived connection, so a long-lived event stream
+    never holds a pooled connection between messages.
+    """
+    with db.engine.connect() as conn:
+        return conn.execute(sweets_query(filters=[Sweet.id.in_(ids)], versioned=True)).all()
+
+
+def iter_sweets(fields=SWEET_FIELDS, cursor=None, filters=(), batch_size=500):
+    """Yield matching sweets one dict at a time.
+
+    Rows are fetched ``batch_size`` at a time from a server-side cursor, so
+    memory stays flat however large the result set is.
+    """
+    query = sweets_query(fields, filters, cursor).execution_options(yield_per=batch_size)
+    for row in db.session.execute(query):
+        yield dict(zip(fields, row))
+
+
+def search_filters(name=None, category=None, price_min=None, price_max=None, use_index=True):
+    """Build the WHERE clauses shared by every catalog search.
+
+    Name matches come from the trigram index when it can answer and the
+    candidate list is small; otherwise they fall back to a LIKE on the
+    lower-cased name column. Pass ``use_index=False`` to always use the
+    LIKE, for callers that must not act on a stale index.
+    """
+    filters = []
     if name:
-        query = query.filter(Sweet.name.ilike(f"%{name}%"))
+        ids = matching_ids(name) if use_index else None
+        if ids is not None and len(ids) <= current_app.config.get("SEARCH_INDEX_MAX_IDS", 1000):
+            filters.append(Sweet.id.in_(ids))
+        else:
+            filters.append(Sweet.name_lower.contains(name.lower(), autoescape=True))
     if category:
-        query = query.filter(Sweet.category == category)
+        filters.append(Sweet.category == category)
     if price_min:
-        query = query.filter(Sweet.price >= float(price_min))
+        filters.append(Sweet.price >= float(price_min))
     if price_max:
-        query = query.filter(Sweet.price <= float(price_max))
-    return query.all()
+        filters.append(Sweet.price <= float(price_max))
+    return filters
 
 
-def update_sweet(sweet_id, data):
-    sweet = Sweet.query.get_or_404(sweet_id)
-    for key, value in data.items():
-        setattr(sweet, key, value)
+def search_sweets(name=None, category=None, price_min=None, price_max=None):
+    return Sweet.query.filter(
+        *search_filters(name, category, price_min, price_max)
+    ).all()
+
+
+class QuantityBelowReserved(Exception):
+    """The new quantity would not cover the units reserved for hot-key quotas."""
+
+    def __init__(self, reserved):
+        super().__init__(reserved)
+        self.reserved = reserved
+
+
+def update_sweet(sweet_id, values):
+    """Write validated ``values`` (see ``bulk_services.validate_values``) to one sweet.
+
+    The floor of ``quantity >= reserved`` is part of the UPDATE, so a
+    hot-key reservation made meanwhile is never overwritten. Returns the
+    updated sweet, or raises ``SweetNotFound`` or ``QuantityBelowReserved``.
+    """
+    conditions = [Sweet.id == sweet_id]
+    if "quantity" in values:
+        conditions.append(Sweet.reserved <= values["quantity"])
+    result = db.session.execute(
+        update(Sweet).where(*conditions).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        reserved = db.session.scalar(select(Sweet.reserved).where(Sweet.id == sweet_id))
+        if reserved is None:
+            raise SweetNotFound(sweet_id)
+        raise QuantityBelowReserved(reserved)
     db.session.commit()
-    return sweet
+    index = get_search_index()
+    if "name_lower" in values and index is not None:
+        # Set-based writes bypass the ORM hooks that keep the index current
+        index.add(sweet_id, values["name_lower"])
+    invalidate_catalog()
+    publish_changes([sweet_id])
+    return db.session.get(Sweet, sweet_id, populate_existing=True)
 
 def delete_sweet(sweet_id):
     sweet = Sweet.query.get_or_404(sweet_id)
     db.session.delete(sweet)
     db.session.commit()
+    invalidate_catalog()
+    publish_changes(deleted=[sweet_id])
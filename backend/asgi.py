@@ -0,0 +1,8 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+from app import create_app
+from app.asgi import create_asgi_app
+
+# Serve with e.g. `uvicorn asgi:app --workers 4`
+app = create_asgi_app(create_app())
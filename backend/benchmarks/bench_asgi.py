@@ -0,0 +1,176 @@
+"""Compare the WSGI and ASGI serving modes under many concurrent clients.
+
+Seeds a catalog, then serves the same app twice in a subprocess: once as
+WSGI on a fixed pool of ``--threads`` worker threads (the model of a
+threaded gunicorn worker), once as ASGI under uvicorn. Each server is
+driven by ``--concurrency`` simultaneous keep-alive connections issuing
+catalog page and search requests, and the script reports throughput and
+latency percentiles for both:
+
+    python -m benchmarks.bench_asgi --size 20000 --concurrency 500
+
+Needs the packages in requirements-asgi.txt plus httpx for the client.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.common import make_app, percentile, seed_sweets
+
+JWT_SECRET = "benchmark-secret-key-of-reasonable-length"
+TERMS = ["kaju", "velvet", "mango", "toffee", "praline"]
+
+
+def serve(mode, port, threads):
+    """Run one server in the foreground; used by the subprocesses."""
+    from app import create_app
+
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": os.environ["DATABASE_URL"],
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "SQLALCHEMY_ENGINE_OPTIONS": {"pool_size": threads, "max_overflow": 0,
+                                      "connect_args": {"timeout": 30}},
+        "JWT_SECRET_KEY": JWT_SECRET,
+    })
+    if mode == "asgi":
+        import uvicorn
+        from app.asgi import create_asgi_app
+
+        uvicorn.run(create_asgi_app(app), host="127.0.0.1", port=port,
+                    log_level="warning", lifespan="on")
+        return
+
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """Serves connections on a fixed thread pool, like a gthread worker."""
+
+        executor = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.executor.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer("127.0.0.1", port, app, handler=QuietHandler)
+    server.request_queue_size = 4096
+    server.serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def drive(port, token, size, concurrency, total):
+    import httpx
+
+    latencies = []
+    errors = 0
+    remaining = total
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers=headers,
+                                 limits=limits, timeout=60) as client:
+        async def worker(seed):
+            nonlocal remaining, errors
+            rng = random.Random(seed)
+            while remaining > 0:
+                remaining -= 1
+                if rng.random() < 0.5:
+                    url = f"/api/sweets?limit=50&cursor={rng.randint(0, size)}"
+                else:
+                    url = f"/api/sweets/search?search={rng.choice(TERMS)}&price_max={rng.randint(5, 50)}"
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=16,
+                        help="WSGI worker threads, and DB pool size for both modes.")
+    parser.add_argument("--serve", choices=("wsgi", "asgi"), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.port, args.threads)
+
+    app = make_app(JWT_SECRET_KEY=JWT_SECRET)
+    with app.app_context():
+        seed_sweets(args.size)
+        token = create_access_token(identity="bench", additional_claims={"is_admin": False})
+    env = dict(os.environ, DATABASE_URL=app.config["SQLALCHEMY_DATABASE_URI"])
+
+    print(f"{args.size} sweets, {args.concurrency} concurrent clients, "
+          f"{args.requests} requests, {args.threads} threads/pool slots")
+    for mode in ("wsgi", "asgi"):
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_asgi", "--serve", mode,
+             "--port", str(port), "--threads", str(args.threads)],
+            env=env,
+        )
+        try:
+            wait_for(port)
+            result = asyncio.run(drive(port, token, args.size, args.concurrency, args.requests))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{mode:5} {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Per-request cost of JWT authorization with the revocation check.
+
+Times ``verify_jwt_in_request`` (signature, claims and blocklist lookup) for
+a valid token while the revocation list holds 0 to ``--revoked`` entries.
+No database queries are made on this path.
+
+    python -m benchmarks.bench_auth --revoked 0 100000
+"""
+import argparse
+import json
+import time
+
+from flask_jwt_extended import create_access_token, verify_jwt_in_request
+
+from app.revocation import get_token_revoker
+from benchmarks.common import make_app, measure, summarize
+
+
+def run(revoked, repeat):
+    app = make_app()
+    with app.app_context():
+        revoker = get_token_revoker()
+        expires_at = time.time() + 3600
+        for i in range(revoked):
+            revoker.revoke(f"revoked-{i}", expires_at)
+        token = create_access_token(identity="bench", additional_claims={"is_admin": True})
+
+    headers = {"Authorization": f"Bearer {token}"}
+    with app.test_request_context("/api/sweets", headers=headers):
+        samples = measure(verify_jwt_in_request, repeat)
+
+    result = {"revoked_entries": revoked}
+    result.update({k.replace("_ms", "_us"): round(v * 1000, 1) for k, v in summarize(samples).items()})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--revoked", type=int, nargs="+", default=[0, 100000])
+    parser.add_argument("--repeat", type=int, default=5000)
+    args = parser.parse_args()
+
+    for revoked in args.revoked:
+        print(json.dumps(run(revoked, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Repricing a category item by item vs. one set-based bulk request.
+
+    python -m benchmarks.bench_bulk_update --rows 20000
+"""
+import argparse
+import json
+import time
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, select
+
+from app import db
+from app.models import Sweet
+from benchmarks.common import make_app, seed_sweets
+
+
+def count_statements(engine):
+    counter = {"statements": 0}
+
+    def before_cursor_execute(*args):
+        counter["statements"] += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return counter
+
+
+def run(rows):
+    app = make_app()
+    with app.app_context():
+        seed_sweets(rows)
+        token = create_access_token(identity="bench", additional_claims={"is_admin": True})
+        ids = db.session.execute(select(Sweet.id).where(Sweet.category == "Cake")).scalars().all()
+        counter = count_statements(db.engine)
+
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    started = time.perf_counter()
+    for sweet_id in ids:
+        client.put(f"/api/sweets/{sweet_id}", json={"price": 9.99}, headers=headers)
+    per_item = time.perf_counter() - started
+    per_item_statements = counter["statements"]
+
+    counter["statements"] = 0
+    started = time.perf_counter()
+    response = client.patch(
+        "/api/sweets/bulk",
+        json={"filter": {"category": "Cake"}, "multiply": {"price": 1.1}},
+        headers=headers,
+    )
+    bulk = time.perf_counter() - started
+
+    return {
+        "rows": rows,
+        "updated": response.get_json()["updated"],
+        "per_item_seconds": round(per_item, 3),
+        "per_item_statements": per_item_statements,
+        "bulk_seconds": round(bulk, 3),
+        "bulk_statements": counter["statements"],
+        "speedup": round(per_item / bulk, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows)))
+
+
+if __name__ == "__main__":
+    main()
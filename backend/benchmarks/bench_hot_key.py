@@ -0,0 +1,77 @@
+"""Purchase throughput on one hot sweet: direct UPDATE vs. hot-key quotas.
+
+Both runs hammer a single sweet from ``--threads`` threads until it sells
+out, then check that exactly the stock was sold.
+
+    python -m benchmarks.bench_hot_key --stock 5000 --threads 16
+"""
+import argparse
+import json
+import threading
+import time
+
+from app import db
+from app.models import Sweet
+from app.services.inventory_services import OutOfStock, purchase_sweet
+from benchmarks.common import make_app
+
+
+def run(mode, stock, threads, quota):
+    overrides = {"SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 30}}}
+    if mode == "hot":
+        overrides.update(HOT_SWEET_IDS=[1], HOT_KEY_QUOTA=quota, HOT_KEY_FLUSH_INTERVAL=0.2)
+    app = make_app(**overrides)
+    with app.app_context():
+        db.session.add(Sweet(name="Promo Ladoo", category="Indian", price=5.0, quantity=stock))
+        db.session.commit()
+
+    sold = []
+
+    def buyer():
+        count = 0
+        with app.app_context():
+            while True:
+                try:
+                    purchase_sweet(1)
+                except OutOfStock:
+                    break
+                count += 1
+        sold.append(count)
+
+    workers = [threading.Thread(target=buyer) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        if mode == "hot":
+            app.extensions["hot_keys"].stop()
+        sweet = db.session.get(Sweet, 1)
+        remaining, reserved = sweet.quantity, sweet.reserved
+
+    assert sum(sold) == stock, f"sold {sum(sold)} of {stock}"
+    assert (remaining, reserved) == (0, 0)
+    return {
+        "mode": mode,
+        "threads": threads,
+        "sold": sum(sold),
+        "purchases_per_sec": round(sum(sold) / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stock", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--quota", type=int, default=100)
+    args = parser.parse_args()
+
+    for mode in ("direct", "hot"):
+        print(json.dumps(run(mode, args.stock, args.threads, args.quota)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Password verification throughput, inline vs. the process pool.
+
+Simulates a login storm: ``--clients`` threads verify passwords as fast as
+they can. Inline hashing is capped at roughly one core by the GIL; the pool
+should scale with its worker count.
+
+    python -m benchmarks.bench_password_hashing --workers 0 2 4
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from app.passwords import PasswordHasher
+
+
+def run(method, workers, clients, logins):
+    hasher = PasswordHasher(method=method, workers=workers)
+    password_hash = hasher.hash("benchmark-password")
+    per_client = logins // clients
+
+    def client():
+        for _ in range(per_client):
+            assert hasher.verify(password_hash, "benchmark-password")
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+
+    rate = per_client * clients / elapsed
+    cores = min(workers, os.cpu_count() or 1) or 1
+    return {
+        "method": method,
+        "workers": workers,
+        "clients": clients,
+        "logins_per_sec": round(rate, 1),
+        "logins_per_sec_per_core": round(rate / cores, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--method", default="scrypt")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count() or 1])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        print(json.dumps(run(args.method, workers, args.clients, args.logins)))
+
+
+if __name__ == "__main__":
+    main()
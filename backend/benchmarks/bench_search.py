@@ -0,0 +1,57 @@
+"""Search latency at growing catalog sizes.
+
+Compares name search through the trigram index against the plain
+``LIKE '%...%'`` scan, and the category + price range query that the
+composite index serves.
+
+    python -m benchmarks.bench_search --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+
+from app import db
+from app.search_index import get_search_index, load_names
+from app.services.sweet_services import list_sweets, search_filters
+from benchmarks.common import make_app, measure, seed_sweets, summarize
+
+# Brand-style queries match a handful of rows, which is what the index is for
+QUERIES = ["kajumo", "zomita", "chanel"]
+
+
+def run(size, repeat):
+    app = make_app()
+    with app.app_context():
+        seed_sweets(size)
+        results = {"rows": size}
+
+        def name_search(indexed):
+            app.config["SEARCH_INDEX_ENABLED"] = indexed
+            for q in QUERIES:
+                list_sweets(filters=search_filters(name=q))
+
+        # Build the index up front; searches would otherwise use SQL until the background load lands
+        load_ms = measure(lambda: get_search_index().refresh(load_names), 1)[0]
+        results["index_load_ms"] = round(load_ms, 1)
+
+        results["name_like_scan"] = summarize(measure(lambda: name_search(False), repeat))
+        results["name_trigram_index"] = summarize(measure(lambda: name_search(True), repeat))
+        results["category_price_range"] = summarize(measure(
+            lambda: list_sweets(filters=search_filters(category="Cake", price_min=10, price_max=12)),
+            repeat,
+        ))
+        db.drop_all()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(json.dumps(run(size, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
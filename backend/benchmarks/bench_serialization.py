@@ -0,0 +1,64 @@
+"""Cost of turning a catalog listing into a JSON body.
+
+Times four ways of encoding the full ``GET /api/sweets`` payload:
+
+* ``orm_stdlib``: load ``Sweet`` entities, build dicts, ``json.dumps``
+  (how the route worked before the serializer layer);
+* ``rows_stdlib``: select column tuples, build dicts, ``json.dumps``;
+* ``rows_provider``: the same through ``app.json`` (orjson when installed);
+* ``fragments_warm``: ``list_sweets_json`` with a warm fragment cache,
+  which is what a listing costs after a write invalidates the catalog
+  cache but leaves most rows unchanged.
+
+    python -m benchmarks.bench_serialization --sizes 1000 10000 100000
+"""
+import argparse
+import json
+
+from flask import current_app
+
+from app import db
+from app.models import Sweet
+from app.serializers import SWEET_FIELDS, orjson, sweet_to_dict
+from app.services.sweet_services import list_sweets_json, sweets_query
+from benchmarks.common import make_app, measure, seed_sweets, summarize
+
+
+def run(size, repeat):
+    app = make_app()
+    with app.app_context():
+        seed_sweets(size)
+        results = {"rows": size, "orjson": orjson is not None}
+
+        def orm_stdlib():
+            db.session.expunge_all()
+            return json.dumps([sweet_to_dict(s) for s in Sweet.query.all()])
+
+        def rows_stdlib():
+            rows = db.session.execute(sweets_query(SWEET_FIELDS)).all()
+            return json.dumps([dict(zip(SWEET_FIELDS, row)) for row in rows])
+
+        def rows_provider():
+            rows = db.session.execute(sweets_query(SWEET_FIELDS)).all()
+            return current_app.json.dumps([dict(zip(SWEET_FIELDS, row)) for row in rows])
+
+        assert json.loads(orm_stdlib()) == json.loads(list_sweets_json())
+        for name, fn in [("orm_stdlib", orm_stdlib), ("rows_stdlib", rows_stdlib),
+                         ("rows_provider", rows_provider), ("fragments_warm", list_sweets_json)]:
+            results[name] = summarize(measure(fn, repeat))
+        db.drop_all()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(json.dumps(run(size, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Cold-start cost of a worker: imports, ``create_app`` and the first request.
+
+Each run is a fresh interpreter, the way a new gunicorn worker or
+serverless instance starts. The timings are:
+
+* ``libraries``: importing Flask, SQLAlchemy and the extensions.
+* ``app``: our own code on top of that, through ``create_app``.
+* ``first_request``: one authenticated ``GET /api/sweets``, including the
+  first database connection.
+* ``forked_first_request``: the same request in a worker forked from the
+  warm process, as with ``gunicorn --preload`` (see app/prefork.py).
+
+With ``--check`` the fastest run must also fit the budgets below, and the
+exit status is non-zero if it does not. CI runs the same check through
+``tests/test_prefork.py`` with ``STARTUP_BUDGET_TESTS=1``; it is skipped
+otherwise, since timings on a busy machine are noise.
+
+    python -m benchmarks.bench_startup --runs 10
+    python -m benchmarks.bench_startup --check
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous next to a typical run (about 0.7 s cold, under 0.2 s of it ours),
+# but a regression of our own import or setup cost, or a preloaded worker
+# that no longer forks warm, still goes over.
+BUDGETS_MS = {
+    "cold_start_ms": 3000,
+    "app_ms": 500,
+    "forked_first_request_ms": 250,
+}
+
+PROBE = r"""
+import json, os, sys, tempfile, time
+
+started = time.perf_counter()
+import flask, flask_cors, flask_jwt_extended, flask_sqlalchemy, sqlalchemy.orm
+libraries = time.perf_counter()
+from app import create_app, db
+imported = time.perf_counter()
+app = create_app({
+    "TESTING": True,
+    "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(tempfile.mkdtemp(), "startup.db"),
+    "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+    "JWT_SECRET_KEY": "startup-benchmark-secret-key-long-enough",
+})
+created = time.perf_counter()
+
+from flask_jwt_extended import create_access_token
+with app.app_context():
+    db.create_all()
+    db.engine.dispose()
+    headers = {"Authorization": "Bearer " + create_access_token(identity="bench")}
+
+def first_request():
+    response = app.test_client().get("/api/sweets", headers=headers)
+    assert response.status_code == 200, response.status_code
+
+read_fd, write_fd = os.pipe()
+forked = time.perf_counter()
+if os.fork() == 0:
+    first_request()
+    os.write(write_fd, str(time.perf_counter() - forked).encode())
+    os._exit(0)
+os.wait()
+forked_first_request = float(os.read(read_fd, 64))
+
+before_request = time.perf_counter()
+first_request()
+done = time.perf_counter()
+print(json.dumps({
+    "libraries_ms": (libraries - started) * 1000,
+    "app_ms": (created - libraries) * 1000,
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (done - before_request) * 1000,
+    "cold_start_ms": (created - started + done - before_request) * 1000,
+    "forked_first_request_ms": forked_first_request * 1000,
+}))
+"""
+
+
+def measure():
+    """Start one fresh interpreter and return its timings in milliseconds."""
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(runs):
+    samples = [measure() for _ in range(runs)]
+    return {
+        key: round(statistics.median(sample[key] for sample in samples), 1)
+        for key in samples[0]
+    }
+
+
+def over_budget(runs):
+    """Budgets the fastest of ``runs`` runs exceeds, as ``{key: (ms, budget)}``."""
+    samples = [measure() for _ in range(runs)]
+    best = {key: min(sample[key] for sample in samples) for key in BUDGETS_MS}
+    return {key: (best[key], budget) for key, budget in BUDGETS_MS.items() if best[key] >= budget}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="exit 1 if over the startup budgets")
+    args = parser.parse_args()
+    if args.check:
+        failures = over_budget(args.runs)
+        for key, (ms, budget) in failures.items():
+            print(f"{key}: {ms:.1f} ms, budget {budget} ms")
+        sys.exit(1 if failures else 0)
+    print(json.dumps({"runs": args.runs, **run(args.runs)}))
+
+
+if __name__ == "__main__":
+    main()
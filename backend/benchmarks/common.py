@@ -0,0 +1,97 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks run from the backend directory, e.g.
+``python -m benchmarks.bench_search``. They default to a throwaway SQLite
+file; set ``DATABASE_URL`` to point them at MySQL or Postgres instead.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models import Sweet
+
+WORDS = [
+    "kaju", "katli", "ladoo", "barfi", "peda", "jalebi", "rasgulla", "halwa",
+    "chocolate", "truffle", "vanilla", "cupcake", "caramel", "fudge", "mint",
+    "velvet", "cookie", "lemon", "tart", "almond", "pista", "mango", "rose",
+    "coconut", "saffron", "honey", "toffee", "praline", "nougat", "sponge",
+]
+SYLLABLES = ["ka", "ju", "mo", "ti", "ra", "sa", "be", "lu", "no", "pi",
+             "da", "ve", "zo", "mi", "ta", "ch", "an", "el", "or", "us"]
+CATEGORIES = ["Indian", "Cake", "Chocolate", "Fudge", "Cookie", "Tart", "Ice Cream"]
+
+
+def make_app(**overrides):
+    url = os.getenv("DATABASE_URL")
+    if url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="sweetshop-bench-"), "bench.db")
+        url = f"sqlite:///{path}"
+    config = {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": url,
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "JWT_SECRET_KEY": "benchmark-secret-key-of-reasonable-length",
+    }
+    config.update(overrides)
+    app = create_app(config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def sweet_rows(count, seed=42):
+    rng = random.Random(seed)
+    for _ in range(count):
+        brand = "".join(rng.choice(SYLLABLES) for _ in range(3))
+        name = " ".join([brand] + rng.sample(WORDS, 2)).title()
+        yield {
+            "name": name,
+            "name_lower": name.lower(),
+            "category": rng.choice(CATEGORIES),
+            "price": round(rng.uniform(1, 50), 2),
+            "quantity": rng.randint(0, 500),
+        }
+
+
+def seed_sweets(count, batch_size=10000):
+    """Insert ``count`` generated sweets; call inside an app context."""
+    batch = []
+    for row in sweet_rows(count):
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(insert(Sweet), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Sweet), batch)
+    db.session.commit()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn, repeat):
+    """Call ``fn`` ``repeat`` times and return latencies in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def summarize(samples):
+    return {
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+    }
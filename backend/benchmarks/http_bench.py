@@ -0,0 +1,272 @@
+"""End-to-end HTTP benchmark for the API.
+
+Seeds a catalog of ``--size`` sweets plus an admin and a regular user, then
+drives each scenario with ``--clients`` concurrent clients and reports
+throughput, latency percentiles, error counts and process memory. Results
+are written as JSON, tagged with the git commit, so runs can be compared:
+
+    python -m benchmarks.http_bench --size 10000 --clients 8 --output before.json
+    python -m benchmarks.http_bench --size 10000 --clients 8 --compare before.json
+
+By default requests go through Flask's test client in this process against
+a throwaway SQLite file, so nothing needs to be running. To measure a real
+server (gunicorn, a MySQL/Postgres-backed deployment), point
+``DATABASE_URL`` at the server's database so the seed data lands there and
+pass ``--url http://127.0.0.1:5000``. Seeding drops and recreates the tables,
+so only ever use a benchmark database.
+
+The in-process app runs with ``TESTING`` off, so the ledger writes in the
+background as in production. Admission control is left off, as the README
+recommends for load tests, since rate limits would turn the runs into 429s.
+Both settings are recorded under ``config`` in the results.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import resource
+import subprocess
+import threading
+import time
+import urllib.parse
+
+from app import db
+from app.models import User
+from benchmarks.common import make_app, percentile, seed_sweets
+
+SCENARIOS = ("login", "list", "list_page", "search", "purchase", "restock", "crud")
+PASSWORD = "bench-password"
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self._client.open(path, method=method, json=body, headers=headers)
+        data = response.get_data()
+        return response.status_code, data
+
+
+class HttpClient:
+    """Keep-alive HTTP client, one connection per benchmark thread."""
+
+    def __init__(self, base_url):
+        parsed = urllib.parse.urlsplit(base_url)
+        cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self._connection = cls(parsed.hostname, parsed.port, timeout=30)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        try:
+            self._connection.request(method, path, body=payload, headers=headers)
+            response = self._connection.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            self._connection.close()
+            raise
+
+
+def seed(app, size):
+    with app.app_context():
+        seed_sweets(size)
+        for username, is_admin in (("bench-admin", True), ("bench-user", False)):
+            user = User(username=username, is_admin=is_admin)
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        db.session.commit()
+
+
+def login(client, username):
+    status, body = client.request("POST", "/api/auth/login",
+                                  {"username": username, "password": PASSWORD})
+    if status != 200:
+        raise RuntimeError(f"login as {username} failed with {status}")
+    return {"Authorization": f"Bearer {json.loads(body)['access_token']}"}
+
+
+def scenario_steps(name, size, user, admin, rng):
+    """Return a callable issuing one logical operation for ``name``.
+
+    Each call returns a list of ``(status, seconds)`` pairs, one per HTTP
+    request it made.
+    """
+    def timed(client, method, path, body=None, headers=None):
+        started = time.perf_counter()
+        status, _ = client.request(method, path, body, headers)
+        return status, time.perf_counter() - started
+
+    def sweet_id():
+        return rng.randint(1, size)
+
+    if name == "login":
+        return lambda c: [timed(c, "POST", "/api/auth/login",
+                                {"username": "bench-user", "password": PASSWORD})]
+    if name == "list":
+        return lambda c: [timed(c, "GET", "/api/sweets", headers=user)]
+    if name == "list_page":
+        return lambda c: [timed(c, "GET", f"/api/sweets?limit=50&cursor={sweet_id()}", headers=user)]
+    if name == "search":
+        terms = ["kaju", "velvet", "mango", "chanel", "toffee"]
+        return lambda c: [timed(
+            c, "GET",
+            f"/api/sweets/search?search={rng.choice(terms)}&price_max={rng.randint(5, 50)}",
+            headers=user,
+        )]
+    if name == "purchase":
+        return lambda c: [timed(c, "POST", f"/api/inventory/{sweet_id()}/purchase", headers=user)]
+    if name == "restock":
+        return lambda c: [timed(c, "POST", f"/api/inventory/{sweet_id()}/restock", headers=admin)]
+    if name == "crud":
+        def crud(c):
+            name = f"Bench Sweet {rng.randint(0, 10 ** 9)}"
+            results = [timed(c, "POST", "/api/sweets",
+                             {"name": name, "category": "Bench", "price": 5, "quantity": 10},
+                             headers=admin)]
+            query = urllib.parse.urlencode({"search": name.lower()})
+            status, body = c.request("GET", f"/api/sweets/search?{query}", headers=admin)
+            created = json.loads(body) if status == 200 else []
+            if created:
+                new_id = created[0]["id"]
+                results.append(timed(c, "PUT", f"/api/sweets/{new_id}", {"price": 6}, headers=admin))
+                results.append(timed(c, "DELETE", f"/api/sweets/{new_id}", headers=admin))
+            return results
+        return crud
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def run_scenario(name, make_client, operations, clients, size, user, admin):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    per_client = max(operations // clients, 1)
+
+    def worker(seed_value):
+        client = make_client()
+        step = scenario_steps(name, size, user, admin, random.Random(seed_value))
+        local = []
+        for _ in range(per_client):
+            try:
+                local.extend(step(client))
+            except Exception:
+                local.append(("error", 0.0))
+        with lock:
+            for status, seconds in local:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status != "error":
+                    latencies.append(seconds)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    requests = sum(statuses.values())
+    errors = sum(n for status, n in statuses.items() if status == "error" or status >= 500)
+    result = {
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+    if latencies:
+        result.update({
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        })
+    result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline_path} (commit {baseline.get('commit')}):")
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        for metric in ("throughput_rps", "p50_ms", "p99_ms"):
+            if metric in result and before.get(metric):
+                change = (result[metric] - before[metric]) / before[metric] * 100
+                print(f"  {name:10} {metric:15} {before[metric]:>10} -> {result[metric]:>10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000, help="Sweets to seed.")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients.")
+    parser.add_argument("--requests", type=int, default=800, help="Operations per scenario.")
+    parser.add_argument("--login-requests", type=int, default=80,
+                        help="Operations for the login scenario, which is deliberately CPU-bound.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--url", help="Benchmark a running server instead of an in-process app.")
+    parser.add_argument("--output", help="Write the JSON results here.")
+    parser.add_argument("--compare", help="A previous results file to diff against.")
+    args = parser.parse_args()
+
+    app = make_app(
+        TESTING=False,
+        SQLALCHEMY_ENGINE_OPTIONS={"connect_args": {"timeout": 30}} if not os.getenv("DATABASE_URL") else {},
+    )
+    seed(app, args.size)
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        make_client = lambda: InProcessClient(app)
+
+    setup_client = make_client()
+    user = login(setup_client, "bench-user")
+    admin = login(setup_client, "bench-admin")
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "target": args.url or "in-process",
+        "database": app.config["SQLALCHEMY_DATABASE_URI"].split("@")[-1],
+        "size": args.size,
+        "clients": args.clients,
+        "config": {
+            "testing": app.testing,
+            "admission_control": "admission" in app.extensions,
+            "ledger_flush_interval": app.extensions["ledger"].flush_interval,
+        },
+        "scenarios": {},
+    }
+    for name in args.scenarios:
+        operations = args.login_requests if name == "login" else args.requests
+        result = run_scenario(name, make_client, operations, args.clients, args.size, user, admin)
+        results["scenarios"][name] = result
+        print(json.dumps({"scenario": name, **result}))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
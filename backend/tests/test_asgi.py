@@ -0,0 +1,111 @@
+import asyncio
+import json
+import pytest
+from app import create_app, db
+from app.models import Sweet
+from flask_jwt_extended import create_access_token
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+httpx = pytest.importorskip("httpx")
+
+from app.asgi import async_database_url, create_asgi_app
+
+
+@pytest.fixture
+def asgi_app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'asgi.db'}",
+        "JWT_SECRET_KEY": "test-secret-key",
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Sweet(name="Kaju Katli", category="Indian", price=25.0, quantity=5),
+            Sweet(name="Brownie", category="Western", price=4.0, quantity=8),
+            Sweet(name="Kaju Roll", category="Indian", price=30.0, quantity=2),
+        ])
+        db.session.commit()
+        token = create_access_token(identity="user", additional_claims={"is_admin": False})
+
+    asgi = create_asgi_app(app)
+    yield asgi, {"Authorization": f"Bearer {token}"}
+
+    asyncio.run(asgi.engine.dispose())
+    with app.app_context():
+        db.drop_all()
+
+
+def call(asgi, method, url, **kwargs):
+    async def go():
+        transport = httpx.ASGITransport(app=asgi)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+    return asyncio.run(go())
+
+
+def test_async_database_url():
+    assert str(async_database_url("sqlite:///shop.db")) == "sqlite+aiosqlite:///shop.db"
+    assert str(async_database_url("mysql://root@db/shop")) == "mysql+aiomysql://root@db/shop"
+    with pytest.raises(ValueError):
+        async_database_url("sqlite:///:memory:")
+
+
+def test_native_catalog_matches_flask(asgi_app):
+    asgi, headers = asgi_app
+    flask_client = asgi.flask_app.test_client()
+
+    for url in ("/api/sweets", "/api/sweets?limit=2", "/api/sweets?limit=2&cursor=2&fields=name",
+                "/api/sweets/search?search=kaju&price_max=26"):
+        native = call(asgi, "GET", url, headers=headers)
+        expected = flask_client.get(url, headers=headers)
+        assert native.status_code == expected.status_code == 200
+        assert native.json() == expected.get_json()
+        assert native.headers["ETag"] == expected.headers["ETag"]
+        assert "Server-Timing" in native.headers
+
+    page = call(asgi, "GET", "/api/sweets?limit=2", headers=headers).json()
+    assert page["next_cursor"] == 2
+
+    etag = call(asgi, "GET", "/api/sweets", headers=headers).headers["ETag"]
+    assert call(asgi, "GET", "/api/sweets", headers=dict(headers, **{"If-None-Match": etag})).status_code == 304
+
+
+def test_native_catalog_streams_and_checks_auth(asgi_app):
+    asgi, headers = asgi_app
+
+    response = call(asgi, "GET", "/api/sweets/search?category=Indian&stream=1", headers=headers)
+    assert response.headers["Content-Type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["name"] for line in response.text.splitlines()] == ["Kaju Katli", "Kaju Roll"]
+
+    assert call(asgi, "GET", "/api/sweets").status_code == 401
+    assert call(asgi, "GET", "/api/sweets?limit=0", headers=headers).status_code == 400
+
+
+def test_other_routes_fall_back_to_flask(asgi_app):
+    asgi, headers = asgi_app
+    response = call(asgi, "POST", "/api/inventory/1/purchase", json={"quantity": 2}, headers=headers)
+    assert response.status_code == 200
+
+    # The write invalidates the catalog cache the native path reads through
+    sweets = call(asgi, "GET", "/api/sweets", headers=headers).json()
+    assert sweets[0]["quantity"] == 3
+
+
+def test_native_stock_stream(asgi_app):
+    asgi, headers = asgi_app
+    asgi.flask_app.config.update(STREAM_HEARTBEAT_SECONDS=0.05, STREAM_MAX_SECONDS=0.2)
+    assert call(asgi, "GET", f"/api/inventory/stream?jwt={headers['Authorization'].split()[1]}").status_code == 401
+    token = call(asgi, "POST", "/api/inventory/stream-token", headers=headers).json()["stream_token"]
+
+    opened = call(asgi, "GET", f"/api/inventory/stream?jwt={token}")
+    assert opened.headers["Content-Type"].startswith("text/event-stream")
+    ready_id = opened.text.split("id: ", 1)[1].split("\n", 1)[0]
+
+    call(asgi, "POST", "/api/inventory/3/purchase", headers=headers)
+    resumed = call(asgi, "GET", "/api/inventory/stream", headers=dict(headers, **{"Last-Event-ID": ready_id}))
+    data = next(line[6:] for line in resumed.text.splitlines() if line.startswith("data: {\"sweets\""))
+    assert json.loads(data) == {"sweets": [{"id": 3, "name": "Kaju Roll", "category": "Indian",
+                                            "price": 30.0, "quantity": 1}], "deleted": []}
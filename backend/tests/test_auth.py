@@ -1,6 +1,10 @@
+import time
+from datetime import timedelta
 import pytest
 from app import create_app, db
-from app.models import User
+from app.models import RevokedToken, User
+from app.passwords import PasswordHasher
+from app.revocation import RevocationList, RevocationListFull, TokenRevoker, _to_datetime
 
 @pytest.fixture
 def client():
@@ -68,4 +72,183 @@ def test_login_nonexistent_user(client):
         "password": "ghostpass"
     })
     assert response.status_code == 401
-    assert response.get_json()["msg"] == "Invalid credentials"
\ No newline at end of file
+    assert response.get_json()["msg"] == "Invalid credentials"
+
+@pytest.fixture
+def fast_hash_app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_login_rehashes_when_parameters_change(fast_hash_app):
+    client = fast_hash_app.test_client()
+    client.post("/api/auth/register", json={"username": "testuser", "password": "testpass"})
+    old_hash = User.query.filter_by(username="testuser").first().password_hash
+    assert old_hash.startswith("pbkdf2:sha256:1000$")
+
+    fast_hash_app.extensions["password_hasher"] = PasswordHasher(method="pbkdf2:sha256:2000")
+    response = client.post("/api/auth/login", json={"username": "testuser", "password": "testpass"})
+    assert response.status_code == 200
+
+    db.session.expire_all()
+    new_hash = User.query.filter_by(username="testuser").first().password_hash
+    assert new_hash.startswith("pbkdf2:sha256:2000$")
+
+    # The upgraded hash keeps working
+    response = client.post("/api/auth/login", json={"username": "testuser", "password": "testpass"})
+    assert response.status_code == 200
+
+def test_password_hasher_process_pool():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=1)
+    try:
+        password_hash = hasher.hash("s3cret")
+        assert hasher.verify(password_hash, "s3cret")
+        assert not hasher.verify(password_hash, "wrong")
+        assert not hasher.needs_rehash(password_hash)
+    finally:
+        hasher.shutdown()
+
+def test_logout_revokes_token(fast_hash_app):
+    client = fast_hash_app.test_client()
+    client.post("/api/auth/register", json={"username": "testuser", "password": "testpass"})
+    token = client.post(
+        "/api/auth/login", json={"username": "testuser", "password": "testpass"}
+    ).get_json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/api/sweets", headers=headers).status_code == 200
+    assert client.post("/api/auth/logout", headers=headers).status_code == 200
+
+    response = client.get("/api/sweets", headers=headers)
+    assert response.status_code == 401
+    assert response.get_json()["msg"] == "Token has been revoked"
+
+def test_revocations_are_shared_through_the_table(fast_hash_app):
+    fast_hash_app.extensions["token_revoker"] = TokenRevoker(persist=True, sync_seconds=0)
+    other_worker = TokenRevoker(persist=True, sync_seconds=0)
+
+    expires_at = time.time() + 60
+    fast_hash_app.extensions["token_revoker"].revoke("abc", expires_at)
+
+    assert other_worker.is_revoked("abc")
+    assert not other_worker.is_revoked("xyz")
+
+def test_sync_picks_up_rows_stamped_behind_the_watermark(fast_hash_app):
+    other_worker = TokenRevoker(persist=True, sync_seconds=0)
+    expires_at = time.time() + 60
+    TokenRevoker(persist=True).revoke("late", expires_at)
+    other_worker.sync()
+
+    # Another worker's clock runs behind, or its commit landed late
+    db.session.add(RevokedToken(
+        jti="skewed",
+        expires_at=_to_datetime(expires_at),
+        revoked_at=other_worker._synced_through - timedelta(seconds=30),
+    ))
+    db.session.commit()
+
+    assert other_worker.is_revoked("skewed")
+
+def test_revocation_list_is_bounded_and_expires():
+    revoked = RevocationList(maxsize=2)
+    now = time.time()
+    revoked.revoke("old", now - 1)
+    revoked.revoke("a", now + 60)
+    revoked.revoke("b", now + 60)
+
+    # The expired entry is purged before any live one is evicted
+    assert len(revoked) == 2
+    assert revoked.is_revoked("a") and revoked.is_revoked("b")
+
+    # Live entries are never evicted to make room
+    with pytest.raises(RevocationListFull):
+        revoked.revoke("c", now + 60)
+    assert revoked.is_revoked("a") and revoked.is_revoked("b")
+    assert not revoked.is_revoked("c")
+
+def test_logout_is_refused_when_revocation_list_is_full(fast_hash_app):
+    fast_hash_app.extensions["token_revoker"] = TokenRevoker(maxsize=0)
+    client = fast_hash_app.test_client()
+    client.post("/api/auth/register", json={"username": "testuser", "password": "testpass"})
+    token = client.post("/api/auth/login", json={"username": "testuser", "password": "testpass"}).get_json()["access_token"]
+
+    response = client.post("/api/auth/logout", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 503
+
+def test_full_revocation_list_falls_back_to_the_table(fast_hash_app):
+    revoker = TokenRevoker(maxsize=1, persist=True, sync_seconds=0)
+    expires_at = time.time() + 60
+    revoker.revoke("a", expires_at)
+    revoker.revoke("b", expires_at)
+
+    assert revoker.is_revoked("a") and revoker.is_revoked("b")
+    assert not revoker.is_revoked("c")
+    assert TokenRevoker(maxsize=1, persist=True, sync_seconds=0).is_revoked("b")
+
+def test_login_is_rate_limited_per_address():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'RATE_LIMITS': {'login': (0.01, 3)},
+    })
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        credentials = {"username": "nobody", "password": "guess"}
+
+        assert [client.post("/api/auth/login", json=credentials).status_code for _ in range(3)] == [401] * 3
+        response = client.post("/api/auth/login", json=credentials)
+        assert response.status_code == 429
+        assert 1 <= int(response.headers["Retry-After"]) <= 100
+
+        # Another address has its own budget
+        other = client.post("/api/auth/login", json=credentials, environ_base={"REMOTE_ADDR": "10.0.0.2"})
+        assert other.status_code == 401
+        db.drop_all()
+
+
+def test_login_rate_limit_uses_forwarded_address_behind_trusted_proxy():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'RATE_LIMITS': {'login': (0.01, 1)},
+        'TRUSTED_PROXIES': 1,
+    })
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        credentials = {"username": "nobody", "password": "guess"}
+
+        def login(client_address):
+            return client.post("/api/auth/login", json=credentials,
+                               headers={"X-Forwarded-For": client_address}).status_code
+
+        # Every request arrives from the proxy's address, but each client has its own bucket
+        assert [login("203.0.113.1"), login("203.0.113.1"), login("203.0.113.2")] == [401, 429, 401]
+        db.drop_all()
+
+
+def test_rate_limits_must_refill():
+    for limit in ((0, 10), (-1, 10), (1, 0)):
+        with pytest.raises(ValueError):
+            create_app({
+                'TESTING': True,
+                'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                'JWT_SECRET_KEY': 'test-secret-key',
+                'RATE_LIMITS': {'login': limit},
+            })
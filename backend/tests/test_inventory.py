@@ -1,7 +1,17 @@
+import json
+import threading
+import time
 import pytest
 from app import create_app, db
-from app.models import User, Sweet
+from datetime import datetime, timedelta
+from app.models import (
+    User, Sweet, InventoryMovement, InventoryDailyTotal, SweetSalesTotal, CategorySalesTotal,
+)
 from flask_jwt_extended import create_access_token
+from app.hotkeys import HotKeyAllocator
+from app.ledger import MovementLedger
+from app.services.analytics_services import low_stock
+from app.services.inventory_services import purchase_sweet, OutOfStock, SweetNotFound
 
 @pytest.fixture
 def app_with_context():
@@ -126,4 +136,805 @@ def test_restock_sweet_non_admin(client, user_token):
         )
         
         assert response.status_code == 403
-        assert response.get_json()["msg"] == "Admin only"
\ No newline at end of file
+        assert response.get_json()["msg"] == "Admin only"
+
+def test_purchase_sweet_not_found(client, admin_token):
+    response = client.post(
+        "/api/inventory/9999/purchase",
+        headers={"Authorization": f"Bearer {admin_token}"}
+    )
+
+    assert response.status_code == 404
+    assert response.get_json()["msg"] == "Sweet not found"
+
+def test_purchase_multiple_units(client, admin_token):
+    with client.application.app_context():
+        sweet = Sweet.query.first()
+
+        response = client.post(
+            f"/api/inventory/{sweet.id}/purchase",
+            json={"quantity": 4},
+            headers={"Authorization": f"Bearer {admin_token}"}
+        )
+        assert response.status_code == 200
+
+        # Asking for more than what is left must not touch the stock
+        response = client.post(
+            f"/api/inventory/{sweet.id}/purchase",
+            json={"quantity": 7},
+            headers={"Authorization": f"Bearer {admin_token}"}
+        )
+        assert response.status_code == 400
+        assert response.get_json()["msg"] == "Out of stock"
+
+        db.session.expire_all()
+        assert db.session.get(Sweet, sweet.id).quantity == 6
+
+def test_purchase_invalid_quantity(client, admin_token):
+    with client.application.app_context():
+        sweet = Sweet.query.first()
+
+        response = client.post(
+            f"/api/inventory/{sweet.id}/purchase",
+            json={"quantity": 0},
+            headers={"Authorization": f"Bearer {admin_token}"}
+        )
+        assert response.status_code == 400
+
+def test_concurrent_purchases_never_oversell(tmp_path):
+    """Hammer a single sweet from many threads and check stock stays consistent"""
+    stock = 200
+    threads = 16
+    attempts_per_thread = 25
+
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'stress.db'}",
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30}},
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False
+    })
+    with app.app_context():
+        db.create_all()
+        sweet = Sweet(name='Rasgulla', category='Indian', price=12.0, quantity=stock)
+        db.session.add(sweet)
+        db.session.commit()
+        sweet_id = sweet.id
+        token = create_access_token(identity="user", additional_claims={"is_admin": False})
+
+    statuses = []
+    lock = threading.Lock()
+
+    def buyer():
+        client = app.test_client()
+        for _ in range(attempts_per_thread):
+            response = client.post(
+                f"/api/inventory/{sweet_id}/purchase",
+                headers={"Authorization": f"Bearer {token}"}
+            )
+            with lock:
+                statuses.append(response.status_code)
+
+    workers = [threading.Thread(target=buyer) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    sold = statuses.count(200)
+    assert set(statuses) <= {200, 400}
+    assert sold == stock
+    assert statuses.count(400) == threads * attempts_per_thread - stock
+
+    with app.app_context():
+        assert db.session.get(Sweet, sweet_id).quantity == 0
+        db.drop_all()
+
+def test_checkout_multiple_items(client, user_token):
+    with client.application.app_context():
+        barfi = Sweet.query.first()
+        ladoo = Sweet(name='Ladoo', category='Indian', price=8.0, quantity=5)
+        db.session.add(ladoo)
+        db.session.commit()
+
+        response = client.post(
+            "/api/inventory/checkout",
+            json={"items": [{"id": barfi.id, "quantity": 3}, {"id": ladoo.id, "quantity": 5}]},
+            headers={"Authorization": f"Bearer {user_token}"}
+        )
+
+        assert response.status_code == 200
+        assert [item["status"] for item in response.get_json()["items"]] == ["purchased", "purchased"]
+
+        db.session.expire_all()
+        assert db.session.get(Sweet, barfi.id).quantity == 7
+        assert db.session.get(Sweet, ladoo.id).quantity == 0
+
+def test_checkout_is_all_or_nothing(client, user_token):
+    with client.application.app_context():
+        barfi = Sweet.query.first()
+        ladoo = Sweet(name='Ladoo', category='Indian', price=8.0, quantity=1)
+        db.session.add(ladoo)
+        db.session.commit()
+
+        response = client.post(
+            "/api/inventory/checkout",
+            json={"items": [
+                {"id": barfi.id, "quantity": 2},
+                {"id": ladoo.id, "quantity": 2},
+                {"id": 9999, "quantity": 1},
+            ]},
+            headers={"Authorization": f"Bearer {user_token}"}
+        )
+
+        assert response.status_code == 409
+        statuses = [item["status"] for item in response.get_json()["items"]]
+        assert statuses == ["available", "out_of_stock", "not_found"]
+
+        db.session.expire_all()
+        assert db.session.get(Sweet, barfi.id).quantity == 10
+        assert db.session.get(Sweet, ladoo.id).quantity == 1
+
+def test_checkout_requires_items(client, user_token):
+    response = client.post(
+        "/api/inventory/checkout",
+        json={"items": []},
+        headers={"Authorization": f"Bearer {user_token}"}
+    )
+    assert response.status_code == 400
+
+@pytest.fixture
+def hot_app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'HOT_SWEET_IDS': [1],
+        'HOT_KEY_QUOTA': 4,
+        'HOT_KEY_FLUSH_INTERVAL': 0,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(Sweet(name='Barfi', category='Indian', price=15.0, quantity=10))
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def stock(sweet_id=1):
+    db.session.expire_all()
+    sweet = db.session.get(Sweet, sweet_id)
+    return sweet.quantity, sweet.reserved
+
+def test_hot_key_purchases_are_written_behind(hot_app):
+    client = hot_app.test_client()
+    with hot_app.app_context():
+        token = create_access_token(identity="user", additional_claims={"is_admin": False})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for _ in range(3):
+        assert client.post("/api/inventory/1/purchase", headers=headers).status_code == 200
+
+    # One quota block reserved, no per-purchase writes yet
+    assert stock() == (10, 4)
+
+    assert hot_app.extensions["hot_keys"].flush() == 3
+    assert stock() == (7, 1)
+
+    hot_app.extensions["hot_keys"].release()
+    assert stock() == (7, 0)
+
+def test_hot_key_quota_never_oversells(hot_app):
+    workers = [
+        hot_app.extensions["hot_keys"],
+        HotKeyAllocator(hot_app, [1], quota=4, flush_interval=0),
+    ]
+    sold = 0
+    for _ in range(20):
+        for worker in workers:
+            try:
+                worker.purchase(1)
+                sold += 1
+            except OutOfStock:
+                pass
+
+    assert sold == 10
+    for worker in workers:
+        worker.flush()
+    assert stock() == (0, 0)
+
+def test_hot_key_direct_path_respects_reservations(hot_app):
+    hot_app.extensions["hot_keys"].purchase(1)
+    assert stock() == (10, 4)
+
+    # Only the unreserved 6 units can be sold through the direct path
+    hot_app.extensions.pop("hot_keys")
+    with pytest.raises(OutOfStock):
+        purchase_sweet(1, 7)
+    purchase_sweet(1, 6)
+    assert stock() == (4, 4)
+
+def test_hot_key_stock_edits_keep_reserved_units(hot_app):
+    hot_app.extensions["hot_keys"].purchase(1)
+    client = hot_app.test_client()
+    token = create_access_token(identity="admin", additional_claims={"is_admin": True})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.put("/api/sweets/1", json={"quantity": 2}, headers=headers)
+    assert response.status_code == 409
+    assert stock() == (10, 4)
+
+    response = client.patch(
+        "/api/sweets/bulk", json={"ids": [1], "set": {"quantity": 2}}, headers=headers
+    )
+    assert response.status_code == 200
+    assert stock() == (4, 4)
+
+def test_low_stock_counts_reserved_units_as_sold(hot_app):
+    hot_app.extensions["hot_keys"].purchase(1)
+    assert low_stock(threshold=5) == []
+    assert low_stock(threshold=6) == [
+        {"id": 1, "name": "Barfi", "category": "Indian", "quantity": 10, "available": 6},
+    ]
+
+def test_sweet_edits_cannot_touch_bookkeeping_columns(hot_app):
+    hot_app.extensions["hot_keys"].purchase(1)
+    client = hot_app.test_client()
+    token = create_access_token(identity="user", additional_claims={"is_admin": False})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for field, value in (("reserved", 0), ("version", 1), ("id", 5)):
+        response = client.put("/api/sweets/1", json={field: value}, headers=headers)
+        assert response.status_code == 400
+    assert stock() == (10, 4)
+    assert client.put("/api/sweets/1", json={"price": "nan"}, headers=headers).status_code == 400
+
+def test_quantity_floor_is_checked_in_the_update(hot_app):
+    client = hot_app.test_client()
+    token = create_access_token(identity="admin", additional_claims={"is_admin": True})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # A reservation made after the row was loaded must still hold the edit back
+    assert db.session.get(Sweet, 1).reserved == 0
+    hot_app.extensions["hot_keys"].purchase(1)
+    response = client.put("/api/sweets/1", json={"quantity": 3}, headers=headers)
+    assert response.status_code == 409
+    assert stock() == (10, 4)
+    response = client.put("/api/sweets/1", json={"quantity": 4}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["sweet"]["quantity"] == 4
+
+def test_hot_key_flush_for_deleted_sweet_drops_quota(hot_app, caplog):
+    hot_keys = hot_app.extensions["hot_keys"]
+    hot_keys.purchase(1, 2)
+    db.session.delete(db.session.get(Sweet, 1))
+    db.session.commit()
+
+    assert hot_keys.flush() == 0
+    assert "2 units sold" in caplog.text
+    with pytest.raises(SweetNotFound):
+        hot_keys.purchase(1)
+
+def test_purchases_and_restocks_are_recorded(client, admin_token, user_token):
+    with client.application.app_context():
+        sweet_id = Sweet.query.first().id
+
+        client.post(f"/api/inventory/{sweet_id}/purchase", json={"quantity": 2},
+                    headers={"Authorization": f"Bearer {user_token}"})
+        client.post("/api/inventory/checkout", json={"items": [{"id": sweet_id, "quantity": 3}]},
+                    headers={"Authorization": f"Bearer {user_token}"})
+        client.post(f"/api/inventory/{sweet_id}/restock",
+                    headers={"Authorization": f"Bearer {admin_token}"})
+        # Failed purchases leave no trace
+        client.post(f"/api/inventory/{sweet_id}/purchase", json={"quantity": 50},
+                    headers={"Authorization": f"Bearer {user_token}"})
+
+        movements = InventoryMovement.query.order_by(InventoryMovement.id).all()
+        assert [(m.username, m.kind, m.delta) for m in movements] == [
+            ("user", "purchase", -2),
+            ("user", "purchase", -3),
+            ("admin", "restock", 1),
+        ]
+
+def test_ledger_batches_writes_in_background(app_with_context):
+    ledger = MovementLedger(app_with_context, batch_size=3, flush_interval=60, compact_interval=0)
+    try:
+        for _ in range(2):
+            ledger.record(1, -1, "purchase", "user")
+        assert ledger.pending() == 2
+        assert InventoryMovement.query.count() == 0
+
+        # Reaching the batch size wakes the writer without waiting for the interval
+        ledger.record(1, -1, "purchase", "user")
+        deadline = time.monotonic() + 5
+        while ledger.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert ledger.pending() == 0
+    finally:
+        ledger.stop()
+    db.session.expire_all()
+    assert InventoryMovement.query.count() == 3
+
+def test_failed_batch_is_retried_without_evicting_new_movements(app_with_context, monkeypatch):
+    ledger = MovementLedger(app_with_context, batch_size=10, flush_interval=60, max_buffer=2,
+                            compact_interval=0)
+    try:
+        ledger.record(1, -1, "purchase", "user")
+        ledger.record(1, -2, "purchase", "user")
+
+        def fail(rows):
+            raise RuntimeError("database unavailable")
+        monkeypatch.setattr("app.ledger.apply_movements", fail)
+        with pytest.raises(RuntimeError):
+            ledger.flush()
+        monkeypatch.undo()
+
+        # The failed batch waits outside the buffer, which still takes two new rows
+        ledger.record(1, -3, "purchase", "user")
+        ledger.record(1, -4, "purchase", "user")
+        assert ledger.pending() == 4 and ledger.dropped == 0
+        assert ledger.flush() == 4
+    finally:
+        ledger.stop()
+    deltas = [m.delta for m in InventoryMovement.query.order_by(InventoryMovement.id)]
+    assert deltas == [-1, -2, -3, -4]
+
+def test_compaction_rolls_old_movements_into_daily_totals(app_with_context):
+    old_day = datetime(2020, 1, 1, 12, 0)
+    rows = [
+        InventoryMovement(sweet_id=1, username="user", kind="purchase", delta=-2, created_at=old_day),
+        InventoryMovement(sweet_id=1, username="user", kind="purchase", delta=-1,
+                          created_at=old_day + timedelta(hours=3)),
+        InventoryMovement(sweet_id=1, username="admin", kind="restock", delta=5, created_at=old_day),
+        InventoryMovement(sweet_id=1, username="user", kind="purchase", delta=-4,
+                          created_at=datetime.utcnow()),
+    ]
+    db.session.add_all(rows)
+    db.session.commit()
+
+    ledger = app_with_context.extensions["ledger"]
+    assert ledger.compact(days=1) == 3
+    assert ledger.compact(days=1) == 0
+    assert InventoryMovement.query.count() == 1
+
+    totals = {t.kind: (t.delta, t.movements) for t in InventoryDailyTotal.query}
+    assert totals == {"purchase": (-3, 2), "restock": (5, 1)}
+    assert InventoryDailyTotal.query.first().day == old_day.date()
+
+def test_reports_follow_purchases_and_restocks(client, admin_token, user_token):
+    user = {"Authorization": f"Bearer {user_token}"}
+    admin = {"Authorization": f"Bearer {admin_token}"}
+    with client.application.app_context():
+        barfi = Sweet.query.first()
+        db.session.add_all([
+            Sweet(name='Ladoo', category='Indian', price=8.0, quantity=20),
+            Sweet(name='Brownie', category='Western', price=4.0, quantity=3),
+        ])
+        db.session.commit()
+        ladoo, brownie = Sweet.query.filter(Sweet.id != barfi.id).order_by(Sweet.id).all()
+        barfi_id, ladoo_id, brownie_id = barfi.id, ladoo.id, brownie.id
+
+    client.post(f"/api/inventory/{barfi_id}/purchase", json={"quantity": 2}, headers=user)
+    client.post("/api/inventory/checkout", headers=user, json={"items": [
+        {"id": ladoo_id, "quantity": 5}, {"id": brownie_id, "quantity": 1},
+    ]})
+    client.post(f"/api/inventory/{brownie_id}/restock", headers=admin)
+
+    response = client.get("/api/inventory/reports/top-sellers?limit=2", headers=admin)
+    assert response.status_code == 200
+    assert [(r["name"], r["units_sold"], r["revenue"]) for r in response.get_json()] == [
+        ("Ladoo", 5, 40.0), ("Barfi", 2, 30.0),
+    ]
+
+    response = client.get("/api/inventory/reports/category-revenue", headers=admin)
+    assert response.get_json() == [
+        {"category": "Indian", "units_sold": 7, "revenue": 70.0},
+        {"category": "Western", "units_sold": 1, "revenue": 4.0},
+    ]
+
+    response = client.get("/api/inventory/reports/low-stock?threshold=8", headers=admin)
+    assert [(r["name"], r["quantity"]) for r in response.get_json()] == [("Brownie", 3), ("Barfi", 8)]
+
+    # Restocks are totalled too, and prices are captured on the ledger rows
+    with client.application.app_context():
+        assert db.session.get(SweetSalesTotal, brownie_id).units_restocked == 1
+        assert InventoryMovement.query.filter_by(sweet_id=ladoo_id).one().unit_price == 8.0
+
+def test_sales_keep_the_price_they_were_made_at(app_with_context):
+    ledger = MovementLedger(app_with_context, flush_interval=60, compact_interval=0)
+    sweet = Sweet.query.first()
+    try:
+        ledger.record(sweet.id, -2, "purchase", "user", unit_price=sweet.price, category=sweet.category)
+        sweet.price, sweet.category = 99.0, "Renamed"
+        db.session.commit()
+        assert ledger.flush() == 1
+    finally:
+        ledger.stop()
+    total = db.session.get(SweetSalesTotal, sweet.id)
+    assert total.revenue == 30.0
+    assert db.session.get(CategorySalesTotal, "Indian").units_sold == 2
+    assert db.session.get(CategorySalesTotal, "Renamed") is None
+
+def test_reports_are_admin_only(client, user_token):
+    response = client.get("/api/inventory/reports/top-sellers",
+                          headers={"Authorization": f"Bearer {user_token}"})
+    assert response.status_code == 403
+    assert client.get("/api/inventory/reports/low-stock").status_code == 401
+
+def test_restock_with_amount(client, admin_token, user_token):
+    with client.application.app_context():
+        sweet_id = Sweet.query.first().id
+
+    response = client.post(f"/api/inventory/{sweet_id}/restock", json={"quantity": 25},
+                           headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200
+    assert response.get_json()["quantity"] == 35
+
+    assert client.post(f"/api/inventory/{sweet_id}/restock", json={"quantity": -1},
+                       headers={"Authorization": f"Bearer {admin_token}"}).status_code == 400
+    assert client.post("/api/inventory/9999/restock",
+                       headers={"Authorization": f"Bearer {admin_token}"}).status_code == 404
+    assert client.post(f"/api/inventory/{sweet_id}/restock",
+                       headers={"Authorization": f"Bearer {user_token}"}).status_code == 403
+
+def test_batch_restock_applies_whole_manifest(client, admin_token):
+    with client.application.app_context():
+        barfi = Sweet.query.first()
+        ladoo = Sweet(name='Ladoo', category='Indian', price=8.0, quantity=0)
+        db.session.add(ladoo)
+        db.session.commit()
+        barfi_id, ladoo_id = barfi.id, ladoo.id
+
+    response = client.post("/api/inventory/restock/batch", headers={"Authorization": f"Bearer {admin_token}"},
+                           json={"items": [
+                               {"id": barfi_id, "quantity": 5},
+                               {"id": ladoo_id, "quantity": 40},
+                               {"id": barfi_id, "quantity": 1},
+                           ]})
+    assert response.status_code == 200
+    assert [(i["id"], i["status"], i["stock"]) for i in response.get_json()["items"]] == [
+        (barfi_id, "restocked", 16), (ladoo_id, "restocked", 40), (barfi_id, "restocked", 16),
+    ]
+
+    # One unknown sweet rejects the whole delivery
+    response = client.post("/api/inventory/restock/batch", headers={"Authorization": f"Bearer {admin_token}"},
+                           json={"items": [{"id": barfi_id, "quantity": 5}, {"id": 9999, "quantity": 1}]})
+    assert response.status_code == 409
+    assert [i["status"] for i in response.get_json()["items"]] == ["available", "not_found"]
+    with client.application.app_context():
+        assert db.session.get(Sweet, barfi_id).quantity == 16
+        restocked = InventoryMovement.query.filter_by(kind="restock").order_by(InventoryMovement.id)
+        assert [(m.sweet_id, m.delta) for m in restocked] == [(barfi_id, 6), (ladoo_id, 40)]
+
+def test_batch_restocks_and_purchases_race_without_lost_updates(tmp_path):
+    """Deliveries landing while buyers drain stock must not lose either side's writes"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'restock.db'}",
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30}},
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False
+    })
+    with app.app_context():
+        db.create_all()
+        sweets = [Sweet(name=f'Sweet {i}', category='Indian', price=5.0, quantity=10) for i in range(3)]
+        db.session.add_all(sweets)
+        db.session.commit()
+        ids = [s.id for s in sweets]
+        user = create_access_token(identity="user", additional_claims={"is_admin": False})
+        admin = create_access_token(identity="admin", additional_claims={"is_admin": True})
+
+    deliveries, buyers, rounds = 4, 8, 20
+    sold = {sweet_id: 0 for sweet_id in ids}
+    statuses = []
+    lock = threading.Lock()
+
+    def deliver():
+        client = app.test_client()
+        for _ in range(rounds):
+            response = client.post("/api/inventory/restock/batch",
+                                   json={"items": [{"id": i, "quantity": 2} for i in ids]},
+                                   headers={"Authorization": f"Bearer {admin}"})
+            with lock:
+                statuses.append(("restock", response.status_code))
+
+    def buy(n):
+        client = app.test_client()
+        for attempt in range(rounds):
+            sweet_id = ids[(n + attempt) % len(ids)]
+            response = client.post(f"/api/inventory/{sweet_id}/purchase",
+                                   headers={"Authorization": f"Bearer {user}"})
+            with lock:
+                statuses.append(("purchase", response.status_code))
+                if response.status_code == 200:
+                    sold[sweet_id] += 1
+
+    workers = [threading.Thread(target=deliver) for _ in range(deliveries)]
+    workers += [threading.Thread(target=buy, args=(n,)) for n in range(buyers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert {status for kind, status in statuses if kind == "restock"} == {200}
+    assert {status for kind, status in statuses if kind == "purchase"} <= {200, 400}
+    with app.app_context():
+        for sweet_id in ids:
+            quantity = db.session.get(Sweet, sweet_id).quantity
+            assert quantity == 10 + deliveries * rounds * 2 - sold[sweet_id]
+            assert quantity >= 0
+        db.drop_all()
+
+def read_event(chunks):
+    """The next ``(id, event, data)`` from a server-sent event stream, skipping keepalives"""
+    for chunk in chunks:
+        fields = dict(
+            line.split(": ", 1) for line in chunk.decode().splitlines() if line and not line.startswith(":")
+        )
+        if "event" in fields:
+            return fields.get("id"), fields["event"], json.loads(fields["data"])
+
+def test_stock_stream_pushes_changes(client, admin_token, user_token):
+    client.application.config["STREAM_HEARTBEAT_SECONDS"] = 0.05
+    with client.application.app_context():
+        barfi_id = Sweet.query.first().id
+
+    assert client.get("/api/inventory/stream").status_code == 401
+    # Access tokens stay out of the query string, and stream tokens only open streams
+    assert client.get(f"/api/inventory/stream?jwt={user_token}").status_code == 401
+    stream_token = client.post("/api/inventory/stream-token",
+                               headers={"Authorization": f"Bearer {user_token}"}).get_json()["stream_token"]
+    assert client.get("/api/sweets", headers={"Authorization": f"Bearer {stream_token}"}).status_code == 401
+    response = client.get(f"/api/inventory/stream?jwt={stream_token}", buffered=False)
+    assert response.mimetype == "text/event-stream"
+    chunks = iter(response.response)
+    ready_id, event, _ = read_event(chunks)
+    assert event == "ready"
+
+    client.post(f"/api/inventory/{barfi_id}/purchase", json={"quantity": 3},
+                headers={"Authorization": f"Bearer {user_token}"})
+    client.post(f"/api/inventory/{barfi_id}/restock", json={"quantity": 1},
+                headers={"Authorization": f"Bearer {admin_token}"})
+    # Both writes arrive as one message holding the latest row
+    event_id, event, data = read_event(chunks)
+    assert event == "sweets"
+    assert [(s["id"], s["quantity"]) for s in data["sweets"]] == [(barfi_id, 8)]
+    response.close()
+
+    client.delete(f"/api/sweets/{barfi_id}", headers={"Authorization": f"Bearer {admin_token}"})
+    # Reconnecting with Last-Event-ID replays only what was missed
+    response = client.get("/api/inventory/stream", buffered=False,
+                          headers={"Authorization": f"Bearer {user_token}", "Last-Event-ID": event_id})
+    _, event, data = read_event(iter(response.response))
+    assert (event, data) == ("sweets", {"sweets": [], "deleted": [barfi_id]})
+    response.close()
+
+    # An id from another process cannot be resumed
+    response = client.get("/api/inventory/stream", buffered=False,
+                          headers={"Authorization": f"Bearer {user_token}", "Last-Event-ID": "elsewhere-3"})
+    assert read_event(iter(response.response))[1] == "reset"
+    response.close()
+
+def test_stock_stream_resets_after_gaps_and_bulk_writes(client, admin_token):
+    from app.broadcast import StockBroadcaster, get_broadcaster
+
+    broadcaster = StockBroadcaster(buffer_size=2)
+    start, _ = broadcaster.open()
+    for sweet_id in (1, 2, 3):
+        broadcaster.publish([sweet_id])
+    # The first change has left the buffer
+    assert broadcaster.pending(start) == (3, None, None)
+    assert broadcaster.pending(1) == (3, {2, 3}, set())
+
+    # Listeners at the same position share one rendered message
+    fetches = []
+    fetch = lambda ids: fetches.append(ids) or []
+    assert broadcaster.message(1, fetch) == broadcaster.message(1, fetch)
+    assert fetches == [{2, 3}]
+
+    head, _ = get_broadcaster().open()
+    client.patch("/api/sweets/bulk", json={"filter": {"category": "Indian"}, "multiply": {"price": 2}},
+                 headers={"Authorization": f"Bearer {admin_token}"})
+    assert get_broadcaster().pending(head) == (head + 1, None, None)
+
+def admission_app(**config):
+    app = create_app(dict({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    }, **config))
+    with app.app_context():
+        db.create_all()
+        db.session.add(Sweet(name='Barfi', category='Indian', price=15.0, quantity=1000))
+        db.session.commit()
+        tokens = {
+            name: create_access_token(identity=name, additional_claims={"is_admin": False})
+            for name in ("alice", "bob")
+        }
+    return app, tokens
+
+def test_purchases_are_rate_limited_per_user():
+    app, tokens = admission_app(RATE_LIMITS={"purchase": (0.01, 2)})
+    client = app.test_client()
+
+    def buy(user):
+        return client.post("/api/inventory/1/purchase", headers={"Authorization": f"Bearer {tokens[user]}"})
+
+    assert [buy("alice").status_code for _ in range(3)] == [200, 200, 429]
+    assert buy("bob").status_code == 200
+    # Checkout draws from the same budget
+    response = client.post("/api/inventory/checkout", json={"items": [{"id": 1, "quantity": 1}]},
+                           headers={"Authorization": f"Bearer {tokens['alice']}"})
+    assert response.status_code == 429
+    with app.app_context():
+        assert db.session.get(Sweet, 1).quantity == 997
+        assert app.extensions["admission"].stats()["rate_limited"] == {"purchase": 2}
+
+def test_load_shedder_keeps_latency_bounded_under_overload(monkeypatch):
+    """Excess purchases are turned away at once instead of queueing behind slow ones"""
+    app, tokens = admission_app(CONCURRENCY_LIMITS={"purchase": 2}, ADMISSION_QUEUE_TIMEOUT=0.05)
+    work = 0.3
+
+    def slow_purchase(*args, **kwargs):
+        time.sleep(work)
+
+    monkeypatch.setattr("app.routes.inventory.purchase_sweet", slow_purchase)
+    results = []
+    lock = threading.Lock()
+
+    def buy():
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post("/api/inventory/1/purchase", headers={"Authorization": f"Bearer {tokens['alice']}"})
+        with lock:
+            results.append((response.status_code, time.perf_counter() - started, response.headers.get("Retry-After")))
+
+    clients = [threading.Thread(target=buy) for _ in range(20)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    served = [elapsed for status, elapsed, _ in results if status == 200]
+    shed = [(elapsed, retry) for status, elapsed, retry in results if status == 503]
+    assert len(served) + len(shed) == 20
+    assert 2 <= len(served) < 20 and shed
+    # Queued FIFO behind two slots the last request would take ~3s; nobody waits much past one unit of work
+    assert max(served) < work * 2.5
+    assert max(elapsed for elapsed, _ in shed) < work
+    assert {retry for _, retry in shed} == {"1"}
+    assert app.extensions["admission"].stats()["shed"] == {"purchase": len(shed)}
+
+def test_idempotent_purchase_is_replayed_without_touching_stock(client, user_token, admin_token):
+    headers = {"Authorization": f"Bearer {user_token}", "Idempotency-Key": "order-1"}
+    first = client.post("/api/inventory/1/purchase", json={"quantity": 2}, headers=headers)
+    retry = client.post("/api/inventory/1/purchase", json={"quantity": 2}, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.get_json() == first.get_json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+    # Same key with another body is a client bug, not a retry
+    assert client.post("/api/inventory/1/purchase", json={"quantity": 3}, headers=headers).status_code == 422
+    # Keys are scoped to the user
+    other = client.post("/api/inventory/1/purchase", json={"quantity": 2},
+                        headers={"Authorization": f"Bearer {admin_token}", "Idempotency-Key": "order-1"})
+    assert "Idempotent-Replayed" not in other.headers
+
+    with client.application.app_context():
+        assert db.session.get(Sweet, 1).quantity == 6
+        assert InventoryMovement.query.count() == 2
+
+def test_simultaneous_duplicate_checkouts_buy_once(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'idempotency.db'}",
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30}},
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(Sweet(name='Barfi', category='Indian', price=15.0, quantity=100))
+        db.session.commit()
+        token = create_access_token(identity="user", additional_claims={"is_admin": False})
+
+    results = []
+    lock = threading.Lock()
+    start = threading.Barrier(10)
+
+    def retry_storm():
+        client = app.test_client()
+        start.wait()
+        response = client.post("/api/inventory/checkout", json={"items": [{"id": 1, "quantity": 5}]},
+                               headers={"Authorization": f"Bearer {token}", "Idempotency-Key": "cart-42"})
+        with lock:
+            results.append((response.status_code, response.headers.get("Idempotent-Replayed")))
+
+    threads = [threading.Thread(target=retry_storm) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [status for status, _ in results] == [200] * 10
+    assert sum(1 for _, replayed in results if replayed is None) == 1
+    with app.app_context():
+        assert db.session.get(Sweet, 1).quantity == 95
+        db.drop_all()
+
+def test_persisted_idempotency_keys_are_shared_between_workers(tmp_path):
+    config = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'shared.db'}",
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30}},
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'IDEMPOTENCY_PERSIST': True,
+    }
+    workers = [create_app(config), create_app(config)]
+    with workers[0].app_context():
+        db.create_all()
+        db.session.add(Sweet(name='Barfi', category='Indian', price=15.0, quantity=100))
+        db.session.commit()
+        token = create_access_token(identity="user", additional_claims={"is_admin": False})
+
+    results = []
+    lock = threading.Lock()
+    start = threading.Barrier(6)
+
+    def retry(worker):
+        client = worker.test_client()
+        start.wait()
+        response = client.post("/api/inventory/1/purchase", json={"quantity": 3},
+                               headers={"Authorization": f"Bearer {token}", "Idempotency-Key": "tap-7"})
+        with lock:
+            results.append((response.status_code, response.get_json()))
+
+    threads = [threading.Thread(target=retry, args=(workers[n % 2],)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [(200, {"msg": "Purchased successfully"})] * 6
+    with workers[1].app_context():
+        assert db.session.get(Sweet, 1).quantity == 97
+        from app.idempotency import get_idempotency_store
+        assert get_idempotency_store().purge() == 0
+        db.drop_all()
+
+def test_stale_idempotency_claim_is_taken_over_only_after_claim_timeout(tmp_path):
+    from app.idempotency import IdempotencyStore, KeyInUse, StoredResponse, _row_key
+    from app.models import IdempotencyKey
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'claims.db'}",
+        'JWT_SECRET_KEY': 'test-secret-key',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    })
+    with app.app_context():
+        db.create_all()
+        slow = IdempotencyStore(wait=0.05, persist=True, claim_timeout=60)
+        other = IdempotencyStore(wait=0.05, persist=True, claim_timeout=60)
+        assert slow.begin("k", "f") is None
+
+        # Older than the wait but not the claim timeout: still the slow request's
+        row = db.session.get(IdempotencyKey, _row_key("k"))
+        row.created_at -= timedelta(seconds=30)
+        db.session.commit()
+        with pytest.raises(KeyInUse):
+            other.begin("k", "f")
+
+        row = db.session.get(IdempotencyKey, _row_key("k"))
+        row.created_at -= timedelta(seconds=60)
+        db.session.commit()
+        assert other.begin("k", "f") is None
+
+        # The original holder finishing late must not overwrite the new claim
+        assert not slow.finish("k", StoredResponse("f", 200, "late", "application/json"))
+        assert other.finish("k", StoredResponse("f", 200, "fresh", "application/json"))
+        db.session.expire_all()
+        assert db.session.get(IdempotencyKey, _row_key("k")).body == "fresh"
+        db.drop_all()
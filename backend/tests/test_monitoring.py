@@ -0,0 +1,103 @@
+import threading
+import time
+import pytest
+from app import create_app, db
+from app.metrics import Histogram
+from flask_jwt_extended import create_access_token
+
+
+@pytest.fixture
+def app_with_context(tmp_path):
+    config = {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'pool.db'}",
+        "SQLALCHEMY_ENGINE_OPTIONS": {"pool_size": 1, "max_overflow": 0, "pool_timeout": 5},
+        "JWT_SECRET_KEY": "test-secret",
+        "METRICS_TOKEN": "scrape-token",
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+    }
+    app = create_app(config)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app_with_context):
+    return app_with_context.test_client()
+
+
+@pytest.fixture
+def admin_headers(app_with_context):
+    token = create_access_token(identity="admin", additional_claims={"is_admin": True})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_pool_stats_track_checkouts_and_waits(client, app_with_context, admin_headers):
+    engine = db.engine
+    held = engine.connect()
+
+    def borrower():
+        with engine.connect():
+            pass
+
+    waiter = threading.Thread(target=borrower)
+    waiter.start()
+    time.sleep(0.05)
+    stats = client.get("/api/monitoring/pool", headers=admin_headers).get_json()["default"]
+    assert stats["size"] == 1
+    assert stats["checked_out"] == 1
+    held.close()
+    waiter.join()
+
+    stats = client.get("/api/monitoring/pool", headers=admin_headers).get_json()["default"]
+    assert stats["checked_out"] == 0
+    assert stats["checkouts"] >= 2
+    assert stats["wait_seconds"]["count"] == 1
+    assert stats["wait_seconds"]["sum"] >= 0.05
+    assert stats["checkout_seconds"]["count"] >= 2
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 4
+    assert list(snapshot["buckets"].values()) == [2, 3, 4]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+
+
+def test_server_timing_and_prometheus_metrics(client, app_with_context):
+    token = create_access_token(identity="admin", additional_claims={"is_admin": True})
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/api/sweets", json={"name": "Barfi", "category": "Indian", "price": 15, "quantity": 5},
+                headers=headers)
+
+    response = client.get("/api/sweets/search?category=Indian", headers=headers)
+    timing = response.headers["Server-Timing"]
+    assert 'desc="1 queries"' in timing
+    assert "total;dur=" in timing
+
+    body = client.get("/metrics", headers={"Authorization": "Bearer scrape-token"}).get_data(as_text=True)
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_duration_seconds_count{endpoint="/api/sweets/search",method="GET"} 1' in body
+    assert 'http_request_sql_statements_total{endpoint="/api/sweets/search",method="GET"} 1' in body
+    assert 'http_responses_total{endpoint="/api/sweets",method="POST",status="201"} 1' in body
+    assert 'db_pool_checked_out{engine="default"}' in body
+    assert "catalog_cache_misses_total 1" in body
+
+
+def test_monitoring_requires_admin_or_metrics_token(client, app_with_context, admin_headers):
+    user_token = create_access_token(identity="user", additional_claims={"is_admin": False})
+    for path in ("/metrics", "/api/monitoring/pool"):
+        assert client.get(path).status_code == 401
+        assert client.get(path, headers={"Authorization": "Bearer wrong"}).status_code in (401, 422)
+        assert client.get(path, headers={"Authorization": f"Bearer {user_token}"}).status_code == 403
+        assert client.get(path, headers=admin_headers).status_code == 200
+        assert client.get(path, headers={"Authorization": "Bearer scrape-token"}).status_code == 200
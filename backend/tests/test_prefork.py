@@ -0,0 +1,72 @@
+import json
+import os
+
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models import Sweet
+from benchmarks.bench_startup import over_budget
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_worker_starts_clean(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'prefork.db'}",
+        "JWT_SECRET_KEY": "test-secret-key-long-enough-for-hs256",
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "HOT_SWEET_IDS": [1],
+        "HOT_KEY_QUOTA": 10,
+        "LEDGER_FLUSH_INTERVAL": 60,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(Sweet(name="Ladoo", category="Indian", price=10, quantity=100))
+        db.session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(identity='user')}"}
+
+    client = app.test_client()
+    # The parent now holds hot-key quota, a buffered movement and a pooled connection
+    assert client.post("/api/inventory/1/purchase", headers=headers).status_code == 200
+    hot_keys, ledger = app.extensions["hot_keys"], app.extensions["ledger"]
+    broadcaster, catalog = app.extensions["stock_broadcaster"], app.extensions["catalog_cache"]
+    assert ledger.pending() == 1
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            with app.app_context():
+                pooled = db.engine.pool.checkedin()
+            report = {
+                "pooled": pooled,
+                "quota": sum(shard.remaining for shards in hot_keys._shards.values() for shard in shards),
+                "pending": ledger.pending(),
+                "writer": ledger._thread is not None,
+                "epochs": [broadcaster.epoch, catalog.backend.epoch],
+                "status": client.get("/api/sweets", headers=headers).status_code,
+            }
+            os.write(write_fd, json.dumps(report).encode())
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    child = json.loads(os.read(read_fd, 4096))
+
+    try:
+        assert child["pooled"] == 0
+        assert child["quota"] == 0
+        assert child["pending"] == 0 and not child["writer"]
+        assert broadcaster.epoch not in child["epochs"]
+        assert catalog.backend.epoch not in child["epochs"]
+        assert child["status"] == 200
+        # The parent's own state is untouched
+        assert sum(shard.remaining for shard in hot_keys._shards[1]) == 9
+        assert ledger.pending() == 1
+    finally:
+        ledger.stop()
+        hot_keys.stop()
+
+
+@pytest.mark.skipif(not os.getenv("STARTUP_BUDGET_TESTS"), reason="set STARTUP_BUDGET_TESTS=1 on a quiet runner")
+def test_startup_fits_its_budget():
+    assert over_budget(3) == {}
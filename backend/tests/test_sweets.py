@@ -1,7 +1,15 @@
+import json
+import threading
+import time
 import pytest
 from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
 from app import create_app, db
 from app.models import Sweet
+from app import cache as cache_module
+from app.cache import LRUCache
+from app.search_index import TrigramIndex
 
 
 @pytest.fixture
@@ -104,4 +112,514 @@ def test_delete_sweet(client, auth_headers):
     print(f"Delete response status: {delete_response.status_code}")
     print(f"Delete response data: {delete_response.get_json()}")
     assert delete_response.status_code == 200
-    assert delete_response.get_json()["message"] == "Sweet deleted successfully"
\ No newline at end of file
+    assert delete_response.get_json()["message"] == "Sweet deleted successfully"
+
+def test_get_sweets_keyset_pagination(client, auth_headers):
+    for i in range(5):
+        client.post("/api/sweets", json=get_sample_sweet(f"Sweet {i}"), headers=auth_headers)
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/api/sweets?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page["items"]) <= 2
+        seen.extend(s["name"] for s in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [f"Sweet {i}" for i in range(5)]
+
+
+def test_get_sweets_field_projection(client, auth_headers):
+    client.post("/api/sweets", json=get_sample_sweet("Barfi", 15), headers=auth_headers)
+
+    response = client.get("/api/sweets?limit=10&fields=name,price", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()["items"] == [{"id": 1, "name": "Barfi", "price": 15.0}]
+
+    response = client.get("/api/sweets?fields=secret", headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_get_sweets_ndjson_stream(client, auth_headers):
+    for name in ("Barfi", "Ladoo", "Peda"):
+        client.post("/api/sweets", json=get_sample_sweet(name), headers=auth_headers)
+
+    headers = dict(auth_headers, Accept="application/x-ndjson")
+    response = client.get("/api/sweets", headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [s["name"] for s in lines] == ["Barfi", "Ladoo", "Peda"]
+
+
+def test_search_sweets_ndjson_stream(client, auth_headers):
+    client.post("/api/sweets", json=get_sample_sweet("Kaju Katli", 25), headers=auth_headers)
+    client.post("/api/sweets", json=get_sample_sweet("Jalebi", 20), headers=auth_headers)
+
+    response = client.get("/api/sweets/search?search=Kaju&stream=1", headers=auth_headers)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["name"] == "Kaju Katli"
+
+
+def test_search_index_follows_writes(client, auth_headers):
+    client.post("/api/sweets", json=get_sample_sweet("Kaju Katli", 25), headers=auth_headers)
+    client.post("/api/sweets", json=get_sample_sweet("Motichoor Ladoo", 12), headers=auth_headers)
+
+    def names(query):
+        response = client.get(f"/api/sweets/search?search={query}", headers=auth_headers)
+        return [s["name"] for s in response.get_json()]
+
+    assert names("katl") == ["Kaju Katli"]
+    assert names("LADOO") == ["Motichoor Ladoo"]
+
+    client.put("/api/sweets/1", json={"name": "Kaju Roll"}, headers=auth_headers)
+    assert names("katl") == []
+    assert names("kaju") == ["Kaju Roll"]
+
+    client.delete("/api/sweets/2", headers=auth_headers)
+    assert names("ladoo") == []
+
+
+def test_search_index_rebuilds_without_blocking_searches():
+    index = TrigramIndex(refresh_seconds=0)
+    assert index.refresh(lambda: [(1, "kaju katli")])
+
+    started, release = threading.Event(), threading.Event()
+
+    def slow_loader():
+        started.set()
+        release.wait(5)
+        return [(1, "kaju katli"), (2, "kaju roll")]
+
+    # The stale index keeps answering while the rebuild runs in the background
+    assert index.search("kaju", slow_loader) == {1}
+    assert started.wait(5)
+    assert index.search("kaju", slow_loader) == {1}
+
+    # A write committed mid-rebuild survives the swap
+    index.add(3, "kaju pista")
+    index.remove(1)
+    release.set()
+    for _ in range(100):
+        if not index.refreshing:
+            break
+        time.sleep(0.01)
+    assert index.search("kaju", lambda: []) == {2, 3}
+
+
+def test_sweet_without_name_is_rejected_by_the_database(app_with_context):
+    with app_with_context.app_context():
+        db.session.add(Sweet(name=None, category="Indian", price=1, quantity=1))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+def test_search_short_query_falls_back_to_sql(client, auth_headers):
+    client.post("/api/sweets", json=get_sample_sweet("Kaju Katli", 25), headers=auth_headers)
+
+    response = client.get("/api/sweets/search?search=aj", headers=auth_headers)
+    assert [s["name"] for s in response.get_json()] == ["Kaju Katli"]
+
+
+def test_catalog_cache_hits_and_invalidation(client, auth_headers):
+    client.post("/api/sweets", json=get_sample_sweet("Barfi", 15), headers=auth_headers)
+
+    first = client.get("/api/sweets", headers=auth_headers)
+    second = client.get("/api/sweets", headers=auth_headers)
+    assert first.get_json() == second.get_json()
+
+    stats = client.get("/api/sweets/cache/stats", headers=auth_headers).get_json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+    # A write must be visible on the very next read
+    client.put("/api/sweets/1", json={"price": 18}, headers=auth_headers)
+    response = client.get("/api/sweets", headers=auth_headers)
+    assert response.get_json()[0]["price"] == 18
+
+    stats = client.get("/api/sweets/cache/stats", headers=auth_headers).get_json()
+    assert stats["misses"] == 2
+
+
+def test_catalog_cache_sees_purchases(client, auth_headers):
+    client.post("/api/sweets", json=get_sample_sweet("Barfi", 15, quantity=3), headers=auth_headers)
+    assert client.get("/api/sweets", headers=auth_headers).get_json()[0]["quantity"] == 3
+
+    client.post("/api/inventory/1/purchase", headers=auth_headers)
+    assert client.get("/api/sweets", headers=auth_headers).get_json()[0]["quantity"] == 2
+
+
+def test_every_write_bumps_sweet_version(client, auth_headers, app_with_context):
+    client.post("/api/sweets", json=get_sample_sweet("Barfi", 15, quantity=3), headers=auth_headers)
+
+    def version():
+        db.session.expire_all()
+        return db.session.get(Sweet, 1).version
+
+    assert version() == 1
+    client.put("/api/sweets/1", json={"price": 18}, headers=auth_headers)
+    assert version() == 2
+    client.post("/api/inventory/1/purchase", headers=auth_headers)
+    assert version() == 3
+    client.patch("/api/sweets/bulk", json={"ids": [1], "set": {"quantity": 9}}, headers=auth_headers)
+    assert version() == 4
+
+
+def test_listing_reuses_encoded_rows(client, auth_headers, app_with_context):
+    for name in ("Barfi", "Ladoo"):
+        client.post("/api/sweets", json=get_sample_sweet(name), headers=auth_headers)
+    fragments = app_with_context.extensions["sweet_fragments"]
+
+    first = client.get("/api/sweets", headers=auth_headers).get_json()
+    assert len(fragments) == 2
+    # A different page shape of the same rows hits the same fragments
+    page = client.get("/api/sweets?limit=1", headers=auth_headers).get_json()
+    assert len(fragments) == 2
+    assert page == {"items": first[:1], "next_cursor": 1}
+
+    client.put("/api/sweets/1", json={"price": 3}, headers=auth_headers)
+    assert client.get("/api/sweets", headers=auth_headers).get_json()[0]["price"] == 3
+    assert len(fragments) == 3
+
+
+def test_recreated_sweet_is_not_served_from_deleted_rows_fragments(client, auth_headers, app_with_context):
+    client.post("/api/sweets", json=get_sample_sweet("Old", category="A"), headers=auth_headers)
+    assert [s["name"] for s in client.get("/api/sweets", headers=auth_headers).get_json()] == ["Old"]
+    fragments = app_with_context.extensions["sweet_fragments"]
+    assert len(fragments) == 1
+
+    assert client.delete("/api/sweets/1", headers=auth_headers).status_code == 200
+    assert len(fragments) == 0
+    client.post("/api/sweets", json=get_sample_sweet("New", category="B"), headers=auth_headers)
+
+    listed = client.get("/api/sweets", headers=auth_headers).get_json()
+    assert [(s["name"], s["category"]) for s in listed] == [("New", "B")]
+    assert listed[0]["id"] != 1
+    found = client.get("/api/sweets/search?category=B", headers=auth_headers).get_json()
+    assert [s["name"] for s in found] == ["New"]
+
+
+def test_name_lower_follows_name_on_edit(client, auth_headers):
+    client.post("/api/sweets", json=get_sample_sweet("Barfi"), headers=auth_headers)
+
+    response = client.put("/api/sweets/1", json={"name_lower": "zzz"}, headers=auth_headers)
+    assert response.status_code == 400
+    assert client.put("/api/sweets/1", json={"name": "Kaju Katli"}, headers=auth_headers).status_code == 200
+
+    for query in ("katli", "KAJU"):
+        found = client.get(f"/api/sweets/search?search={query}", headers=auth_headers).get_json()
+        assert [s["name"] for s in found] == ["Kaju Katli"]
+    assert client.get("/api/sweets/search?search=barfi", headers=auth_headers).get_json() == []
+
+
+def test_lru_cache_evicts_and_expires():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    cache.set("short", "lived", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+
+    # Counters are never evicted by regular entries
+    cache.incr("version")
+    for i in range(5):
+        cache.set(f"k{i}", i)
+    assert cache.get("version") == 1
+
+
+def test_conditional_get_with_etag(client, auth_headers):
+    client.post("/api/sweets", json=get_sample_sweet("Barfi", 15), headers=auth_headers)
+
+    response = client.get("/api/sweets", headers=auth_headers)
+    etag = response.headers["ETag"]
+    assert etag
+
+    revalidate = dict(auth_headers, **{"If-None-Match": etag})
+    response = client.get("/api/sweets", headers=revalidate)
+    assert response.status_code == 304
+    assert response.data == b""
+
+    # Purchases and edits both move the catalog version on
+    client.post("/api/inventory/1/purchase", headers=auth_headers)
+    response = client.get("/api/sweets", headers=revalidate)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_etag_expires_with_ttl_unless_version_is_shared(client, auth_headers, app_with_context, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    client.post("/api/sweets", json=get_sample_sweet("Barfi", 15), headers=auth_headers)
+    etag = client.get("/api/sweets", headers=auth_headers).headers["ETag"]
+    revalidate = dict(auth_headers, **{"If-None-Match": etag})
+    assert client.get("/api/sweets", headers=revalidate).status_code == 304
+
+    # Another worker may have written meanwhile, so a per-process version can't vouch past the TTL
+    now[0] += 31
+    response = client.get("/api/sweets", headers=revalidate)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    app_with_context.extensions["catalog_cache"].backend.shared = True
+    etag = client.get("/api/sweets", headers=auth_headers).headers["ETag"]
+    now[0] += 31
+    assert client.get("/api/sweets", headers=dict(auth_headers, **{"If-None-Match": etag})).status_code == 304
+
+
+def test_conditional_get_skips_database(client, auth_headers, app_with_context):
+    client.post("/api/sweets", json=get_sample_sweet("Barfi", 15), headers=auth_headers)
+    etag = client.get("/api/sweets/search?category=Indian", headers=auth_headers).headers["ETag"]
+
+    statements = []
+    with app_with_context.app_context():
+        engine = db.engine
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.get(
+            "/api/sweets/search?category=Indian",
+            headers=dict(auth_headers, **{"If-None-Match": etag}),
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 304
+    assert statements == []
+
+
+def test_bulk_import_csv(client, auth_headers):
+    body = (
+        "name,category,price,quantity\n"
+        "Barfi,Indian,15,10\n"
+        "Ladoo,Indian,not-a-price,5\n"
+        "Peda,Indian,12.5,8\n"
+    )
+    response = client.post(
+        "/api/sweets/bulk?batch_size=1",
+        data=body,
+        content_type="text/csv",
+        headers=auth_headers,
+    )
+    assert response.status_code == 201
+    report = response.get_json()
+    assert report["inserted"] == 2
+    assert report["failed"] == 1
+    assert report["errors"][0]["line"] == 3
+
+    names = [s["name"] for s in client.get("/api/sweets", headers=auth_headers).get_json()]
+    assert names == ["Barfi", "Peda"]
+    # Imported rows are searchable straight away
+    response = client.get("/api/sweets/search?search=ped", headers=auth_headers)
+    assert [s["name"] for s in response.get_json()] == ["Peda"]
+
+
+def test_bulk_import_reports_rows_the_table_would_reject(client, auth_headers):
+    body = (
+        "name,category,price,quantity\n"
+        + "Barfi,Indian,15,10\n"
+        + "x" * 121 + ",Indian,15,10\n"
+        + "Peda,Indian,nan,8\n"
+    ).encode() + b"Ladoo,Ind\xffian,5,5\nJalebi,Indian,3,7\n"
+    response = client.post(
+        "/api/sweets/bulk", data=body, content_type="text/csv", headers=auth_headers
+    )
+    assert response.status_code == 201
+    report = response.get_json()
+    assert report["inserted"] == 2
+    assert [error["line"] for error in report["errors"]] == [3, 4, 5]
+    assert "not valid UTF-8" in report["errors"][2]["error"]
+
+
+def test_bulk_import_ndjson(client, auth_headers):
+    body = "\n".join(json.dumps(get_sample_sweet(f"Sweet {i}")) for i in range(5)) + "\n{oops\n"
+    response = client.post(
+        "/api/sweets/bulk",
+        data=body,
+        content_type="application/x-ndjson",
+        headers=auth_headers,
+    )
+    assert response.status_code == 201
+    assert response.get_json()["inserted"] == 5
+    assert response.get_json()["errors"][0]["line"] == 6
+
+
+def test_bulk_import_cli(app_with_context, tmp_path):
+    source = tmp_path / "sweets.csv"
+    source.write_text("name,category,price,quantity\nBarfi,Indian,15,10\nLadoo,Indian,8,4\n")
+
+    result = app_with_context.test_cli_runner().invoke(args=["import-sweets", str(source)])
+    assert result.exit_code == 0
+    assert "Inserted 2 sweets" in result.output
+    assert Sweet.query.count() == 2
+
+
+def test_bulk_update_by_filter(client, auth_headers):
+    client.post("/api/sweets", json=get_sample_sweet("Cheesecake", 10, category="Cake"), headers=auth_headers)
+    client.post("/api/sweets", json=get_sample_sweet("Cupcake", 20, category="Cake"), headers=auth_headers)
+    client.post("/api/sweets", json=get_sample_sweet("Barfi", 15), headers=auth_headers)
+
+    response = client.patch(
+        "/api/sweets/bulk",
+        json={"filter": {"category": "Cake"}, "multiply": {"price": 1.1}},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert response.get_json()["updated"] == 2
+
+    prices = {s["name"]: s["price"] for s in client.get("/api/sweets", headers=auth_headers).get_json()}
+    assert prices == {"Cheesecake": pytest.approx(11.0), "Cupcake": pytest.approx(22.0), "Barfi": 15}
+
+
+def test_bulk_update_by_ids(client, auth_headers):
+    for name in ("Barfi", "Ladoo", "Peda"):
+        client.post("/api/sweets", json=get_sample_sweet(name), headers=auth_headers)
+
+    response = client.patch(
+        "/api/sweets/bulk",
+        json={"ids": [1, 3], "set": {"quantity": 0, "name": "Sold Out"}},
+        headers=auth_headers,
+    )
+    assert response.get_json()["updated"] == 2
+    response = client.get("/api/sweets/search?search=sold", headers=auth_headers)
+    assert [s["id"] for s in response.get_json()] == [1, 3]
+
+
+def test_bulk_update_requires_selection(client, auth_headers):
+    response = client.patch("/api/sweets/bulk", json={"set": {"price": 1}}, headers=auth_headers)
+    assert response.status_code == 400
+
+    response = client.patch(
+        "/api/sweets/bulk", json={"ids": [1], "set": {"id": 5}}, headers=auth_headers
+    )
+    assert response.status_code == 400
+
+    # A filter whose every value is empty selects nothing rather than everything
+    response = client.patch(
+        "/api/sweets/bulk",
+        json={"filter": {"name": "", "category": None}, "set": {"price": 1}},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "Provide ids or a filter"
+
+    for body in ({"ids": [1], "set": [["price", 1]]}, {"ids": [1], "multiply": 2},
+                 {"filter": {"price_min": [1]}, "set": {"price": 1}},
+                 {"ids": [1], "set": {"price": "nan"}}, {"ids": [1], "set": {"quantity": -1}},
+                 {"ids": [1], "set": {"name": " "}}, {"ids": [1], "set": {"name": "x" * 121}},
+                 {"ids": [1], "multiply": {"price": -3}}, {"ids": [1], "multiply": {"price": "inf"}}):
+        response = client.patch("/api/sweets/bulk", json=body, headers=auth_headers)
+        assert response.status_code == 400
+
+
+def test_bulk_delete(client, auth_headers):
+    for name in ("Barfi", "Ladoo", "Peda"):
+        client.post("/api/sweets", json=get_sample_sweet(name), headers=auth_headers)
+
+    response = client.delete("/api/sweets/bulk", json={"ids": [1, 2]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()["deleted"] == 2
+    assert [s["name"] for s in client.get("/api/sweets", headers=auth_headers).get_json()] == ["Peda"]
+
+
+def replica_app(tmp_path, **config):
+    """An app whose primary and two replicas are separate SQLite files, each holding one differently named sweet."""
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'primary.db'}",
+        "DATABASE_REPLICA_URLS": [f"sqlite:///{tmp_path / 'replica0.db'}", f"sqlite:///{tmp_path / 'replica1.db'}"],
+        "JWT_SECRET_KEY": "test-secret",
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        **config,
+    })
+    with app.app_context():
+        # Stand-ins for replication: each copy gets its own row, with distinct
+        # ids so encoded rows cached by (id, version) are not shared
+        for id, bind, name in ((1, None, "Primary"), (2, "replica_0", "Replica 0"), (3, "replica_1", "Replica 1")):
+            engine = db.engines[bind]
+            db.metadata.create_all(engine)
+            with engine.begin() as conn:
+                conn.execute(Sweet.__table__.insert().values(
+                    id=id, name=name, name_lower=name.lower(), category="Indian", price=10, quantity=5, version=1
+                ))
+        headers = {
+            user: {"Authorization": f"Bearer {create_access_token(identity=user)}"}
+            for user in ("alice", "bob")
+        }
+    return app, headers
+
+
+def listed_names(client, headers, path="/api/sweets"):
+    return [s["name"] for s in client.get(path, headers=headers).get_json()]
+
+
+def test_catalog_reads_rotate_across_replicas(tmp_path):
+    app, headers = replica_app(tmp_path, CATALOG_CACHE_ENABLED=False)
+    client = app.test_client()
+
+    assert [listed_names(client, headers["alice"]) for _ in range(3)] == [
+        ["Replica 0"], ["Replica 1"], ["Replica 0"],
+    ]
+    assert listed_names(client, headers["bob"], "/api/sweets/search?category=Indian") == ["Replica 1"]
+
+
+def test_replica_reads_see_own_writes(tmp_path):
+    app, headers = replica_app(tmp_path, REPLICA_STICKY_SECONDS=0.3)
+    client = app.test_client()
+
+    response = client.post("/api/inventory/1/purchase", headers=headers["alice"])
+    assert response.status_code == 200
+
+    # A lagging replica's body may land in the cache, but alice skips it
+    assert listed_names(client, headers["bob"]) == ["Replica 0"]
+    assert listed_names(client, headers["alice"]) == ["Primary"]
+    assert listed_names(client, headers["bob"]) == ["Replica 0"]
+
+    time.sleep(0.4)
+    assert listed_names(client, headers["alice"]) == ["Replica 0"]
+
+
+def test_replica_bodies_are_tagged_by_content(tmp_path):
+    app, headers = replica_app(tmp_path, CATALOG_CACHE_ENABLED=False)
+    client = app.test_client()
+
+    first = client.get("/api/sweets", headers=headers["alice"])
+    assert first.get_json()[0]["name"] == "Replica 0"
+    # The same version read from the other replica has a different body, so a different tag
+    conditional = {**headers["alice"], "If-None-Match": first.headers["ETag"]}
+    second = client.get("/api/sweets", headers=conditional)
+    assert second.status_code == 200
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+    assert client.get("/api/sweets", headers=conditional).status_code == 304
+
+
+def test_ndjson_streams_read_from_the_primary(tmp_path):
+    app, headers = replica_app(tmp_path, CATALOG_CACHE_ENABLED=False)
+    client = app.test_client()
+
+    for path in ("/api/sweets?stream=1", "/api/sweets/search?category=Indian&stream=1"):
+        lines = client.get(path, headers=headers["alice"]).get_data(as_text=True).splitlines()
+        assert [json.loads(line)["name"] for line in lines] == ["Primary"]
+
+
+def test_failed_replica_falls_back_to_primary(tmp_path):
+    app, headers = replica_app(tmp_path, CATALOG_CACHE_ENABLED=False)
+    with app.app_context():
+        db.metadata.drop_all(db.engines["replica_0"])
+
+    client = app.test_client()
+    assert listed_names(client, headers["alice"]) == ["Primary"]
+    assert listed_names(client, headers["alice"]) == ["Replica 1"]
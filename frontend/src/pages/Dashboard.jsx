@@ -1,4 +1,4 @@
-import React, { useState } from 'react'
+import React, { useEffect, useState } from 'react'
 import { useQuery, useMutation, useQueryClient } from 'react-query'
 import { useAuth } from '../contexts/AuthContext'
 import { sweetsAPI, inventoryAPI } from '../services/api'
@@ -38,8 +38,65 @@ const Dashboard = () => {
     refetch,
   } = useQuery('sweets', sweetsAPI.getAllSweets, {
     retry: 1,
+    // Mostly kept current by the stock stream below. The stream only sees
+    // its own worker's writes, so still refetch now and then
+    staleTime: 30000,
   })
 
+  // Apply pushed stock/price changes to the cached list
+  useEffect(() => {
+    let stream
+    let retry
+    let closed = false
+    const reload = () => queryClient.invalidateQueries('sweets')
+    const applyChanges = (event) => {
+      const { sweets: changed, deleted } = JSON.parse(event.data)
+      const updates = new Map(changed.map(sweet => [sweet.id, sweet]))
+      queryClient.setQueryData('sweets', (current = []) => {
+        const next = current
+          .filter(sweet => !deleted.includes(sweet.id))
+          .map(sweet => {
+            const update = updates.get(sweet.id)
+            updates.delete(sweet.id)
+            return update ? { ...sweet, ...update } : sweet
+          })
+        return [...next, ...updates.values()]
+      })
+      queryClient.invalidateQueries(['sweets', 'search'])
+    }
+
+    const open = async () => {
+      try {
+        stream = await inventoryAPI.openStockStream()
+      } catch {
+        retry = setTimeout(open, 5000)
+        return
+      }
+      if (closed) {
+        stream.close()
+        return
+      }
+      // Sent on a fresh connection, or when missed changes cannot be replayed
+      stream.addEventListener('ready', reload)
+      stream.addEventListener('reset', reload)
+      stream.addEventListener('sweets', applyChanges)
+      // The browser reconnects by itself with the same URL, which is refused
+      // once the stream token has expired; then fetch a new one and reopen
+      stream.onerror = () => {
+        if (stream.readyState === EventSource.CLOSED) {
+          retry = setTimeout(open, 1000)
+        }
+      }
+    }
+
+    open()
+    return () => {
+      closed = true
+      clearTimeout(retry)
+      stream?.close()
+    }
+  }, [queryClient])
+
   // Search sweets with filters
   const {
     data: searchResults,
@@ -58,6 +115,7 @@ const Dashboard = () => {
     (sweetId) => inventoryAPI.purchaseSweet(sweetId),
     {
       onSuccess: () => {
+        // The stream only carries writes made on the worker it is connected to
         queryClient.invalidateQueries('sweets')
         toast.success('Sweet purchased successfully!')
       },
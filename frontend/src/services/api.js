@@ -86,6 +86,13 @@ export const inventoryAPI = {
     const response = await api.post(`/inventory/${id}/restock`)
     return response.data
   },
+
+  // Server-sent stock updates. EventSource cannot set headers, so the URL
+  // carries a short-lived stream token rather than the access token
+  openStockStream: async () => {
+    const response = await api.post('/inventory/stream-token')
+    return new EventSource(`/api/inventory/stream?jwt=${encodeURIComponent(response.data.stream_token)}`)
+  },
 }
 
 export default api 
\ No newline at end of file